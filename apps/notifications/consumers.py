@@ -1,13 +1,37 @@
 import json
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db.models import Q
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from rest_framework.exceptions import NotFound
 from knox.models import AuthToken
 from apps.users.models import CustomUser
+from .pagination import NotificationCursorPagination
+from .services import UnreadCounter
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Notifications temps réel de l'utilisateur.
+    
+    Paramètres de connexion :
+        token         token Knox
+        last_seen_id  id de la dernière notification reçue (resynchronisation)
+        since         ou curseur `since` de /api/notifications/
+    
+    Avec last_seen_id ou since, seule la différence est envoyée, en une trame
+    'delta' accompagnée du curseur `since` à rappeler (celui reçu si rien n'a
+    été manqué) ; au-delà de NOTIFICATIONS_RESYNC['MAX_DELTA'] notifications
+    manquées, une trame 'summary' invite le client à recharger sa boîte par
+    l'API paginée. Sans l'un ni l'autre, 'unread_list' donne les dernières non lues.
+    """
+    
     async def connect(self):
+        params = parse_qs(self.scope['query_string'].decode())
+        
         # Authentification via token Knox
-        self.user = await self.get_user_from_token()
+        self.user = await self.get_user_from_token(self._param(params, 'token'))
         
         if not self.user:
             await self.close(code=4001)
@@ -24,8 +48,12 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Envoyer les notifications non lues
-        await self.send_unread_notifications()
+        # Envoyer ce qui a été manqué depuis la dernière connexion
+        payload = await self.get_resync_payload(
+            self._param(params, 'last_seen_id'),
+            self._param(params, 'since')
+        )
+        await self.send(text_data=json.dumps(payload, separators=(',', ':')))
     
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
@@ -49,9 +77,13 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     async def send_notification(self, event):
         await self.send(text_data=json.dumps(event['notification']))
     
+    @staticmethod
+    def _param(params, name):
+        values = params.get(name)
+        return values[0] if values else None
+    
     @database_sync_to_async
-    def get_user_from_token(self):
-        token = self.scope['query_string'].decode().split('token=')[-1]
+    def get_user_from_token(self, token):
         if not token:
             return None
         
@@ -64,17 +96,62 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             return None
     
     @database_sync_to_async
-    def send_unread_notifications(self):
+    def get_resync_payload(self, last_seen_id=None, since=None):
         from .serializers import NotificationSerializer
         
-        notifications = self.user.notifications.filter(is_read=False)[:20]
-        serialized = NotificationSerializer(notifications, many=True).data
+        notifications = self.user.notifications.all()
+        max_delta = getattr(settings, 'NOTIFICATIONS_RESYNC', {}).get('MAX_DELTA', 50)
         
-        return self.send(text_data=json.dumps({
-            'type': 'unread_list',
-            'notifications': serialized,
-            'count': self.user.notifications.filter(is_read=False).count()
-        }))
+        # Une position illisible est ignorée sans écarter l'autre
+        cursor = since
+        try:
+            last_seen_id = int(last_seen_id) if last_seen_id else None
+        except ValueError:
+            last_seen_id = None
+        try:
+            since = NotificationCursorPagination().decode_cursor(since)
+        except NotFound:
+            cursor, since = None, None
+        
+        if since is not None:
+            created_at, pk = since
+            missed = notifications.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')
+        elif last_seen_id is not None:
+            missed = notifications.filter(id__gt=last_seen_id).order_by('id')
+        else:
+            unread = notifications.filter(is_read=False)[:20]
+            return {
+                'type': 'unread_list',
+                'notifications': NotificationSerializer(unread, many=True).data,
+                'count': UnreadCounter.get(self.user.id)
+            }
+        
+        # Une notification de plus que la limite suffit à savoir si l'écart la dépasse
+        missed = list(missed[:max_delta + 1])
+        if len(missed) > max_delta:
+            latest = notifications.order_by('-created_at', '-id').first()
+            return {
+                'type': 'summary',
+                'count': UnreadCounter.get(self.user.id),
+                'latest': NotificationSerializer(latest).data,
+                'since': NotificationCursorPagination.encode_cursor(latest)
+            }
+        
+        missed.reverse()
+        if missed:
+            cursor = NotificationCursorPagination.encode_cursor(missed[0])
+        elif since is None:
+            # Rien de manqué : curseur de la position last_seen_id, pour la prochaine reconnexion
+            seen = notifications.filter(id__lte=last_seen_id).order_by('-id').first()
+            cursor = NotificationCursorPagination.encode_cursor(seen) if seen else None
+        return {
+            'type': 'delta',
+            'notifications': NotificationSerializer(missed, many=True).data,
+            'count': UnreadCounter.get(self.user.id),
+            'since': cursor
+        }
     
     @database_sync_to_async
     def mark_notification_read(self, notif_id):
@@ -87,8 +164,11 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     
     @database_sync_to_async
     def mark_all_read(self):
+        from django.db import transaction
         from django.utils import timezone
-        self.user.notifications.filter(is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
\ No newline at end of file
+        with transaction.atomic():
+            count = self.user.notifications.filter(is_read=False).update(
+                is_read=True,
+                read_at=timezone.now()
+            )
+            UnreadCounter.decrement(self.user.id, count)
\ No newline at end of file
@@ -0,0 +1,214 @@
+# ==================== apps/notifications/dispatch.py ====================
+"""
+Envoi des notifications aux WebSockets, via le channel layer.
+
+Une notification n'est poussée qu'après le commit de la transaction qui l'a
+créée (transaction.on_commit) : une écriture annulée n'atteint jamais les
+sockets. Pendant une requête HTTP (NotificationDispatchMiddleware), les
+notifications commitées sont regroupées et envoyées en un seul lot à la fin
+de la requête ; hors requête, chaque commit forme son propre lot.
+
+Les lots partent vers le groupe notifications_<id> de chaque destinataire
+depuis un thread dédié qui fait tourner une boucle asyncio : les
+group_send d'un lot sont lancés ensemble (asyncio.gather) par paquets de
+NOTIFICATIONS_DISPATCH['BATCH_SIZE'], et le thread de la requête n'attend
+pas Redis. Avec NOTIFICATIONS_DISPATCH['ASYNC'] = False, l'envoi se fait
+dans le thread appelant (tests, scripts).
+"""
+import asyncio
+import atexit
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Notifications commitées pendant la requête en cours, None hors requête
+_request_batch = contextvars.ContextVar('notifications_request_batch', default=None)
+
+
+def _config():
+    return getattr(settings, 'NOTIFICATIONS_DISPATCH', {})
+
+
+def group_name(user_id):
+    return f'notifications_{user_id}'
+
+
+def build_events(notifications):
+    """
+    Returns:
+        list: (groupe, événement send_notification) pour chaque notification
+    """
+    from .serializers import NotificationSerializer
+
+    serialized = NotificationSerializer(notifications, many=True).data
+    return [
+        (
+            group_name(notification.recipient_id),
+            {
+                'type': 'send_notification',
+                'notification': {'type': 'new_notification', 'data': data},
+            },
+        )
+        for notification, data in zip(notifications, serialized)
+    ]
+
+
+async def send_events(events, batch_size=None):
+    """
+    Envoie les événements par paquets concurrents.
+
+    Returns:
+        tuple: (envoyés, échecs)
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return 0, len(events)
+
+    batch_size = batch_size or _config().get('BATCH_SIZE', 500)
+    sent, failed = 0, 0
+    for start in range(0, len(events), batch_size):
+        batch = events[start:start + batch_size]
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, event) for group, event in batch),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                failed += 1
+                logger.warning(f"Échec envoi WebSocket : {result}")
+            else:
+                sent += 1
+    return sent, failed
+
+
+class AsyncDispatcher:
+    """Boucle asyncio dans un thread démon, démarrée au premier envoi du processus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._pending = set()
+
+    def _ensure_started(self):
+        with self._lock:
+            # Après un fork (workers gunicorn/daphne), le thread du parent n'existe plus
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            self._loop = asyncio.new_event_loop()
+            self._pid = os.getpid()
+            self._pending = set()
+            threading.Thread(
+                target=self._loop.run_forever, name='notifications-dispatch', daemon=True
+            ).start()
+            return self._loop
+
+    def submit(self, events, batch_size=None):
+        """
+        Programme l'envoi sans attendre.
+
+        Returns:
+            concurrent.futures.Future: (envoyés, échecs)
+        """
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(send_events(events, batch_size), loop)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            logger.warning(f"Channel layer indisponible, lot non poussé : {future.exception()}")
+
+    def drain(self, timeout=5):
+        """Attend les envois en cours (arrêt du processus)"""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+
+dispatcher = AsyncDispatcher()
+atexit.register(dispatcher.drain)
+
+
+def push(notifications, batch_size=None):
+    """
+    Pousse immédiatement, dans le thread appelant, des notifications enregistrées.
+
+    Les notifications restent en base même si le channel layer est
+    indisponible : l'envoi temps réel est au mieux.
+
+    Returns:
+        tuple: (envoyés, échecs)
+    """
+    notifications = [notification for notification in notifications if notification.pk is not None]
+    if not notifications:
+        return 0, 0
+    try:
+        return async_to_sync(send_events)(build_events(notifications), batch_size)
+    except Exception as exc:
+        logger.warning(f"Channel layer indisponible, {len(notifications)} notification(s) non poussée(s) : {exc}")
+        return 0, len(notifications)
+
+
+def dispatch(notifications):
+    """Envoie un lot de notifications commitées, dans le thread d'envoi si ASYNC"""
+    if not notifications:
+        return
+    if not _config().get('ASYNC', True):
+        push(notifications)
+        return
+    try:
+        dispatcher.submit(build_events(notifications))
+    except Exception as exc:
+        logger.warning(f"Envoi WebSocket impossible, {len(notifications)} notification(s) non poussée(s) : {exc}")
+
+
+def _enqueue(notifications):
+    batch = _request_batch.get()
+    if batch is not None:
+        batch.extend(notifications)
+    else:
+        dispatch(notifications)
+
+
+def schedule(notifications):
+    """
+    Pousse les notifications après le commit de la transaction en cours
+    (immédiatement hors transaction), jamais si elle est annulée.
+    """
+    notifications = [notification for notification in notifications if notification.pk is not None]
+    if notifications:
+        transaction.on_commit(lambda: _enqueue(notifications))
+
+
+@contextmanager
+def request_batch():
+    """Regroupe les notifications commitées dans le bloc en un seul envoi, à la sortie"""
+    if _request_batch.get() is not None:
+        yield
+        return
+
+    batch = []
+    token = _request_batch.set(batch)
+    try:
+        yield
+    finally:
+        _request_batch.reset(token)
+        dispatch(batch)
@@ -1,5 +1,5 @@
 # apps/notifications/docs/notifications_swagger.py
-from drf_spectacular.utils import extend_schema, OpenApiExample
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
 from rest_framework import status
 
 CONTENT_TYPE_JSON = 'application/json'
@@ -9,16 +9,27 @@ TAG_NOTIFICATIONS = 'Notifications'
 NOTIFICATIONS_LIST_SCHEMA = extend_schema(
     operation_id="list_notifications",
     summary="Liste des notifications",
-    description="Récupère toutes les notifications de l'utilisateur connecté (paginé)",
+    description=(
+        "Notifications de l'utilisateur connecté, des plus récentes aux plus anciennes, "
+        "paginées par curseur. `next` (paramètre `before`) mène aux plus anciennes ; "
+        "`since` renvoie uniquement les notifications arrivées après la plus récente de la page "
+        "(`has_more_recent` : d'autres nouveautés restent à lire avec le `since` obtenu). "
+        "`page_size` : 20 par défaut, 100 au plus."
+    ),
+    parameters=[
+        OpenApiParameter('before', str, description='Curseur : notifications plus anciennes'),
+        OpenApiParameter('since', str, description='Curseur : notifications plus récentes'),
+        OpenApiParameter('page_size', int, description='Taille de page (max 100)'),
+    ],
     responses={
         200: {
             'description': 'Liste des notifications',
             'content': {
                 CONTENT_TYPE_JSON: {
                     'example': {
-                        'count': 42,
-                        'next': 'http://api/notifications/?page=2',
-                        'previous': None,
+                        'next': 'http://api/notifications/?before=WyIyMDI1LTAxLTE1VDEwOjMwOjAwKzAwOjAwIiwgMV0',
+                        'since': 'http://api/notifications/?since=WyIyMDI1LTAxLTE1VDEwOjQ1OjAwKzAwOjAwIiwgMl0',
+                        'has_more_recent': False,
                         'results': [
                             {
                                 'id': 1,
@@ -86,6 +97,25 @@ UNREAD_NOTIFICATIONS_SCHEMA = extend_schema(
     tags=[TAG_NOTIFICATIONS]
 )
 
+# ==================== UNREAD COUNT ====================
+UNREAD_COUNT_SCHEMA = extend_schema(
+    operation_id="unread_notifications_count",
+    summary="Nombre de notifications non lues",
+    description="Badge : compteur tenu à jour à chaque écriture, lu sans COUNT(*)",
+    responses={
+        200: {
+            'description': 'Nombre de non lues',
+            'content': {
+                CONTENT_TYPE_JSON: {
+                    'example': {'count': 5}
+                }
+            }
+        },
+        401: {'description': 'Non authentifié'}
+    },
+    tags=[TAG_NOTIFICATIONS]
+)
+
 # ==================== MARK AS READ ====================
 MARK_READ_SCHEMA = extend_schema(
     operation_id="mark_notification_read",
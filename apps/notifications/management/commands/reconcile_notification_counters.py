@@ -0,0 +1,20 @@
+# apps/notifications/management/commands/reconcile_notification_counters.py
+from django.core.management.base import BaseCommand
+from apps.notifications.services import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Recompte les notifications non lues et corrige les compteurs (NotificationCounter) divergents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Utilisateurs par lot (défaut: 1000)')
+
+    def handle(self, *args, **options):
+        stats = UnreadCounter.reconcile(chunk_size=options['chunk_size'])
+        self.stdout.write(f"{stats['users']} utilisateurs vérifiés")
+        if stats['corriges']:
+            self.stdout.write(self.style.WARNING(
+                f"{stats['corriges']} compteurs corrigés (écart cumulé : {stats['ecart']})"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("Aucune dérive"))
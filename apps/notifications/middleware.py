@@ -0,0 +1,16 @@
+# ==================== apps/notifications/middleware.py ====================
+from .dispatch import request_batch
+
+
+class NotificationDispatchMiddleware:
+    """
+    Les notifications commitées pendant la requête sont poussées aux
+    WebSockets en un seul lot, après la réponse de la vue.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with request_batch():
+            return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('new_order', '📋 Nouvelle commande'), ('payment_received', '💰 Paiement reçu'), ('order_confirmed', '✅ Commande confirmée'), ('product_shipped', '📦 Produit expédié'), ('delivery_completed', '✅ Livraison effectuée'), ('new_review', '⭐ Nouvelle évaluation'), ('transport_request', '🚚 Demande de transport'), ('transport_confirmed', '✅ Transport confirmé'), ('transport_started', '📍 Transport démarré'), ('transport_arrived', '🎯 Transport arrivé'), ('transformation_request', '🏭 Demande transformation'), ('transformation_completed', '✅ Transformation terminée'), ('products_ready', '📦 Produits prêts'), ('stock_updated', '📦 Stock mis à jour'), ('bulk_order', '💼 Commande en gros'), ('new_message', '💬 Nouveau message'), ('new_device', '🔒 Nouvelle connexion'), ('password_changed', '🔑 Mot de passe modifié'), ('profile_incomplete', '⚠️ Profil incomplet'), ('delivery_delayed', '⚠️ Retard livraison'), ('order_cancelled', '❌ Commande annulée'), ('refund_requested', '💰 Remboursement demandé'), ('production_alert', '🔔 Production correspondant à une recherche')], db_index=True, max_length=30),
+        ),
+    ]
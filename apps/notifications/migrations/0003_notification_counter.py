@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remplir_compteurs(apps, schema_editor):
+    """Compteurs initiaux depuis les notifications non lues existantes"""
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationCounter = apps.get_model('notifications', 'NotificationCounter')
+    comptes = (
+        Notification.objects.filter(is_read=False)
+        .values('recipient_id').annotate(unread=Count('id')).order_by()
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=ligne['recipient_id'], unread=ligne['unread']) for ligne in comptes],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_production_alert'),
+        ('users', '0004_producteur_evaluations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
@@ -42,6 +42,7 @@ class Notification(models.Model):
         ('delivery_delayed', '⚠️ Retard livraison'),
         ('order_cancelled', '❌ Commande annulée'),
         ('refund_requested', '💰 Remboursement demandé'),
+        ('production_alert', '🔔 Production correspondant à une recherche'),
     ]
     
     recipient = models.ForeignKey(
@@ -70,6 +71,8 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['recipient', '-created_at']),
             models.Index(fields=['recipient', 'is_read', '-created_at']),
+            # Resynchronisation WebSocket par last_seen_id
+            models.Index(fields=['recipient', 'id']),
         ]
     
     def __str__(self):
@@ -81,4 +84,24 @@ class Notification(models.Model):
             self.is_read = True
             from django.utils import timezone
             self.read_at = timezone.now()
-            self.save(update_fields=['is_read', 'read_at'])
\ No newline at end of file
+            # UPDATE conditionnel : deux lectures concurrentes ne décomptent qu'une fois
+            marked = Notification.objects.filter(pk=self.pk, is_read=False).update(
+                is_read=True, read_at=self.read_at
+            )
+            if marked:
+                from .services import UnreadCounter
+                UnreadCounter.decrement(self.recipient_id, marked)
+
+
+class NotificationCounter(models.Model):
+    """Nombre de notifications non lues par utilisateur (badge), tenu à jour par UnreadCounter"""
+    user = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter'
+    )
+    unread = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.unread} non lue(s)"
@@ -0,0 +1,135 @@
+# ==================== apps/notifications/pagination.py ====================
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class NotificationCursorPagination(BasePagination):
+    """
+    Pagination par clé (keyset) sur (created_at, id), du plus récent au plus ancien.
+
+    Chaque page est une lecture bornée de l'index (recipient, -created_at),
+    sans COUNT(*) ni OFFSET, quelle que soit la taille de la boîte :
+        ?before=<curseur>  notifications plus anciennes que le curseur (page suivante)
+        ?since=<curseur>   notifications plus récentes que le curseur (nouveautés)
+
+    `next` mène aux plus anciennes, `since` aux nouveautés à venir : un client
+    le conserve et le rappelle pour ne recevoir que les nouvelles notifications.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    before_query_param = 'before'
+    since_query_param = 'since'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        self.since = self.decode_cursor(request.query_params.get(self.since_query_param))
+
+        if self.since is not None:
+            # Les plus anciennes nouveautés d'abord : les suivantes restent atteignables par `since`
+            created_at, pk = self.since
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            if before is not None:
+                queryset = queryset.filter(self._older_than(*before))
+            page = list(queryset.order_by('created_at', 'id')[:page_size + 1])
+            self.has_more_recent = len(page) > page_size
+            page = page[:page_size][::-1]
+        else:
+            if before is not None:
+                queryset = queryset.filter(self._older_than(*before))
+            page = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+            self.has_more_recent = False
+            self.has_older = len(page) > page_size
+            page = page[:page_size]
+
+        self.page = page
+        return page
+
+    @staticmethod
+    def _older_than(created_at, pk):
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # ==================== CURSEUR ====================
+
+    @staticmethod
+    def encode_cursor(notification):
+        contenu = json.dumps([notification.created_at.isoformat(), notification.pk])
+        # Sans remplissage '=' : le curseur reste sûr dans une URL
+        return base64.urlsafe_b64encode(contenu.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, encoded):
+        """
+        Returns:
+            tuple: (created_at, id) ou None si absent
+        """
+        if not encoded:
+            return None
+        try:
+            created_at, pk = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def _link(self, param, notification):
+        url = self.request.build_absolute_uri()
+        for other in (self.before_query_param, self.since_query_param):
+            if other != param:
+                url = remove_query_param(url, other)
+        return replace_query_param(url, param, self.encode_cursor(notification))
+
+    def get_next_link(self):
+        """Notifications plus anciennes que la page"""
+        if self.since is not None or not self.has_older:
+            return None
+        return self._link(self.before_query_param, self.page[-1])
+
+    def get_since_link(self):
+        """Nouveautés postérieures à la page (même curseur si la page est vide)"""
+        if self.page:
+            return self._link(self.since_query_param, self.page[0])
+        if self.since is not None:
+            return self.request.build_absolute_uri()
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('since', self.get_since_link()),
+            ('has_more_recent', self.has_more_recent),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'since': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'has_more_recent': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
@@ -1,6 +1,10 @@
 # ==================== apps/notifications/services.py ====================
-from .models import Notification
-from typing import Dict, Optional, List
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from .models import Notification, NotificationCounter
+from typing import Dict, Iterable, Optional, List
 
 
 # ==================== NOTIFICATION TYPES ====================
@@ -28,6 +32,7 @@ class NotificationType:
     PROFILE_INCOMPLETE = 'profile_incomplete'
     ORDER_CANCELLED = 'order_cancelled'
     REFUND_REQUESTED = 'refund_requested'
+    PRODUCTION_ALERT = 'production_alert'
 
 
 # ==================== COMMON STRINGS ====================
@@ -42,6 +47,7 @@ class NotificationText:
     TITLE_DELIVERY_COMPLETED = 'Livraison effectuée'
     TITLE_PRODUCT_SHIPPED = 'Produit expédié'
     TITLE_TRANSFORMATION_COMPLETED = 'Transformation terminée'
+    TITLE_PRODUCTION_ALERT = 'Nouvelle production'
     
     # Common field names
     FIELD_AMOUNT = 'amount'
@@ -51,6 +57,96 @@ class NotificationText:
     CURRENCY_FCFA = 'FCFA'
 
 
+# ==================== UNREAD COUNTERS ====================
+class UnreadCounter:
+    """
+    Compteur de notifications non lues par utilisateur (NotificationCounter).
+    
+    Tenu à jour par des UPDATE F() dans la transaction de chaque écriture
+    (création, lecture, suppression) : le badge se lit par clé primaire,
+    sans COUNT(*). reconcile() corrige une éventuelle dérive.
+    """
+    CHUNK_SIZE = 1000
+    
+    @staticmethod
+    def get(user_id) -> int:
+        return NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+    
+    @staticmethod
+    def increment(counts: Dict[int, int]):
+        """Ajoute counts[user_id] au compteur de chaque utilisateur (un UPDATE par valeur distincte)"""
+        user_ids = list(counts)
+        for start in range(0, len(user_ids), UnreadCounter.CHUNK_SIZE):
+            NotificationCounter.objects.bulk_create(
+                [NotificationCounter(user_id=user_id) for user_id in user_ids[start:start + UnreadCounter.CHUNK_SIZE]],
+                ignore_conflicts=True
+            )
+        
+        by_value = defaultdict(list)
+        for user_id, count in counts.items():
+            by_value[count].append(user_id)
+        for count, ids in by_value.items():
+            for start in range(0, len(ids), UnreadCounter.CHUNK_SIZE):
+                NotificationCounter.objects.filter(
+                    user_id__in=ids[start:start + UnreadCounter.CHUNK_SIZE]
+                ).update(unread=F('unread') + count)
+    
+    @staticmethod
+    def decrement(user_id, count: int = 1):
+        if count:
+            NotificationCounter.objects.filter(user_id=user_id).update(unread=Greatest(F('unread') - count, 0))
+    
+    @staticmethod
+    def reconcile(chunk_size: int = CHUNK_SIZE) -> Dict:
+        """
+        Recompte les non lues par lots d'utilisateurs et corrige les compteurs
+        divergents. Les compteurs du lot sont verrouillés pendant le recomptage.
+        
+        Returns:
+            dict: {'users', 'corriges', 'ecart'} (ecart : somme des écarts absolus)
+        """
+        from apps.users.models import CustomUser
+        
+        stats = {'users': 0, 'corriges': 0, 'ecart': 0}
+        last_pk = 0
+        while True:
+            ids = list(
+                CustomUser.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return stats
+            last_pk = ids[-1]
+            stats['users'] += len(ids)
+            
+            with transaction.atomic():
+                counters = {
+                    counter.user_id: counter
+                    for counter in NotificationCounter.objects.select_for_update().filter(user_id__in=ids)
+                }
+                actual = dict(
+                    Notification.objects.filter(recipient_id__in=ids, is_read=False)
+                    .values('recipient_id').annotate(unread=Count('id')).order_by()
+                    .values_list('recipient_id', 'unread')
+                )
+                
+                missing, wrong = [], []
+                for user_id in ids:
+                    expected = actual.get(user_id, 0)
+                    counter = counters.get(user_id)
+                    if counter is None:
+                        if expected:
+                            missing.append(NotificationCounter(user_id=user_id, unread=expected))
+                            stats['ecart'] += expected
+                    elif counter.unread != expected:
+                        stats['ecart'] += abs(counter.unread - expected)
+                        counter.unread = expected
+                        wrong.append(counter)
+                
+                NotificationCounter.objects.bulk_create(missing, ignore_conflicts=True)
+                NotificationCounter.objects.bulk_update(wrong, ['unread'])
+                stats['corriges'] += len(missing) + len(wrong)
+
+
 class NotificationService:
     """Service centralisé pour TOUTES les notifications"""
     
@@ -79,10 +175,56 @@ class NotificationService:
         return Notification.objects.create(**notif_data)
     
     @staticmethod
-    def bulk_create(notifications_data: List[Dict]) -> List[Notification]:
-        return Notification.objects.bulk_create([
-            Notification(**data) for data in notifications_data
-        ])
+    def bulk_create(notifications_data: List[Dict], batch_size: Optional[int] = None) -> List[Notification]:
+        """
+        Crée les notifications en un seul bulk_create, puis les pousse aux
+        WebSockets après commit (bulk_create ne déclenche pas post_save).
+        """
+        from .dispatch import schedule
+        
+        notifications = Notification.objects.bulk_create(
+            [Notification(**data) for data in notifications_data],
+            batch_size=batch_size
+        )
+        UnreadCounter.increment(Counter(
+            notification.recipient_id for notification in notifications if not notification.is_read
+        ))
+        schedule(notifications)
+        return notifications
+    
+    @staticmethod
+    def fan_out(
+        recipients: Iterable,
+        notif_type: str,
+        title: str,
+        message: str,
+        content_object=None,
+        data: Optional[Dict] = None,
+        batch_size: Optional[int] = None
+    ) -> List[Notification]:
+        """
+        Même notification pour de nombreux destinataires (utilisateurs ou ids) :
+        un bulk_create, puis un envoi WebSocket groupé après commit.
+        """
+        generic = {}
+        if content_object:
+            from django.contrib.contenttypes.models import ContentType
+            generic = {
+                'content_type': ContentType.objects.get_for_model(content_object),
+                'object_id': content_object.id,
+            }
+        
+        return NotificationService.bulk_create([
+            {
+                'recipient_id': getattr(recipient, 'pk', recipient),
+                'type': notif_type,
+                'title': title,
+                'message': message,
+                'data': data or {},
+                **generic
+            }
+            for recipient in recipients
+        ], batch_size=batch_size)
     
     # ==================== PRODUCTEUR ====================
     
@@ -476,12 +618,42 @@ class NotificationService:
         """Nouvelle production disponible (selon préférences)"""
         return NotificationService.create(
             recipient=consommateur,
-            notif_type=NotificationType.NEW_ORDER,
-            title='Nouvelle production',
+            notif_type=NotificationType.PRODUCTION_ALERT,
+            title=NotificationText.TITLE_PRODUCTION_ALERT,
             message=f'{production.produit} disponible - {production.prix_unitaire} {NotificationText.CURRENCY_FCFA}',
             content_object=production
         )
     
+    @staticmethod
+    def notify_consommateurs_productions(correspondances):
+        """
+        Productions correspondant à des recherches sauvegardées, en un seul INSERT.
+        
+        Args:
+            correspondances: Liste de (production, user_id, recherche_ids)
+        """
+        from django.contrib.contenttypes.models import ContentType
+        if not correspondances:
+            return []
+        
+        content_type = ContentType.objects.get_for_model(correspondances[0][0])
+        return NotificationService.bulk_create([
+            {
+                'recipient_id': user_id,
+                'type': NotificationType.PRODUCTION_ALERT,
+                'title': NotificationText.TITLE_PRODUCTION_ALERT,
+                'message': f'{production.produit} disponible - {production.prix_unitaire} {NotificationText.CURRENCY_FCFA}',
+                'content_type': content_type,
+                'object_id': production.id,
+                'data': {
+                    'production_id': production.id,
+                    'prix_unitaire': float(production.prix_unitaire),
+                    'recherches': recherche_ids,
+                },
+            }
+            for production, user_id, recherche_ids in correspondances
+        ])
+    
     @staticmethod
     def notify_consommateur_order_confirmed(commande):
         """Commande confirmée"""
@@ -1,30 +1,17 @@
 # ==================== apps/notifications/signals.py ====================
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .dispatch import schedule
 from .models import Notification
-from .serializers import NotificationSerializer
+from .services import UnreadCounter
 
 @receiver(post_save, sender=Notification)
 def notify_user(sender, instance, created, **kwargs):
     if not created:
         return
     
-    channel_layer = get_channel_layer()
-    room_group_name = f'notifications_{instance.recipient.id}'
+    if not instance.is_read:
+        UnreadCounter.increment({instance.recipient_id: 1})
     
-    # Sérialiser la notification
-    serialized = NotificationSerializer(instance).data
-    
-    # Envoyer au groupe WebSocket de l'utilisateur
-    async_to_sync(channel_layer.group_send)(
-        room_group_name,
-        {
-            'type': 'send_notification',
-            'notification': {
-                'type': 'new_notification',
-                'data': serialized
-            }
-        }
-    )
+    # Envoi au groupe WebSocket de l'utilisateur après commit, hors du thread de la requête
+    schedule([instance])
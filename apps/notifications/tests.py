@@ -1,3 +1,273 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework.test import APIClient
+
+from apps.users.models import CustomUser
+from apps.notifications.consumers import NotificationConsumer
+from apps.notifications.dispatch import AsyncDispatcher, group_name, push, request_batch
+from apps.notifications.models import Notification, NotificationCounter
+from apps.notifications.pagination import NotificationCursorPagination
+from apps.notifications.services import NotificationService, NotificationType, UnreadCounter
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, NOTIFICATIONS_DISPATCH={'BATCH_SIZE': 2, 'ASYNC': False})
+class DispatchTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(email=f'user{i}@example.com', password='x') for i in range(3)
+        ]
+        self.channel_layer = get_channel_layer()
+        self.channels = {}
+        for user in self.users:
+            channel = async_to_sync(self.channel_layer.new_channel)()
+            async_to_sync(self.channel_layer.group_add)(group_name(user.pk), channel)
+            self.channels[user.pk] = channel
+
+    def _recu(self, user):
+        return async_to_sync(self.channel_layer.receive)(self.channels[user.pk])
+
+    def test_fan_out_un_insert_puis_envoi_a_chaque_destinataire(self):
+        # INSERT des notifications, puis création et incrément des compteurs
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+            notifications = NotificationService.fan_out(
+                self.users, NotificationType.PRODUCTION_ALERT, 'Nouvelle production', 'Maïs disponible',
+                data={'production_id': 1}
+            )
+
+        self.assertEqual(len(notifications), 3)
+        self.assertEqual(Notification.objects.filter(type=NotificationType.PRODUCTION_ALERT).count(), 3)
+        for user, notification in zip(self.users, notifications):
+            event = self._recu(user)
+            self.assertEqual(event['type'], 'send_notification')
+            self.assertEqual(event['notification']['type'], 'new_notification')
+            self.assertEqual(event['notification']['data']['id'], notification.pk)
+
+    def test_creation_unitaire_poussee_par_le_signal(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = NotificationService.create(
+                self.users[0], NotificationType.NEW_MESSAGE, 'Nouveau message', 'Bonjour'
+            )
+        self.assertEqual(self._recu(self.users[0])['notification']['data']['id'], notification.pk)
+
+    def test_rien_n_est_pousse_si_la_transaction_est_annulee(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    NotificationService.create(self.users[0], NotificationType.NEW_MESSAGE, 'Titre', 'Message')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def test_un_seul_envoi_par_requete(self):
+        with patch('apps.notifications.dispatch.dispatch') as dispatch:
+            with request_batch():
+                for user in self.users[:2]:
+                    with self.captureOnCommitCallbacks(execute=True):
+                        NotificationService.create(user, NotificationType.NEW_MESSAGE, 'Titre', 'Message')
+                dispatch.assert_not_called()
+
+        dispatch.assert_called_once()
+        self.assertEqual([n.recipient_id for n in dispatch.call_args.args[0]], [u.pk for u in self.users[:2]])
+
+    def test_envoi_hors_du_thread_appelant(self):
+        threads = []
+
+        async def send_events(events, batch_size=None):
+            threads.append(threading.current_thread().name)
+            return len(events), 0
+
+        with patch('apps.notifications.dispatch.send_events', side_effect=send_events):
+            resultat = AsyncDispatcher().submit([('notifications_1', {})]).result(timeout=5)
+
+        self.assertEqual(resultat, (1, 0))
+        self.assertEqual(threads, ['notifications-dispatch'])
+
+    def test_channel_layer_indisponible_ne_bloque_pas(self):
+        notifications = NotificationService.fan_out(self.users[:2], NotificationType.NEW_MESSAGE, 'Titre', 'Message')
+
+        with patch.object(self.channel_layer, 'group_send', side_effect=ConnectionError('redis')):
+            self.assertEqual(push(notifications), (0, 2))
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class UnreadCounterTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='user@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _notifier(self, count):
+        return NotificationService.fan_out([self.user] * count, NotificationType.NEW_MESSAGE, 'Titre', 'Message')
+
+    def test_compteur_suit_creations_et_lectures(self):
+        NotificationService.create(self.user, NotificationType.NEW_MESSAGE, 'Titre', 'Message')
+        notifications = self._notifier(3)
+        self.assertEqual(UnreadCounter.get(self.user.id), 4)
+
+        notifications[0].mark_as_read()
+        Notification.objects.get(pk=notifications[0].pk).mark_as_read()
+        self.assertEqual(UnreadCounter.get(self.user.id), 3)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/notifications/unread_count/')
+        self.assertEqual(response.data, {'count': 3})
+
+        self.assertEqual(self.client.post('/api/notifications/mark_all_read/').data, {'marked_count': 3})
+        self.assertEqual(UnreadCounter.get(self.user.id), 0)
+
+    def test_suppression_decompte_les_non_lues(self):
+        notifications = self._notifier(3)
+        notifications[0].mark_as_read()
+
+        self.assertEqual(self.client.delete('/api/notifications/clear_all/').data, {'deleted_count': 3})
+        self.assertEqual(UnreadCounter.get(self.user.id), 0)
+
+    def test_reconciliation_corrige_la_derive(self):
+        autre = CustomUser.objects.create_user(email='autre@example.com', password='x')
+        self._notifier(2)
+        NotificationCounter.objects.filter(user=self.user).update(unread=7)
+        Notification.objects.bulk_create([
+            Notification(recipient=autre, type=NotificationType.NEW_MESSAGE, title='Titre', message='Message')
+        ])
+
+        stats = UnreadCounter.reconcile(chunk_size=1)
+
+        self.assertEqual(stats, {'users': 2, 'corriges': 2, 'ecart': 6})
+        self.assertEqual(UnreadCounter.get(self.user.id), 2)
+        self.assertEqual(UnreadCounter.get(autre.id), 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class NotificationCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='user@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        debut = timezone.now() - timedelta(hours=1)
+        # Les deux dernières à la même date : départage par id
+        self.notifications = NotificationService.fan_out(
+            [self.user] * 5, NotificationType.NEW_MESSAGE, 'Titre', 'Message'
+        )
+        for i, notification in enumerate(self.notifications):
+            notification.created_at = debut + timedelta(minutes=min(i, 3))
+        Notification.objects.bulk_update(self.notifications, ['created_at'])
+
+    def _ids(self, response):
+        return [notification['id'] for notification in response.data['results']]
+
+    def test_pages_du_plus_recent_au_plus_ancien(self):
+        ids = [notification.pk for notification in reversed(self.notifications)]
+
+        with self.assertNumQueries(1):
+            page = self.client.get('/api/notifications/', {'page_size': 2})
+        self.assertEqual(self._ids(page), ids[:2])
+        self.assertNotIn('count', page.data)
+
+        page = self.client.get(page.data['next'])
+        self.assertEqual(self._ids(page), ids[2:4])
+        page = self.client.get(page.data['next'])
+        self.assertEqual(self._ids(page), ids[4:])
+        self.assertIsNone(page.data['next'])
+
+    def test_since_ne_renvoie_que_les_nouveautes(self):
+        premiere = self.client.get('/api/notifications/', {'page_size': 2})
+        since = premiere.data['since']
+        self.assertEqual(self._ids(self.client.get(since)), [])
+
+        nouvelles = self._notifier_plus_tard(3)
+        page = self.client.get(since + '&page_size=2')
+        self.assertEqual(self._ids(page), [nouvelles[1].pk, nouvelles[0].pk])
+        self.assertTrue(page.data['has_more_recent'])
+
+        page = self.client.get(page.data['since'])
+        self.assertEqual(self._ids(page), [nouvelles[2].pk])
+        self.assertFalse(page.data['has_more_recent'])
+
+    def test_curseur_invalide(self):
+        self.assertEqual(self.client.get('/api/notifications/', {'before': 'xx'}).status_code, 404)
+
+    def _notifier_plus_tard(self, count):
+        notifications = NotificationService.fan_out([self.user] * count, NotificationType.NEW_MESSAGE, 'Titre', 'Message')
+        for i, notification in enumerate(notifications):
+            notification.created_at = timezone.now() + timedelta(minutes=i)
+        Notification.objects.bulk_update(notifications, ['created_at'])
+        return notifications
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, NOTIFICATIONS_RESYNC={'MAX_DELTA': 3})
+class ResyncTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='user@example.com', password='x')
+        _, self.token = AuthToken.objects.create(self.user)
+        self.notifications = NotificationService.fan_out(
+            [self.user] * 5, NotificationType.NEW_MESSAGE, 'Titre', 'Message'
+        )
+
+    def _connecter(self, query):
+        async def connecter():
+            communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), f'/ws/notifications/?{query}')
+            connected, _ = await communicator.connect()
+            frame = await communicator.receive_json_from() if connected else None
+            await communicator.disconnect()
+            return connected, frame
+        return async_to_sync(connecter)()
+
+    def test_sans_position_liste_des_non_lues(self):
+        connected, frame = self._connecter(f'token={self.token}')
+        self.assertTrue(connected)
+        self.assertEqual(frame['type'], 'unread_list')
+        self.assertEqual(frame['count'], 5)
+        self.assertEqual(len(frame['notifications']), 5)
+
+    def test_delta_depuis_last_seen_id(self):
+        connected, frame = self._connecter(f'token={self.token}&last_seen_id={self.notifications[2].pk}')
+        self.assertTrue(connected)
+        self.assertEqual(frame['type'], 'delta')
+        self.assertEqual([n['id'] for n in frame['notifications']], [self.notifications[4].pk, self.notifications[3].pk])
+        self.assertEqual(frame['count'], 5)
+
+        # Le curseur renvoyé est repris tel quel à la reconnexion suivante, et rendu si rien n'a été manqué
+        since = frame['since']
+        _, frame = self._connecter(f'token={self.token}&since={since}')
+        self.assertEqual(frame, {'type': 'delta', 'notifications': [], 'count': 5, 'since': since})
+
+    def test_delta_vide_depuis_last_seen_id_donne_un_curseur(self):
+        _, frame = self._connecter(f'token={self.token}&last_seen_id={self.notifications[4].pk}')
+        self.assertEqual(frame['notifications'], [])
+        self.assertEqual(frame['since'], NotificationCursorPagination.encode_cursor(self.notifications[4]))
+
+    def test_resume_si_l_ecart_depasse_la_limite(self):
+        _, frame = self._connecter(f'last_seen_id={self.notifications[0].pk - 1}&token={self.token}')
+        self.assertEqual(frame['type'], 'summary')
+        self.assertEqual(frame['count'], 5)
+        self.assertEqual(frame['latest']['id'], self.notifications[4].pk)
+        self.assertEqual(frame['since'], NotificationCursorPagination.encode_cursor(self.notifications[4]))
+        self.assertNotIn('notifications', frame)
+
+    def test_curseur_since_borne_la_lecture(self):
+        since = NotificationCursorPagination.encode_cursor(self.notifications[3])
+        _, frame = self._connecter(f'token={self.token}&since={since}')
+        self.assertEqual([n['id'] for n in frame['notifications']], [self.notifications[4].pk])
+
+    def test_last_seen_id_illisible_n_ecarte_pas_since(self):
+        since = NotificationCursorPagination.encode_cursor(self.notifications[3])
+        _, frame = self._connecter(f'token={self.token}&last_seen_id=abc&since={since}')
+        self.assertEqual(frame['type'], 'delta')
+        self.assertEqual([n['id'] for n in frame['notifications']], [self.notifications[4].pk])
+
+    def test_token_invalide_refuse(self):
+        connected, _ = self._connecter('token=inconnu&last_seen_id=1')
+        self.assertFalse(connected)
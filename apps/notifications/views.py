@@ -3,12 +3,16 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
 from django.utils import timezone
 from .models import Notification
+from .pagination import NotificationCursorPagination
 from .serializers import NotificationSerializer
+from .services import UnreadCounter
 from .docs.notifications_swagger import (
     NOTIFICATIONS_LIST_SCHEMA,
     UNREAD_NOTIFICATIONS_SCHEMA,
+    UNREAD_COUNT_SCHEMA,
     MARK_READ_SCHEMA,
     MARK_ALL_READ_SCHEMA,
     CLEAR_ALL_SCHEMA
@@ -17,6 +21,8 @@ from .docs.notifications_swagger import (
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    # Keyset (created_at, id) : ni COUNT(*) ni OFFSET sur les grosses boîtes
+    pagination_class = NotificationCursorPagination
     
     @NOTIFICATIONS_LIST_SCHEMA
     def list(self, request, *args, **kwargs):
@@ -31,10 +37,15 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
         notifications = self.get_queryset().filter(is_read=False)[:50]
         serializer = self.get_serializer(notifications, many=True)
         return Response({
-            'count': self.get_queryset().filter(is_read=False).count(),
+            'count': UnreadCounter.get(request.user.id),
             'results': serializer.data
         })
     
+    @action(detail=False, methods=['get'])
+    @UNREAD_COUNT_SCHEMA
+    def unread_count(self, request):
+        return Response({'count': UnreadCounter.get(request.user.id)})
+    
     @action(detail=True, methods=['post'])
     @MARK_READ_SCHEMA
     def mark_read(self, request, pk=None):
@@ -45,14 +56,19 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['post'])
     @MARK_ALL_READ_SCHEMA
     def mark_all_read(self, request):
-        count = self.get_queryset().filter(is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        with transaction.atomic():
+            count = self.get_queryset().filter(is_read=False).update(
+                is_read=True,
+                read_at=timezone.now()
+            )
+            UnreadCounter.decrement(request.user.id, count)
         return Response({'marked_count': count})
     
     @action(detail=False, methods=['delete'])
     @CLEAR_ALL_SCHEMA
     def clear_all(self, request):
-        count, _ = self.get_queryset().delete()
-        return Response({'deleted_count': count})
\ No newline at end of file
+        with transaction.atomic():
+            unread, _ = self.get_queryset().filter(is_read=False).delete()
+            read, _ = self.get_queryset().delete()
+            UnreadCounter.decrement(request.user.id, unread)
+        return Response({'deleted_count': unread + read})
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Production, PhotoProduction, Commande, Paiement, Evaluation
+from .models import Production, PhotoProduction, Commande, Paiement, Evaluation, IndexationEnAttente, RechercheSauvegardee
 
 class PhotoProductionInline(admin.TabularInline):
     model = PhotoProduction
@@ -8,8 +8,9 @@ class PhotoProductionInline(admin.TabularInline):
 
 @admin.register(Production)
 class ProductionAdmin(admin.ModelAdmin):
-    list_display = ['produit', 'producteur', 'quantite', 'prix_unitaire', 'disponible', 'date_creation']
+    list_display = ['produit', 'producteur', 'quantite', 'quantite_reservee', 'prix_unitaire', 'disponible', 'date_creation']
     list_filter = ['type_production', 'disponible', 'certification']
+    readonly_fields = ['quantite_reservee']
     search_fields = ['produit', 'producteur__user__nom']
     inlines = [PhotoProductionInline]
 
@@ -20,4 +21,16 @@ class CommandeAdmin(admin.ModelAdmin):
     search_fields = ['production__produit', 'client__nom']
 
 admin.site.register(Paiement)
-admin.site.register(Evaluation)
\ No newline at end of file
+admin.site.register(Evaluation)
+
+@admin.register(IndexationEnAttente)
+class IndexationEnAttenteAdmin(admin.ModelAdmin):
+    list_display = ['production_id', 'action', 'percoler', 'tentatives', 'date_creation', 'date_modification']
+    list_filter = ['action', 'percoler']
+    search_fields = ['production_id', 'derniere_erreur']
+
+@admin.register(RechercheSauvegardee)
+class RechercheSauvegardeeAdmin(admin.ModelAdmin):
+    list_display = ['nom', 'user', 'texte', 'type_production', 'prix_max', 'rayon_km', 'active', 'date_creation']
+    list_filter = ['active', 'type_production']
+    search_fields = ['nom', 'texte', 'user__email']
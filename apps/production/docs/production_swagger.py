@@ -6,6 +6,7 @@ TAG_PRODUCTION = 'Productions'
 TAG_COMMANDE = 'Commandes'
 TAG_PAIEMENT = 'Paiements'
 TAG_EVALUATION = 'Évaluations'
+TAG_RECHERCHE = 'Recherches sauvegardées'
 
 # ==================== PRODUCTIONS ====================
 
@@ -13,6 +14,9 @@ LIST_PRODUCTIONS_SCHEMA = extend_schema(
     operation_id="list_productions",
     summary="Liste des productions",
     description="Productions disponibles avec pagination",
+    parameters=[
+        OpenApiParameter('ordering', str, description='Tri: -note_moyenne, prix_unitaire, -date_creation'),
+    ],
     responses={
         200: {
             'description': 'Liste paginée',
@@ -119,15 +123,39 @@ CREATE_PRODUCTION_SCHEMA = extend_schema(
 NEARBY_PRODUCTIONS_SCHEMA = extend_schema(
     operation_id="nearby_productions",
     summary="Productions à proximité",
-    description="Recherche par rayon GPS (défaut: 10km)",
+    description="Recherche par rayon GPS (défaut: 10km), triée par distance croissante et paginée",
     parameters=[
         OpenApiParameter('lat', float, description='Latitude', required=True),
         OpenApiParameter('lon', float, description='Longitude', required=True),
         OpenApiParameter('radius', float, description='Rayon en km (défaut: 10)'),
+        OpenApiParameter('k', int, description='Limiter aux k productions les plus proches'),
+        OpenApiParameter('type_production', str, description='Type production'),
+        OpenApiParameter('prix_max', float, description='Prix unitaire maximum'),
+        OpenApiParameter('page', int, description='Numéro de page'),
     ],
     responses={
-        200: {'description': 'Productions dans le rayon'},
-        400: {'description': 'lat et lon requis'}
+        200: {
+            'description': 'Productions dans le rayon',
+            'content': {
+                'application/json': {
+                    'example': {
+                        'count': 12,
+                        'next': 'http://.../api/productions/nearby/?lat=3.86&lon=11.51&page=2',
+                        'previous': None,
+                        'radius_km': 10.0,
+                        'results': [{
+                            'id': 1,
+                            'produit': 'Tomates',
+                            'prix_unitaire': 500,
+                            'latitude': 3.8667,
+                            'longitude': 11.5167,
+                            'distance_km': 1.254
+                        }]
+                    }
+                }
+            }
+        },
+        400: {'description': 'lat et lon requis ou non numériques'}
     },
     tags=[TAG_PRODUCTION]
 )
@@ -154,18 +182,113 @@ UPLOAD_PHOTO_SCHEMA = extend_schema(
     tags=[TAG_PRODUCTION]
 )
 
+CLUSTERS_PRODUCTIONS_SCHEMA = extend_schema(
+    operation_id="clusters_productions",
+    summary="Clusters carte",
+    description=(
+        "Nombre de productions disponibles et barycentre par cellule geotile "
+        "(précision niveau de tuile + 3) pour le viewport. Résultats mis en cache par tuile ; "
+        "`tronque` signale une agrégation incomplète (non mise en cache)."
+    ),
+    parameters=[
+        OpenApiParameter('min_lat', float, description='Latitude sud du viewport', required=True),
+        OpenApiParameter('max_lat', float, description='Latitude nord du viewport', required=True),
+        OpenApiParameter('min_lon', float, description='Longitude ouest du viewport', required=True),
+        OpenApiParameter('max_lon', float, description='Longitude est du viewport', required=True),
+        OpenApiParameter('zoom', int, description='Niveau de zoom de la carte (0-26)', required=True),
+        OpenApiParameter('type_production', str, description='Filtrer par type'),
+    ],
+    responses={
+        200: {
+            'description': 'Clusters',
+            'content': {
+                'application/json': {
+                    'example': {
+                        'zoom': 12,
+                        'precision': 15,
+                        'total': 57,
+                        'tronque': False,
+                        'clusters': [
+                            {'lat': 3.866012, 'lon': 11.516543, 'count': 42},
+                            {'lat': 3.901277, 'lon': 11.498102, 'count': 15}
+                        ]
+                    }
+                }
+            }
+        },
+        400: {'description': 'Paramètres manquants ou invalides'},
+        503: {'description': 'Elasticsearch indisponible'}
+    },
+    tags=[TAG_PRODUCTION]
+)
+
 SEARCH_PRODUCTIONS_SCHEMA = extend_schema(
     operation_id="search_productions",
     summary="Recherche Elasticsearch",
-    description="Recherche avancée avec filtres",
+    description=(
+        "Recherche avancée avec filtres. Pendant un incident Elasticsearch, la recherche "
+        "bascule sur PostgreSQL (texte, filtres, localisation__geo_distance, ordering ; "
+        "ni facettes ni curseur). L'en-tête X-Search-Backend indique le moteur utilisé."
+    ),
     parameters=[
         OpenApiParameter('search', str, description='Terme recherche'),
         OpenApiParameter('type_production', str, description='Type production'),
         OpenApiParameter('certification', str, description='Certification'),
         OpenApiParameter('disponible', bool, description='Disponible'),
-        OpenApiParameter('ordering', str, description='Tri: prix_unitaire, -date_creation'),
+        OpenApiParameter('note_moyenne__gte', float, description='Note moyenne minimale'),
+        OpenApiParameter('ordering', str, description='Tri: prix_unitaire, -date_creation, -note_moyenne'),
+        OpenApiParameter('facets', bool, description='Ajoute les facettes (types, certifications, unités, prix, distance)'),
+        OpenApiParameter('ranking', bool, description='Classement par pertinence : texte, proximité, fraîcheur, note, certification (remplace ordering)'),
+        OpenApiParameter('lat', float, description='Latitude (facette distance, proximité du classement)'),
+        OpenApiParameter('lon', float, description='Longitude (facette distance, proximité du classement)'),
+        OpenApiParameter('cursor', str, description='Pagination par curseur : vide pour la première page, puis la valeur fournie dans next'),
+        OpenApiParameter('pit', bool, description='Avec cursor : parcours sur un instantané (point-in-time) de l\'index'),
     ],
-    responses={200: {'description': 'Résultats'}},
+    responses={
+        200: {
+            'description': 'Résultats',
+            'content': {
+                'application/json': {
+                    'example': {
+                        'count': 42,
+                        'next': 'http://localhost:8001/api/productions/search/?facets=true&page=2',
+                        'previous': None,
+                        'facets': {
+                            'type_production': {'buckets': [{'key': 'legumes', 'doc_count': 30}]},
+                            'certification': {'buckets': [{'key': 'bio', 'doc_count': 12}]},
+                            'unite_mesure': {'buckets': [{'key': 'kg', 'doc_count': 40}]},
+                            'prix_unitaire': {'buckets': [{'key': 500.0, 'doc_count': 18}]},
+                            'distance': {'buckets': [{'key': '*-5.0', 'to': 5.0, 'doc_count': 4}]}
+                        },
+                        'results': []
+                    }
+                }
+            }
+        }
+    },
+    tags=[TAG_PRODUCTION]
+)
+
+SUGGEST_PRODUCTIONS_SCHEMA = extend_schema(
+    operation_id="suggest_productions",
+    summary="Autocomplétion",
+    description="Noms de produit (productions disponibles) et catégories commençant par le préfixe, sans casse ni accents",
+    parameters=[
+        OpenApiParameter('q', str, description='Préfixe saisi', required=True),
+    ],
+    responses={
+        200: {
+            'description': 'Suggestions',
+            'content': {
+                'application/json': {
+                    'example': {
+                        'produits': ['Tomates', 'Tomates cerises'],
+                        'categories': []
+                    }
+                }
+            }
+        }
+    },
     tags=[TAG_PRODUCTION]
 )
 
@@ -231,7 +354,8 @@ CONFIRM_COMMANDE_SCHEMA = extend_schema(
     summary="Confirmer commande",
     description="Producteur confirme la commande",
     responses={
-        200: {'description': 'Commande confirmée - Notification client'},
+        200: {'description': 'Commande confirmée - Stock réservé - Notification client'},
+        400: {'description': 'Stock insuffisant'},
         403: {'description': 'Producteur uniquement'}
     },
     tags=[TAG_COMMANDE]
@@ -242,7 +366,7 @@ CANCEL_COMMANDE_SCHEMA = extend_schema(
     summary="Annuler commande",
     description="Client ou producteur annule",
     responses={
-        200: {'description': 'Commande annulée - Notifications envoyées'}
+        200: {'description': 'Commande annulée - Stock libéré - Notifications envoyées'}
     },
     tags=[TAG_COMMANDE]
 )
@@ -253,6 +377,7 @@ SHIP_COMMANDE_SCHEMA = extend_schema(
     description="Producteur marque comme expédiée",
     responses={
         200: {'description': 'Expédiée - Notification client'},
+        400: {'description': 'Stock insuffisant (commande non confirmée)'},
         403: {'description': 'Producteur uniquement'}
     },
     tags=[TAG_COMMANDE]
@@ -263,7 +388,8 @@ DELIVER_COMMANDE_SCHEMA = extend_schema(
     summary="Livrer commande",
     description="Marquer comme livrée",
     responses={
-        200: {'description': 'Livrée - Notifications client + producteur'}
+        200: {'description': 'Livrée - Notifications client + producteur'},
+        400: {'description': 'Stock insuffisant (commande non confirmée)'}
     },
     tags=[TAG_COMMANDE]
 )
@@ -320,4 +446,42 @@ CREATE_EVALUATION_SCHEMA = extend_schema(
         400: {'description': 'Commande déjà évaluée ou non livrée'}
     },
     tags=[TAG_EVALUATION]
-)
\ No newline at end of file
+)
+
+# ==================== RECHERCHES SAUVEGARDÉES ====================
+
+CREATE_RECHERCHE_SCHEMA = extend_schema(
+    operation_id="create_recherche_sauvegardee",
+    summary="Sauvegarder une recherche",
+    description=(
+        "Alerte sur les nouvelles productions et les baisses de prix correspondant aux critères "
+        "(texte, type_production, prix_max, centre + rayon_km), combinés en ET. "
+        "Chaque correspondance crée une notification `production_alert`."
+    ),
+    request={
+        'application/json': {
+            'type': 'object',
+            'properties': {
+                'nom': {'type': 'string', 'example': 'Tomates près de Yaoundé'},
+                'texte': {'type': 'string', 'example': 'tomate'},
+                'type_production': {'type': 'string', 'example': 'legumes'},
+                'prix_max': {'type': 'number', 'example': 500},
+                'latitude': {'type': 'number', 'example': 3.848},
+                'longitude': {'type': 'number', 'example': 11.502},
+                'rayon_km': {'type': 'number', 'example': 20},
+            },
+            'required': ['nom']
+        }
+    },
+    responses={
+        201: {'description': 'Recherche sauvegardée'},
+        400: {'description': 'Aucun critère, ou centre et rayon incomplets'}
+    },
+    tags=[TAG_RECHERCHE]
+)
+
+LIST_RECHERCHES_SCHEMA = extend_schema(
+    operation_id="list_recherches_sauvegardees",
+    summary="Mes recherches sauvegardées",
+    tags=[TAG_RECHERCHE]
+)
@@ -1,6 +1,17 @@
+from django.conf import settings
 from django_elasticsearch_dsl import Document, fields
+from django_elasticsearch_dsl.fields import DEDField
+from elasticsearch_dsl import Float, GeoPoint, Keyword, Percolator, Text, analyzer
 from django_elasticsearch_dsl.registries import registry
-from .models import Production
+from apps.users.models import CustomUser, Producteur
+from .models import Production, PhotoProduction, RechercheSauvegardee
+
+# Entrée d'autocomplétion entière, sans casse ni accents : « pate » trouve « Pâte d'arachide »
+suggest_analyzer = analyzer('suggest_folding', tokenizer='keyword', filter=['lowercase', 'asciifolding'])
+
+
+def _topologie():
+    return getattr(settings, 'PRODUCTION_SEARCH_INDEX', {})
 
 
 @registry.register_document
@@ -19,11 +30,32 @@ class ProductionDocument(Document):
     # ✅ Le champ de géolocalisation complet pour Elasticsearch
     localisation = fields.GeoPointField()
 
+    # Agrégats d'évaluation (tri et filtre par note)
+    note_moyenne = fields.FloatField()
+    nombre_evaluations = fields.IntegerField()
+
+    # Champs à choix : texte pour la recherche, .raw (keyword) pour filtres exacts et facettes
+    type_production = fields.TextField(fields={'raw': fields.KeywordField()})
+    certification = fields.TextField(fields={'raw': fields.KeywordField()})
+    unite_mesure = fields.TextField(fields={'raw': fields.KeywordField()})
+
+    # Autocomplétion du nom de produit, restreinte aux productions disponibles
+    produit_suggest = fields.CompletionField(analyzer=suggest_analyzer, contexts=[
+        {'name': 'disponible', 'type': 'category'},
+    ])
+
+    # Champs dénormalisés : une réponse de recherche se construit depuis _source seul
+    producteur_nom = fields.TextField()
+    photo_principale = fields.KeywordField(index=False)
+    quantite_disponible = fields.FloatField()
+
     class Index:
+        # Alias vers l'index physique versionné productions-<horodatage> (voir reindex_productions)
         name = 'productions'
         settings = {
-            'number_of_shards': 1,
-            'number_of_replicas': 0,
+            'number_of_shards': _topologie().get('SHARDS', 1),
+            'number_of_replicas': _topologie().get('REPLICAS', 0),
+            'refresh_interval': _topologie().get('REFRESH_INTERVAL', '1s'),
         }
 
     class Django:
@@ -31,16 +63,53 @@ class ProductionDocument(Document):
         fields = [
             'id',
             'produit',
-            'type_production',
             'quantite',
-            'unite_mesure',
             'prix_unitaire',
             'disponible',
             'date_recolte',
-            'certification',
             'description',
             'date_creation',
+            'date_modification',
         ]
+        queryset_pagination = 1000
+        related_models = [PhotoProduction, Producteur, CustomUser]
+
+    def get_queryset(self):
+        """Producteur, utilisateur et photos préchargés : aucune requête par document."""
+        return super().get_queryset().select_related('producteur__user').prefetch_related('photos')
+
+    @staticmethod
+    def routing_field():
+        """Champ de Production servant de clé de routage, None pour le routage par _id."""
+        return _topologie().get('ROUTING_FIELD') or None
+
+    @classmethod
+    def cle_routage(cls, valeur):
+        """Valeur de routage d'une valeur du champ de routage (None : routage par _id)."""
+        if not cls.routing_field() or valeur in (None, ''):
+            return None
+        return str(valeur)
+
+    @classmethod
+    def routage(cls, instance):
+        champ = cls.routing_field()
+        return cls.cle_routage(getattr(instance, champ, None)) if champ else None
+
+    def _prepare_action(self, object_instance, action):
+        bulk_action = super()._prepare_action(object_instance, action)
+        routage = self.routage(object_instance)
+        if routage:
+            bulk_action['_routing'] = routage
+        return bulk_action
+
+    def get_instances_from_related(self, related_instance):
+        """Productions à réindexer quand une photo, un producteur ou son utilisateur change."""
+        if isinstance(related_instance, PhotoProduction):
+            return related_instance.production
+        if isinstance(related_instance, Producteur):
+            return related_instance.productions.all()
+        if isinstance(related_instance, CustomUser):
+            return Production.objects.filter(producteur__user=related_instance)
 
     def prepare_localisation(self, instance):
         """Construit le champ GeoPointField pour Elasticsearch."""
@@ -57,3 +126,79 @@ class ProductionDocument(Document):
             'prenom': instance.producteur.user.prenom,
             'type_production': instance.producteur.type_production,
         }
+
+    def prepare_produit_suggest(self, instance):
+        """Le nom complet et chacun de ses mots : « tomate » suggère « Grosses tomates »."""
+        mots = instance.produit.split()
+        return {
+            'input': [instance.produit, *mots[1:]],
+            'contexts': {'disponible': ['true' if instance.disponible else 'false']},
+        }
+
+    def prepare_producteur_nom(self, instance):
+        return instance.producteur.user.get_full_name()
+
+    def prepare_photo_principale(self, instance):
+        # .all() réutilise le cache prefetch_related('photos'), déjà trié par ordre
+        photos = instance.photos.all()
+        return photos[0].image.url if photos else None
+
+    def prepare_quantite_disponible(self, instance):
+        return float(instance.quantite_disponible)
+
+
+class PercolatorField(DEDField, Percolator):
+    pass
+
+
+@registry.register_document
+class RechercheSauvegardeeDocument(Document):
+    """
+    Recherches sauvegardées stockées comme requêtes percolator : une
+    production est confrontée à toutes les recherches actives en une seule
+    requête percolate. Elasticsearch ne vérifie que les requêtes candidates
+    sélectionnées par les termes extraits à l'indexation, et non chaque
+    recherche enregistrée.
+    """
+    query = PercolatorField()
+    user_id = fields.IntegerField(attr='user_id')
+
+    # Mapping des documents percolés (voir AlerteService.document), sans valeur stockée
+    produit = Text()
+    description = Text()
+    type_production = Keyword()
+    prix_unitaire = Float()
+    localisation = GeoPoint()
+
+    class Index:
+        name = 'alertes-productions'
+        settings = {
+            'number_of_shards': 1,
+            'number_of_replicas': 0,
+        }
+
+    class Django:
+        model = RechercheSauvegardee
+        fields = ['id', 'active']
+
+    def prepare_query(self, instance):
+        """Critères de la recherche en requête bool, tous en ET."""
+        must, filtres = [], []
+        if instance.texte:
+            must.append({'multi_match': {
+                'query': instance.texte,
+                'fields': ['produit^2', 'description'],
+                'operator': 'and',
+            }})
+        if instance.type_production:
+            filtres.append({'term': {'type_production': instance.type_production}})
+        if instance.prix_max is not None:
+            filtres.append({'range': {'prix_unitaire': {'lte': float(instance.prix_max)}}})
+        if instance.rayon_km is not None:
+            filtres.append({'geo_distance': {
+                'distance': f'{float(instance.rayon_km)}km',
+                'localisation': {'lat': float(instance.latitude), 'lon': float(instance.longitude)},
+            }})
+        if not must and not filtres:
+            return {'match_all': {}}
+        return {'bool': {'must': must, 'filter': filtres}}
@@ -0,0 +1,154 @@
+# apps/production/filter_backends.py
+"""Backends de filtre Elasticsearch propres à ProductionSearchViewSet."""
+from django.conf import settings
+from elasticsearch_dsl import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .documents import ProductionDocument
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'oui')
+
+
+def _origine(request):
+    """Point lat/lon des paramètres de requête, None s'ils sont absents"""
+    lat, lon = request.query_params.get('lat'), request.query_params.get('lon')
+    if lat is None or lon is None:
+        return None
+    try:
+        return {'lat': float(lat), 'lon': float(lon)}
+    except ValueError:
+        raise ValidationError({'error': 'lat et lon doivent être des nombres'})
+
+
+class FacetsFilterBackend(BaseFilterBackend):
+    """
+    Mode facettes (?facets=true) : ajoute les agrégations à la recherche
+    paginée, calculées par la même requête Elasticsearch que les hits.
+
+    Attributs de la vue :
+        facets_terms_fields: {nom: champ keyword} pour les agrégations terms
+        facets_prix_interval: pas de l'histogramme de prix_unitaire (FCFA)
+        facets_distance_ranges_km: bornes des tranches de distance, si lat/lon fournis
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not _truthy(request.query_params.get('facets', '')):
+            return queryset
+
+        for nom, champ in getattr(view, 'facets_terms_fields', {}).items():
+            queryset.aggs.bucket(nom, 'terms', field=champ, size=20)
+
+        interval = getattr(view, 'facets_prix_interval', None)
+        if interval:
+            queryset.aggs.bucket(
+                'prix_unitaire', 'histogram', field='prix_unitaire', interval=interval, min_doc_count=1
+            )
+
+        origine = _origine(request)
+        bornes = getattr(view, 'facets_distance_ranges_km', [])
+        if origine is not None and bornes:
+            tranches = [{'to': bornes[0]}]
+            tranches += [{'from': debut, 'to': fin} for debut, fin in zip(bornes, bornes[1:])]
+            tranches.append({'from': bornes[-1]})
+            queryset.aggs.bucket(
+                'distance', 'geo_distance', field='localisation', origin=origine, unit='km', ranges=tranches
+            )
+
+        return queryset
+
+
+class RankingFilterBackend(BaseFilterBackend):
+    """
+    Classement par pertinence (?ranking=true) : function_score combinant le
+    score texte (BM25) avec la proximité (si lat/lon), la fraîcheur, la note
+    moyenne et la certification. Pondérations dans PRODUCTION_SEARCH_RANKING.
+
+    À placer après les backends de tri : le tri explicite est retiré au
+    profit du score.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not _truthy(request.query_params.get('ranking', '')):
+            return queryset
+
+        config = getattr(settings, 'PRODUCTION_SEARCH_RANKING', {})
+        functions = []
+
+        distance = config.get('DISTANCE', {})
+        origine = _origine(request)
+        if origine is not None and distance.get('WEIGHT'):
+            functions.append({
+                'gauss': {'localisation': {
+                    'origin': origine,
+                    'scale': distance.get('SCALE', '10km'),
+                    'offset': distance.get('OFFSET', '1km'),
+                    'decay': distance.get('DECAY', 0.5),
+                }},
+                'weight': distance['WEIGHT'],
+            })
+
+        fraicheur = config.get('FRAICHEUR', {})
+        if fraicheur.get('WEIGHT'):
+            functions.append({
+                'gauss': {'date_creation': {
+                    'origin': 'now',
+                    'scale': fraicheur.get('SCALE', '14d'),
+                    'offset': fraicheur.get('OFFSET', '2d'),
+                    'decay': fraicheur.get('DECAY', 0.5),
+                }},
+                'weight': fraicheur['WEIGHT'],
+            })
+
+        note = config.get('NOTE', {})
+        if note.get('WEIGHT'):
+            functions.append({
+                'field_value_factor': {
+                    'field': 'note_moyenne', 'modifier': 'log1p', 'missing': 0,
+                },
+                'weight': note['WEIGHT'],
+            })
+
+        certification = config.get('CERTIFICATION', {})
+        if certification.get('WEIGHT') and certification.get('VALEURS'):
+            functions.append({
+                'filter': {'terms': {'certification.raw': certification['VALEURS']}},
+                'weight': certification['WEIGHT'],
+            })
+
+        if not functions:
+            return queryset
+
+        queryset = queryset.sort()
+        queryset.query = Q(
+            'function_score',
+            query=queryset.query._proxied,
+            functions=functions,
+            score_mode=config.get('SCORE_MODE', 'sum'),
+            boost_mode=config.get('BOOST_MODE', 'multiply'),
+        )
+        return queryset
+
+
+class RoutingFilterBackend(BaseFilterBackend):
+    """
+    Restreint la recherche aux shards de la clé de routage
+    (PRODUCTION_SEARCH_INDEX['ROUTING_FIELD']) quand la requête filtre sur ce
+    champ : ?type_production=legumes, ou ?type_production__in=legumes__fruits
+    pour plusieurs shards. Sans ce filtre, la recherche couvre tous les shards.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        champ = ProductionDocument.routing_field()
+        if not champ:
+            return queryset
+
+        valeurs = list(request.query_params.getlist(champ))
+        for valeur in request.query_params.getlist(f'{champ}__in'):
+            valeurs += valeur.split('__')
+        routages = sorted({ProductionDocument.cle_routage(valeur) for valeur in valeurs} - {None})
+        if not routages:
+            return queryset
+        return queryset.params(routing=','.join(routages))
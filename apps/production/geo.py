@@ -0,0 +1,149 @@
+# apps/production/geo.py
+"""Outils de géolocalisation (sans PostGIS)."""
+from math import radians, degrees, cos, sin, asin, sqrt, atan, sinh, tan, log, pi, floor
+
+import numpy as np
+
+RAYON_TERRE_KM = 6371.0
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en km entre deux points GPS."""
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * RAYON_TERRE_KM * asin(sqrt(a))
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """
+    Distances en km d'une origine vers N points, en un seul appel NumPy.
+
+    Args:
+        lat, lon (float): Origine
+        lats, lons (array-like): Coordonnées des N points
+
+    Returns:
+        np.ndarray: Vecteur (N,) des distances
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """
+    Matrice des distances en km entre N origines et M points.
+
+    Utile pour affecter des transporteurs à des commandes : la ligne i donne
+    les distances de l'origine i vers chacun des M points.
+
+    Returns:
+        np.ndarray: Matrice (N, M) des distances
+    """
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, np.newaxis]
+    lons1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, np.newaxis]
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))[np.newaxis, :]
+    lons2 = np.radians(np.asarray(lons2, dtype=np.float64))[np.newaxis, :]
+
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def within_radius(lat, lon, ids, lats, lons, radius_km):
+    """
+    Filtre et trie des points par distance croissante.
+
+    Returns:
+        list: [(distance_km, id), ...] pour les points à moins de radius_km
+    """
+    if len(ids) == 0:
+        return []
+
+    distances = haversine_distances(lat, lon, lats, lons)
+    dans_rayon = np.flatnonzero(distances <= radius_km)
+    ordre = dans_rayon[np.argsort(distances[dans_rayon], kind='stable')]
+    ids = np.asarray(ids)
+    return [(float(distances[i]), int(ids[i])) for i in ordre]
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Rectangle lat/lon englobant le cercle (lat, lon, radius_km).
+
+    Sert de préfiltre SQL sur les index latitude/longitude avant le calcul
+    exact de la distance.
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon). min_lon/max_lon valent
+        None si le cercle touche un pôle ou traverse l'antiméridien : seul le
+        filtre sur la latitude reste alors applicable.
+    """
+    delta_lat = degrees(radius_km / RAYON_TERRE_KM)
+    min_lat, max_lat = lat - delta_lat, lat + delta_lat
+
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+
+    delta_lon = degrees(radius_km / (RAYON_TERRE_KM * cos(radians(lat))))
+    min_lon, max_lon = lon - delta_lon, lon + delta_lon
+
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
+
+
+# ==================== TUILES WEB MERCATOR (z/x/y) ====================
+
+LAT_MAX_MERCATOR = 85.05112878
+
+
+def tile_xy(lat, lon, zoom):
+    """Tuile z/x/y (schéma slippy map, comme geotile_grid) contenant le point."""
+    n = 2 ** zoom
+    lat = min(max(lat, -LAT_MAX_MERCATOR), LAT_MAX_MERCATOR)
+    x = floor((lon + 180.0) / 360.0 * n)
+    y = floor((1.0 - log(tan(radians(lat)) + 1 / cos(radians(lat))) / pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon) de la tuile
+    """
+    n = 2 ** zoom
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = degrees(atan(sinh(pi * (1 - 2 * y / n))))
+    min_lat = degrees(atan(sinh(pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def _tile_range(min_lat, max_lat, min_lon, max_lon, zoom):
+    x_min, y_min = tile_xy(max_lat, min_lon, zoom)
+    x_max, y_max = tile_xy(min_lat, max_lon, zoom)
+    return x_min, y_min, x_max, y_max
+
+
+def count_tiles_in_bbox(min_lat, max_lat, min_lon, max_lon, zoom):
+    """Nombre de tuiles de tiles_in_bbox, calculé depuis les coins sans construire la liste."""
+    x_min, y_min, x_max, y_max = _tile_range(min_lat, max_lat, min_lon, max_lon, zoom)
+    return (x_max - x_min + 1) * (y_max - y_min + 1)
+
+
+def tiles_in_bbox(min_lat, max_lat, min_lon, max_lon, zoom):
+    """Tuiles (x, y) du niveau zoom couvrant le rectangle (sans traversée de l'antiméridien)."""
+    x_min, y_min, x_max, y_max = _tile_range(min_lat, max_lat, min_lon, max_lon, zoom)
+    return [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+
+
+def parent_tile(x, y, zoom, parent_zoom):
+    """Tuile ancêtre de (x, y, zoom) au niveau parent_zoom <= zoom."""
+    decalage = zoom - parent_zoom
+    return x >> decalage, y >> decalage
@@ -0,0 +1,510 @@
+# apps/production/indexation.py
+"""Indexation Elasticsearch des productions par lots (bulk API)."""
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from elasticsearch import NotFoundError
+from elasticsearch.helpers import parallel_bulk, scan, streaming_bulk
+
+from .documents import ProductionDocument
+from .models import IndexationEnAttente, Production
+import logging
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class IndexationService:
+    """Pipeline base -> documents -> bulk Elasticsearch"""
+
+    @staticmethod
+    def iter_chunks(queryset, chunk_size=1000):
+        """
+        Parcourt un queryset par pages de clé primaire (keyset), à mémoire constante.
+
+        Yields:
+            list: Lots d'au plus chunk_size instances
+        """
+        queryset = queryset.order_by('pk')
+        dernier_pk = None
+        while True:
+            lot = queryset if dernier_pk is None else queryset.filter(pk__gt=dernier_pk)
+            lot = list(lot[:chunk_size])
+            if not lot:
+                return
+            yield lot
+            dernier_pk = lot[-1].pk
+
+    @staticmethod
+    def actions(productions, index=None, action='index'):
+        """
+        Actions bulk pour une liste de productions.
+
+        Args:
+            productions: Instances Production (producteur__user déjà chargé)
+            index: Index cible (défaut : celui du document)
+            action: 'index' ou 'delete'
+        """
+        document = ProductionDocument()
+        for bulk_action in document.get_actions(productions, action):
+            if index:
+                bulk_action['_index'] = index
+            yield bulk_action
+
+    @staticmethod
+    def suppression(production_id, routage=None, index=None):
+        """Action bulk de suppression d'un document, sur le shard de son routage"""
+        bulk_action = {'_op_type': 'delete', '_index': index or ProductionDocument._index._name, '_id': production_id}
+        if routage:
+            bulk_action['_routing'] = routage
+        return bulk_action
+
+    @staticmethod
+    def indexer(queryset=None, index=None, chunk_size=1000, workers=4, on_progress=None):
+        """
+        Indexe les productions par lots, envoyés en parallèle par `workers` threads.
+
+        Les requêtes SQL restent dans le thread appelant ; seuls les appels
+        HTTP bulk sont parallélisés.
+
+        Args:
+            queryset: Productions à indexer (défaut : toutes)
+            index: Index cible (défaut : celui du document)
+            chunk_size: Taille des lots SQL et des requêtes bulk
+            workers: Nombre de threads d'envoi
+            on_progress: Callback(stats) appelé après chaque lot SQL
+
+        Returns:
+            dict: {'indexes', 'erreurs', 'duree', 'debit'}
+        """
+        if queryset is None:
+            queryset = ProductionDocument().get_queryset()
+
+        stats = {'indexes': 0, 'erreurs': 0, 'duree': 0.0, 'debit': 0.0}
+        debut = time.monotonic()
+
+        def generer():
+            for lot in IndexationService.iter_chunks(queryset, chunk_size):
+                yield from IndexationService.actions(lot, index=index)
+                if on_progress:
+                    stats['duree'] = time.monotonic() - debut
+                    on_progress(stats)
+
+        resultats = parallel_bulk(
+            ProductionDocument._get_connection(),
+            generer(),
+            thread_count=workers,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+        for ok, info in resultats:
+            if ok:
+                stats['indexes'] += 1
+            else:
+                stats['erreurs'] += 1
+                logger.error(f"Échec indexation production : {info}")
+
+        stats['duree'] = time.monotonic() - debut
+        stats['debit'] = stats['indexes'] / stats['duree'] if stats['duree'] else 0.0
+        return stats
+
+    # ==================== REINDEXATION BLUE/GREEN ====================
+
+    @staticmethod
+    def index_physiques():
+        """Index actuellement derrière l'alias du document (ou l'ancien index concret)"""
+        client = ProductionDocument._get_connection()
+        alias = ProductionDocument._index._name
+        try:
+            return sorted(client.indices.get_alias(name=alias))
+        except NotFoundError:
+            return [alias] if client.indices.exists(index=alias) else []
+
+    @staticmethod
+    def creer_index_versionne(nom=None):
+        """
+        Crée un index physique `<alias>-<horodatage>` avec le mapping du
+        document, réglé pour le chargement : pas de refresh, pas de réplique.
+        """
+        alias = ProductionDocument._index._name
+        nom = nom or f"{alias}-{timezone.now():%Y%m%d%H%M%S}"
+        index = ProductionDocument._index.clone(name=nom)
+        index.settings(refresh_interval='-1', number_of_replicas=0)
+        index.create()
+        return nom
+
+    @staticmethod
+    def rejouer(index, depuis, chunk_size=1000):
+        """
+        Rattrape dans `index` les écritures faites depuis `depuis` : productions
+        modifiées (date_modification) et productions supprimées.
+
+        Returns:
+            tuple: (réindexées, supprimées)
+        """
+        client = ProductionDocument._get_connection()
+        modifiees = ProductionDocument().get_queryset().filter(date_modification__gte=depuis)
+        stats = IndexationService.indexer(modifiees, index=index, chunk_size=chunk_size, workers=1)
+
+        client.indices.refresh(index=index)
+        routages = {
+            int(hit['_id']): hit.get('_routing')
+            for hit in scan(client, index=index, query={'_source': False}, size=chunk_size)
+        }
+        ids_index = list(routages)
+        existants = set()
+        for i in range(0, len(ids_index), chunk_size):
+            lot = ids_index[i:i + chunk_size]
+            existants.update(ProductionDocument.django.model.objects.filter(pk__in=lot).values_list('pk', flat=True))
+        supprimees = [pk for pk in ids_index if pk not in existants]
+        if supprimees:
+            streaming = streaming_bulk(
+                client,
+                (IndexationService.suppression(pk, routages[pk], index=index) for pk in supprimees),
+                chunk_size=chunk_size, raise_on_error=False,
+            )
+            for _ in streaming:
+                pass
+
+        return stats['indexes'], len(supprimees)
+
+    @staticmethod
+    def finaliser_index(index):
+        """Rétablit refresh et répliques du document (PRODUCTION_SEARCH_INDEX), puis rend les données visibles"""
+        client = ProductionDocument._get_connection()
+        reglages = ProductionDocument._index._settings
+        client.indices.put_settings(
+            index=index,
+            settings={'index': {
+                'refresh_interval': reglages.get('refresh_interval'),
+                'number_of_replicas': reglages.get('number_of_replicas', 1),
+            }},
+        )
+        client.indices.refresh(index=index)
+
+    @staticmethod
+    def basculer_alias(index):
+        """
+        Fait pointer l'alias du document sur `index`, en une seule opération
+        atomique. Un ancien index concret portant le nom de l'alias est supprimé.
+
+        Returns:
+            list: Index physiques précédemment servis
+        """
+        client = ProductionDocument._get_connection()
+        alias = ProductionDocument._index._name
+        anciens = [nom for nom in IndexationService.index_physiques() if nom != index]
+
+        actions = []
+        for ancien in anciens:
+            if ancien == alias:
+                actions.append({'remove_index': {'index': ancien}})
+            else:
+                actions.append({'remove': {'index': ancien, 'alias': alias}})
+        actions.append({'add': {'index': index, 'alias': alias}})
+        client.indices.update_aliases(actions=actions)
+
+        return [nom for nom in anciens if nom != alias]
+
+    # ==================== FILE DE SYNCHRONISATION (OUTBOX) ====================
+
+    @staticmethod
+    def enfiler(production_ids, action='index', percoler=False, routage=None):
+        """
+        Consigne des productions à (ré)indexer ou supprimer.
+
+        Un seul INSERT ... ON CONFLICT : une production déjà en attente garde
+        sa date_creation (délai maximal) et voit sa date_modification repoussée
+        (fenêtre de regroupement). À appeler dans la transaction de l'écriture.
+
+        Avec percoler=True, les productions seront confrontées aux recherches
+        sauvegardées après indexation ; une écriture ordinaire ultérieure ne
+        retire pas ce marquage.
+
+        `routage` est le routage du document actuellement indexé quand il
+        diffère de celui de la production (clé de routage modifiée, ou
+        suppression) : la copie de l'ancien shard sera supprimée. Le premier
+        routage consigné est conservé jusqu'au traitement.
+        """
+        maintenant = timezone.now()
+        update_fields = ['action', 'tentatives', 'derniere_erreur', 'date_modification']
+        if percoler:
+            update_fields.append('percoler')
+        IndexationEnAttente.objects.bulk_create(
+            [
+                IndexationEnAttente(
+                    production_id=pk, action=action, percoler=percoler, routage=routage or '',
+                    date_creation=maintenant, date_modification=maintenant
+                )
+                for pk in set(production_ids)
+            ],
+            update_conflicts=True,
+            unique_fields=['production_id'],
+            update_fields=update_fields,
+        )
+        if routage:
+            IndexationEnAttente.objects.filter(production_id__in=set(production_ids), routage='').update(routage=routage)
+
+    @staticmethod
+    def traiter_file(debounce=None, max_delay=None, batch_size=None):
+        """
+        Applique un lot de la file par requêtes bulk.
+
+        Une entrée est prête quand elle n'a pas bougé depuis `debounce`
+        secondes, ou qu'elle attend depuis plus de `max_delay` secondes. Elle
+        n'est retirée de la file que si elle n'a pas été modifiée pendant le
+        traitement ; un échec la repousse de `debounce` secondes, jusqu'à
+        SEARCH_SYNC['MAX_ATTEMPTS'] tentatives. Les productions marquées
+        `percoler` et indexées sont ensuite confrontées aux recherches
+        sauvegardées (AlerteService) ; un échec de cette étape compte comme un
+        échec de l'entrée.
+
+        Returns:
+            dict: {'indexes', 'supprimes', 'erreurs'}
+        """
+        config = getattr(settings, 'SEARCH_SYNC', {})
+        debounce = config.get('DEBOUNCE', 2) if debounce is None else debounce
+        max_delay = config.get('MAX_DELAY', 30) if max_delay is None else max_delay
+        batch_size = batch_size or config.get('BATCH_SIZE', 500)
+        max_attempts = config.get('MAX_ATTEMPTS', 10)
+
+        stats = {'indexes': 0, 'supprimes': 0, 'erreurs': 0}
+        maintenant = timezone.now()
+        entrees = {
+            entree.production_id: entree
+            for entree in IndexationEnAttente.objects.filter(
+                Q(date_modification__lte=maintenant - timedelta(seconds=debounce))
+                | Q(date_creation__lte=maintenant - timedelta(seconds=max_delay)),
+                tentatives__lt=max_attempts,
+            )[:batch_size]
+        }
+        if not entrees:
+            return stats
+
+        a_indexer = [pk for pk, entree in entrees.items() if entree.action == 'index']
+        productions = list(ProductionDocument().get_queryset().filter(pk__in=a_indexer))
+        # Supprimée entre-temps : on retire le document
+        a_supprimer = set(entrees) - {production.pk for production in productions}
+
+        # Clé de routage modifiée : la copie indexée sur l'ancien shard est retirée
+        actions = [
+            IndexationService.suppression(production.pk, entrees[production.pk].routage)
+            for production in productions
+            if entrees[production.pk].routage
+            and entrees[production.pk].routage != ProductionDocument.routage(production)
+        ]
+        actions += list(IndexationService.actions(productions))
+        actions += [IndexationService.suppression(pk, entrees[pk].routage) for pk in a_supprimer]
+
+        echecs = {}
+        for ok, info in streaming_bulk(
+            ProductionDocument._get_connection(), actions,
+            chunk_size=batch_size, raise_on_error=False, raise_on_exception=False,
+        ):
+            op_type, resultat = info.popitem()
+            if not ok and not (op_type == 'delete' and resultat.get('status') == 404):
+                echecs[int(resultat['_id'])] = str(resultat.get('error', ''))
+        succes = [entree for pk, entree in entrees.items() if pk not in echecs]
+
+        a_percoler = [
+            production for production in productions
+            if entrees[production.pk].percoler and production.disponible
+            and entrees[production.pk] in succes
+        ]
+        if a_percoler:
+            from .services import AlerteService
+
+            try:
+                AlerteService.percoler(a_percoler)
+            except Exception as exc:
+                logger.exception("Échec de la confrontation aux recherches sauvegardées")
+                for production in a_percoler:
+                    succes.remove(entrees[production.pk])
+                    echecs[production.pk] = f"Percolation : {exc}"
+            else:
+                # Une écriture ordinaire survenue pendant le lot ne doit pas renotifier
+                IndexationEnAttente.objects.filter(
+                    production_id__in=[production.pk for production in a_percoler]
+                ).update(percoler=False)
+
+        stats['indexes'] = sum(1 for production in productions if production.pk not in echecs)
+        stats['supprimes'] = sum(1 for pk in a_supprimer if pk not in echecs)
+        stats['erreurs'] = len(echecs)
+
+        # Retrait conditionnel : une écriture survenue pendant le lot reste en file
+        if succes:
+            traitees = Q()
+            for entree in succes:
+                traitees |= Q(pk=entree.pk, date_modification=entree.date_modification)
+            IndexationEnAttente.objects.filter(traitees).delete()
+
+        for pk, erreur in echecs.items():
+            logger.error(f"Échec synchronisation production #{pk} : {erreur}")
+            IndexationEnAttente.objects.filter(
+                pk=entrees[pk].pk, date_modification=entrees[pk].date_modification
+            ).update(
+                tentatives=F('tentatives') + 1,
+                derniere_erreur=erreur,
+                date_creation=maintenant,
+                date_modification=maintenant,
+            )
+
+        return stats
+
+    # ==================== CONTRÔLE DE COHÉRENCE ====================
+
+    @staticmethod
+    def millis(valeur):
+        """Datetime en millisecondes epoch, la précision des dates Elasticsearch"""
+        return (valeur - EPOCH) // timedelta(milliseconds=1)
+
+    @staticmethod
+    def flux_base(chunk_size=1000):
+        """
+        (id, date_modification en ms) de toutes les productions, par id
+        croissant, par pages de clé primaire.
+        """
+        queryset = Production.objects.order_by('pk').values_list('pk', 'date_modification')
+        dernier_pk = None
+        while True:
+            lot = queryset if dernier_pk is None else queryset.filter(pk__gt=dernier_pk)
+            lot = list(lot[:chunk_size])
+            if not lot:
+                return
+            for pk, date_modification in lot:
+                yield pk, IndexationService.millis(date_modification)
+            dernier_pk = lot[-1][0]
+
+    @staticmethod
+    def flux_index(chunk_size=1000, index=None):
+        """
+        (id, date_modification en ms ou None) de tous les documents, par id
+        croissant, par pages search_after (sans limite de profondeur).
+        """
+        client = ProductionDocument._get_connection()
+        index = index or ProductionDocument._index._name
+        position = None
+        while True:
+            extra = {'search_after': position} if position else {}
+            hits = client.search(
+                index=index, size=chunk_size, sort=[{'id': 'asc'}], source=False,
+                docvalue_fields=[{'field': 'date_modification', 'format': 'epoch_millis'}],
+                **extra
+            )['hits']['hits']
+            if not hits:
+                return
+            for hit in hits:
+                valeurs = hit.get('fields', {}).get('date_modification')
+                yield int(hit['_id']), int(float(valeurs[0])) if valeurs else None
+            position = hits[-1]['sort']
+
+    @staticmethod
+    def divergences(flux_base, flux_index):
+        """
+        Jointure par fusion de deux flux triés par id, à mémoire constante.
+
+        Yields:
+            tuple: (id, 'manquant' | 'perime' | 'orphelin', date base en ms ou None)
+        """
+        base, index = next(flux_base, None), next(flux_index, None)
+        while base is not None or index is not None:
+            if index is None or (base is not None and base[0] < index[0]):
+                yield base[0], 'manquant', base[1]
+                base = next(flux_base, None)
+            elif base is None or index[0] < base[0]:
+                yield index[0], 'orphelin', None
+                index = next(flux_index, None)
+            else:
+                if base[1] != index[1]:
+                    yield base[0], 'perime', base[1]
+                base, index = next(flux_base, None), next(flux_index, None)
+
+    @staticmethod
+    def verifier(chunk_size=1000, reparer=True, grace=None):
+        """
+        Compare la base et l'index, et répare les seuls documents divergents.
+
+        Les productions modifiées depuis moins de `grace` secondes (défaut :
+        SEARCH_SYNC['MAX_DELAY']) ou en attente dans la file de
+        synchronisation sont en transit : elles ne comptent pas comme dérive.
+
+        Returns:
+            dict: {'base', 'index', 'manquants', 'perimes', 'orphelins',
+            'en_transit', 'repares', 'erreurs', 'derive', 'duree'}
+        """
+        grace = getattr(settings, 'SEARCH_SYNC', {}).get('MAX_DELAY', 30) if grace is None else grace
+        limite = IndexationService.millis(timezone.now() - timedelta(seconds=grace))
+        stats = {
+            'base': 0, 'index': 0, 'manquants': 0, 'perimes': 0, 'orphelins': 0,
+            'en_transit': 0, 'repares': 0, 'erreurs': 0, 'derive': 0.0, 'duree': 0.0,
+        }
+        debut = time.monotonic()
+
+        def compter(flux, cle):
+            for element in flux:
+                stats[cle] += 1
+                yield element
+
+        lot = {}
+        flux = IndexationService.divergences(
+            compter(IndexationService.flux_base(chunk_size), 'base'),
+            compter(IndexationService.flux_index(chunk_size), 'index'),
+        )
+        for pk, etat, date_base in flux:
+            if date_base is not None and date_base >= limite:
+                stats['en_transit'] += 1
+                continue
+            lot[pk] = etat
+            if len(lot) >= chunk_size:
+                IndexationService._traiter_divergences(lot, stats, reparer, chunk_size)
+                lot = {}
+        if lot:
+            IndexationService._traiter_divergences(lot, stats, reparer, chunk_size)
+
+        stats['duree'] = time.monotonic() - debut
+        divergents = stats['manquants'] + stats['perimes'] + stats['orphelins']
+        stats['derive'] = divergents / max(stats['base'], 1)
+        return stats
+
+    @staticmethod
+    def _traiter_divergences(lot, stats, reparer, chunk_size):
+        """Écarte les entrées de la file, compte, puis réindexe ou supprime un lot de divergences"""
+        # Une entrée à tentatives épuisées n'est plus traitée par le worker : le contrôle la répare
+        max_attempts = getattr(settings, 'SEARCH_SYNC', {}).get('MAX_ATTEMPTS', 10)
+        en_attente = set(
+            IndexationEnAttente.objects.filter(
+                production_id__in=list(lot), tentatives__lt=max_attempts
+            ).values_list('production_id', flat=True)
+        )
+        stats['en_transit'] += len(en_attente)
+        lot = {pk: etat for pk, etat in lot.items() if pk not in en_attente}
+        for etat in lot.values():
+            stats[{'manquant': 'manquants', 'perime': 'perimes', 'orphelin': 'orphelins'}[etat]] += 1
+        if not reparer or not lot:
+            return
+
+        a_indexer = [pk for pk, etat in lot.items() if etat != 'orphelin']
+        if a_indexer:
+            resultat = IndexationService.indexer(
+                ProductionDocument().get_queryset().filter(pk__in=a_indexer), chunk_size=chunk_size, workers=1
+            )
+            stats['repares'] += resultat['indexes']
+            stats['erreurs'] += resultat['erreurs']
+
+        a_supprimer = [pk for pk, etat in lot.items() if etat == 'orphelin']
+        if a_supprimer:
+            # Par ids, sur tous les shards : le routage d'un orphelin n'est pas connu
+            resultat = ProductionDocument._get_connection().delete_by_query(
+                index=ProductionDocument._index._name,
+                query={'ids': {'values': a_supprimer}},
+                conflicts='proceed',
+            )
+            stats['repares'] += resultat['deleted']
+            if resultat.get('failures'):
+                stats['erreurs'] += len(resultat['failures'])
+                logger.error(f"Échec suppression documents orphelins : {resultat['failures']}")
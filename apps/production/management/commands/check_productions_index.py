@@ -0,0 +1,35 @@
+# apps/production/management/commands/check_productions_index.py
+from django.core.management.base import BaseCommand
+from apps.production.indexation import IndexationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les productions en base et dans Elasticsearch (id, date_modification) "
+        "et réindexe ou supprime les seuls documents divergents"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Ids lus par requête (défaut: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Mesurer la dérive sans réparer')
+        parser.add_argument('--grace', type=int, default=None,
+                            help="Secondes pendant lesquelles une modification récente n'est pas une dérive "
+                                 "(défaut: SEARCH_SYNC['MAX_DELAY'])")
+
+    def handle(self, *args, **options):
+        stats = IndexationService.verifier(
+            chunk_size=options['chunk_size'], reparer=not options['dry_run'], grace=options['grace']
+        )
+        self.stdout.write(f"Base : {stats['base']} productions, index : {stats['index']} documents")
+        self.stdout.write(
+            f"  {stats['manquants']} manquants, {stats['perimes']} périmés, {stats['orphelins']} orphelins, "
+            f"{stats['en_transit']} en transit"
+        )
+        self.stdout.write(f"  Dérive : {stats['derive']:.4%} en {stats['duree']:.1f}s")
+
+        if options['dry_run']:
+            self.stdout.write("Aucune réparation (--dry-run)")
+        elif stats['erreurs']:
+            self.stdout.write(self.style.ERROR(f"{stats['repares']} réparés, {stats['erreurs']} erreurs"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{stats['repares']} documents réparés"))
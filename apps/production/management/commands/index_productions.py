@@ -0,0 +1,45 @@
+# apps/production/management/commands/index_productions.py
+from django.core.management.base import BaseCommand
+from apps.production.documents import ProductionDocument
+from apps.production.indexation import IndexationService
+
+
+class Command(BaseCommand):
+    help = "Indexe toutes les productions dans Elasticsearch par lots (bulk API parallèle)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Productions par lot (défaut: 1000)')
+        parser.add_argument('--workers', type=int, default=4, help="Threads d'envoi bulk (défaut: 4)")
+        parser.add_argument('--index', help="Index cible (défaut: index du document)")
+        parser.add_argument('--create', action='store_true', help="Créer l'index s'il n'existe pas")
+
+    def handle(self, *args, **options):
+        if options['create']:
+            if options['index']:
+                index = ProductionDocument._index.clone(name=options['index'])
+                if not index.exists():
+                    index.create()
+                    self.stdout.write(f"Index {index._name} créé")
+            elif not IndexationService.index_physiques():
+                # Premier déploiement : index versionné derrière l'alias
+                index = IndexationService.creer_index_versionne()
+                IndexationService.finaliser_index(index)
+                IndexationService.basculer_alias(index)
+                self.stdout.write(f"Index {index} créé derrière l'alias {ProductionDocument._index._name}")
+
+        def progression(stats):
+            debit = stats['indexes'] / stats['duree'] if stats['duree'] else 0
+            self.stdout.write(f"  {stats['indexes']} indexées, {stats['erreurs']} erreurs ({debit:.0f} docs/s)")
+
+        stats = IndexationService.indexer(
+            index=options['index'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            on_progress=progression,
+        )
+
+        style = self.style.SUCCESS if not stats['erreurs'] else self.style.WARNING
+        self.stdout.write(style(
+            f"{stats['indexes']} productions indexées, {stats['erreurs']} erreurs "
+            f"en {stats['duree']:.1f}s ({stats['debit']:.0f} docs/s)"
+        ))
@@ -0,0 +1,46 @@
+# apps/production/management/commands/process_search_outbox.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.production.indexation import IndexationService
+
+
+class Command(BaseCommand):
+    help = "Applique en continu la file de synchronisation Elasticsearch (IndexationEnAttente)"
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'SEARCH_SYNC', {})
+        parser.add_argument('--once', action='store_true', help='Vider la file puis quitter')
+        parser.add_argument('--debounce', type=float, default=config.get('DEBOUNCE', 2),
+                            help='Secondes sans écriture avant envoi')
+        parser.add_argument('--max-delay', type=float, default=config.get('MAX_DELAY', 30),
+                            help="Attente maximale d'une entrée en secondes")
+        parser.add_argument('--batch-size', type=int, default=config.get('BATCH_SIZE', 500),
+                            help='Entrées par requête bulk')
+        parser.add_argument('--poll-interval', type=float, default=config.get('POLL_INTERVAL', 1.0),
+                            help='Pause entre deux lectures de la file vide')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Synchronisation Elasticsearch démarrée")
+        try:
+            while True:
+                close_old_connections()
+                stats = IndexationService.traiter_file(
+                    debounce=0 if options['once'] else options['debounce'],
+                    max_delay=options['max_delay'],
+                    batch_size=options['batch_size'],
+                )
+                traitees = stats['indexes'] + stats['supprimes'] + stats['erreurs']
+                if traitees:
+                    self.stdout.write(
+                        f"  {stats['indexes']} indexées, {stats['supprimes']} supprimées, {stats['erreurs']} erreurs"
+                    )
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Synchronisation Elasticsearch arrêtée"))
@@ -0,0 +1,17 @@
+# apps/production/management/commands/rebuild_ratings.py
+from django.core.management.base import BaseCommand
+from apps.production.services import RatingService
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les agrégats d'évaluation (nombre, total, moyenne) des productions et producteurs"
+
+    def handle(self, *args, **options):
+        productions, producteurs = RatingService.reconstruire()
+        self.stdout.write(self.style.SUCCESS(
+            f'Agrégats reconstruits : {productions} production(s), {producteurs} producteur(s) corrigé(s)'
+        ))
+        self.stdout.write(
+            "Les productions corrigées sont en file de synchronisation Elasticsearch "
+            "(service search_sync, ou python manage.py process_search_outbox --once)."
+        )
@@ -0,0 +1,16 @@
+# apps/production/management/commands/rebuild_stock.py
+from django.core.management.base import BaseCommand
+from apps.production.services import StockService
+
+
+class Command(BaseCommand):
+    help = "Reconstruit le stock réservé (quantite_reservee) des productions depuis les commandes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Productions corrigées par transaction')
+
+    def handle(self, *args, **options):
+        corrigees = StockService.reconstruire(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Registre de stock reconstruit : {corrigees} production(s) corrigée(s), mises en file de réindexation'
+        ))
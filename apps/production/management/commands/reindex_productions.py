@@ -0,0 +1,59 @@
+# apps/production/management/commands/reindex_productions.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.production.documents import ProductionDocument
+from apps.production.indexation import IndexationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit les productions dans un nouvel index versionné pendant que "
+        "l'ancien sert les recherches, puis bascule l'alias atomiquement"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Productions par lot (défaut: 1000)')
+        parser.add_argument('--workers', type=int, default=4, help="Threads d'envoi bulk (défaut: 4)")
+        parser.add_argument('--delete-old', action='store_true', help='Supprimer les anciens index après bascule')
+
+    def handle(self, *args, **options):
+        alias = ProductionDocument._index._name
+        client = ProductionDocument._get_connection()
+        anciens = IndexationService.index_physiques()
+        self.stdout.write(f"Alias {alias} -> {', '.join(anciens) or 'aucun index'}")
+
+        debut = timezone.now()
+        index = IndexationService.creer_index_versionne()
+        self.stdout.write(f"Index {index} créé (refresh désactivé, 0 réplique)")
+
+        stats = IndexationService.indexer(
+            index=index, chunk_size=options['chunk_size'], workers=options['workers']
+        )
+        self.stdout.write(
+            f"  {stats['indexes']} productions indexées, {stats['erreurs']} erreurs "
+            f"en {stats['duree']:.1f}s ({stats['debit']:.0f} docs/s)"
+        )
+        if stats['erreurs']:
+            client.indices.delete(index=index)
+            self.stdout.write(self.style.ERROR(f"Index {index} abandonné, l'alias n'a pas bougé"))
+            return
+
+        # Écritures faites pendant la construction (servies par l'ancien index)
+        reprise = timezone.now()
+        reindexees, supprimees = IndexationService.rejouer(index, debut, options['chunk_size'])
+        self.stdout.write(f"  Rattrapage : {reindexees} réindexées, {supprimees} supprimées")
+
+        IndexationService.finaliser_index(index)
+        precedents = IndexationService.basculer_alias(index)
+        self.stdout.write(self.style.SUCCESS(f"Alias {alias} -> {index}"))
+
+        # Écritures arrivées entre le rattrapage et la bascule : l'alias vise désormais le nouvel index
+        reindexees, supprimees = IndexationService.rejouer(index, reprise, options['chunk_size'])
+        self.stdout.write(f"  Rattrapage final : {reindexees} réindexées, {supprimees} supprimées")
+
+        if options['delete_old']:
+            for ancien in precedents:
+                client.indices.delete(index=ancien)
+                self.stdout.write(f"Index {ancien} supprimé")
+        elif precedents:
+            self.stdout.write(f"Anciens index conservés (retour arrière possible) : {', '.join(precedents)}")
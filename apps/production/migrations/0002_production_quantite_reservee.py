@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:29
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_quantite_reservee(apps, schema_editor):
+    """Initialise le registre depuis les commandes existantes"""
+    Production = apps.get_model('production', 'Production')
+    Commande = apps.get_model('production', 'Commande')
+
+    reservees = Commande.objects.filter(
+        production=OuterRef('pk'),
+        statut__in=['confirmee', 'en_preparation', 'expediee', 'livree']
+    ).values('production').annotate(total=Sum('quantite')).values('total')
+
+    Production.objects.update(
+        quantite_reservee=Coalesce(
+            Subquery(reservees, output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+            Decimal('0')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='production',
+            name='quantite_reservee',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RunPython(backfill_quantite_reservee, migrations.RunPython.noop),
+    ]
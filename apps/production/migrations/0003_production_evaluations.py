@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:30
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_evaluations(apps, schema_editor):
+    """Initialise les agrégats depuis les évaluations existantes"""
+    Evaluation = apps.get_model('production', 'Evaluation')
+    Production = apps.get_model('production', 'Production')
+    Producteur = apps.get_model('users', 'Producteur')
+
+    def agregats(**lien):
+        evaluations = Evaluation.objects.filter(**lien).order_by().values(*lien)
+        nombre = evaluations.annotate(n=Count('id')).values('n')
+        total = evaluations.annotate(t=Sum('note')).values('t')
+        return {
+            'nombre_evaluations': Coalesce(Subquery(nombre), 0),
+            'total_notes': Coalesce(Subquery(total), 0),
+            'note_moyenne': Cast(
+                Cast(Subquery(total), FloatField()) / Subquery(nombre),
+                models.DecimalField(max_digits=3, decimal_places=2)
+            ),
+        }
+
+    Production.objects.update(**agregats(commande__production=OuterRef('pk')))
+    Producteur.objects.update(**agregats(commande__production__producteur=OuterRef('pk')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0002_production_quantite_reservee'),
+        ('users', '0004_producteur_evaluations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='production',
+            name='nombre_evaluations',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='note_moyenne',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='total_notes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_evaluations, migrations.RunPython.noop),
+    ]
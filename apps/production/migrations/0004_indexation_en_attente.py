@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0003_production_evaluations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexationEnAttente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('production_id', models.BigIntegerField(unique=True)),
+                ('action', models.CharField(choices=[('index', 'Indexer'), ('delete', 'Supprimer')], default='index', max_length=10)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_modification', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Indexation en attente',
+                'verbose_name_plural': 'Indexations en attente',
+                'ordering': ['date_modification'],
+            },
+        ),
+    ]
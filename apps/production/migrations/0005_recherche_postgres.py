@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:44
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def index_recherche():
+    """Index de la recherche de secours (search_backends.PostgresSearchBackend)"""
+    return [
+        # Même expression que la requête : SearchVector('produit', 'description', config='french')
+        GinIndex(SearchVector('produit', 'description', config='french'), name='production_recherche_fts'),
+        GinIndex(fields=['produit'], opclasses=['gin_trgm_ops'], name='production_produit_trgm'),
+        GinIndex(fields=['description'], opclasses=['gin_trgm_ops'], name='production_description_trgm'),
+    ]
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Production = apps.get_model('production', 'Production')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index in index_recherche():
+        schema_editor.add_index(Production, index)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Production = apps.get_model('production', 'Production')
+    for index in index_recherche():
+        schema_editor.remove_index(Production, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0004_indexation_en_attente'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:47
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0005_recherche_postgres'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexationenattente',
+            name='percoler',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='RechercheSauvegardee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100)),
+                ('texte', models.CharField(blank=True, max_length=200)),
+                ('type_production', models.CharField(blank=True, choices=[('fruits', 'Fruits'), ('legumes', 'Légumes'), ('cereales', 'Céréales'), ('tubercules', 'Tubercules'), ('elevage', 'Élevage'), ('produits_transformes', 'Produits Transformés')], max_length=30)),
+                ('prix_max', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)])),
+                ('latitude', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True)),
+                ('rayon_km', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True, validators=[django.core.validators.MinValueValidator(0)])),
+                ('active', models.BooleanField(default=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recherches_sauvegardees', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recherche sauvegardée',
+                'verbose_name_plural': 'Recherches sauvegardées',
+                'ordering': ['-date_creation'],
+            },
+        ),
+    ]
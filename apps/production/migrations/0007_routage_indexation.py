@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0006_recherches_sauvegardees'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexationenattente',
+            name='routage',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
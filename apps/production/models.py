@@ -1,9 +1,14 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from apps.users.models import Producteur, CustomUser
 from decimal import Decimal
 from math import radians, cos, sin, asin, sqrt
 
+# Statuts de commande qui immobilisent du stock (quantite_reservee)
+STATUTS_RESERVES = ['confirmee', 'en_preparation', 'expediee', 'livree']
+
+
 class Production(models.Model):
     TYPE_CHOICES = [
         ('fruits', 'Fruits'),
@@ -35,6 +40,14 @@ class Production(models.Model):
     unite_mesure = models.CharField(max_length=20, choices=UNITE_CHOICES)
     prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     
+    # Registre de stock : maintenu par StockService à chaque changement de statut de commande
+    quantite_reservee = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)]
+    )
+    
     # Géolocalisation (sans PostGIS)
     latitude = models.DecimalField(max_digits=10, decimal_places=7, db_index=True)
     longitude = models.DecimalField(max_digits=10, decimal_places=7, db_index=True)
@@ -47,6 +60,11 @@ class Production(models.Model):
     description = models.TextField()
     conditions_stockage = models.TextField(blank=True)
     
+    # Agrégats d'évaluation : maintenus par RatingService
+    nombre_evaluations = models.PositiveIntegerField(default=0)
+    total_notes = models.PositiveIntegerField(default=0)
+    note_moyenne = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, db_index=True)
+    
     date_creation = models.DateTimeField(auto_now_add=True, db_index=True)
     date_modification = models.DateTimeField(auto_now=True)
     
@@ -62,21 +80,35 @@ class Production(models.Model):
     def __str__(self):
         return f"{self.produit} - {self.quantite}{self.unite_mesure}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs chargées : baisse de prix (alertes) et changement de clé de routage Elasticsearch
+        instance._valeurs_initiales = {
+            champ: valeur for champ, valeur in zip(field_names, values) if valeur is not models.DEFERRED
+        }
+        return instance
+    
+    def valeur_initiale(self, champ):
+        """Valeur lue en base (ou au dernier enregistrement), None si inconnue"""
+        return getattr(self, '_valeurs_initiales', {}).get(champ)
+    
+    def memoriser_valeurs(self, *champs):
+        """Fait des valeurs courantes les valeurs initiales, après enregistrement"""
+        self._valeurs_initiales = {
+            **getattr(self, '_valeurs_initiales', {}),
+            **{champ: getattr(self, champ) for champ in champs},
+        }
+    
     @property
-    def quantite_disponible(self):
-        """Quantité restante après commandes"""
-        commandes_validees = self.commandes.filter(
-            statut__in=['confirmee', 'en_preparation', 'expediee']
-        ).aggregate(total=models.Sum('quantite'))['total'] or 0
-        return self.quantite - commandes_validees
+    def prix_en_baisse(self):
+        initial = self.valeur_initiale('prix_unitaire')
+        return initial is not None and self.prix_unitaire < initial
     
     @property
-    def note_moyenne(self):
-        """Note moyenne des évaluations"""
-        evaluations = self.commandes.filter(evaluation__isnull=False)
-        if not evaluations.exists():
-            return None
-        return evaluations.aggregate(avg=models.Avg('evaluation__note'))['avg']
+    def quantite_disponible(self):
+        """Quantité restante après commandes"""
+        return self.quantite - self.quantite_reservee
 
 
 class PhotoProduction(models.Model):
@@ -187,3 +219,69 @@ class PhotoEvaluation(models.Model):
     image = models.ImageField(upload_to='evaluations/%Y/%m/')
     date_ajout = models.DateTimeField(auto_now_add=True)
 
+
+
+class IndexationEnAttente(models.Model):
+    """
+    File (outbox) des synchronisations Elasticsearch en attente.
+
+    Une ligne par production : les écritures successives sont fusionnées et
+    le worker process_search_outbox les applique par requêtes bulk. Pas de
+    clé étrangère, la ligne doit survivre à la suppression de la production.
+    """
+    ACTION_CHOICES = [
+        ('index', 'Indexer'),
+        ('delete', 'Supprimer'),
+    ]
+
+    production_id = models.BigIntegerField(unique=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='index')
+    # Création ou baisse de prix : à confronter aux recherches sauvegardées après indexation
+    percoler = models.BooleanField(default=False)
+    # Routage du document actuellement indexé, s'il diffère de celui de la production (ou suppression)
+    routage = models.CharField(max_length=100, blank=True)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    derniere_erreur = models.TextField(blank=True)
+
+    date_creation = models.DateTimeField(default=timezone.now)
+    date_modification = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['date_modification']
+        verbose_name = 'Indexation en attente'
+        verbose_name_plural = 'Indexations en attente'
+
+    def __str__(self):
+        return f"{self.action} production #{self.production_id}"
+
+
+class RechercheSauvegardee(models.Model):
+    """
+    Recherche enregistrée par un utilisateur : il est notifié de chaque
+    nouvelle production correspondante et de chaque baisse de prix.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='recherches_sauvegardees')
+    nom = models.CharField(max_length=100)
+    
+    # Critères (tous optionnels, combinés en ET)
+    texte = models.CharField(max_length=200, blank=True)
+    type_production = models.CharField(max_length=30, choices=Production.TYPE_CHOICES, blank=True)
+    prix_max = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, validators=[MinValueValidator(0)]
+    )
+    latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    rayon_km = models.DecimalField(
+        max_digits=6, decimal_places=2, null=True, blank=True, validators=[MinValueValidator(0)]
+    )
+    
+    active = models.BooleanField(default=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date_creation']
+        verbose_name = 'Recherche sauvegardée'
+        verbose_name_plural = 'Recherches sauvegardées'
+    
+    def __str__(self):
+        return f"{self.nom} - {self.user.email}"
@@ -0,0 +1,126 @@
+# apps/production/pagination.py
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django_elasticsearch_dsl_drf.pagination import QueryFriendlyPageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class SearchAfterPagination(QueryFriendlyPageNumberPagination):
+    """
+    Pagination par numéro de page, ou par curseur search_after dès que le
+    paramètre `cursor` est présent (vide pour la première page).
+
+    Le curseur opaque encode les valeurs de tri du dernier hit servi : chaque
+    page coûte le même prix quelle que soit sa profondeur, sans limite
+    max_result_window. Le tri de la requête est complété par (date_creation,
+    id) pour être déterministe. Avec `pit=true`, la première page ouvre un
+    point-in-time : les pages suivantes lisent le même instantané de l'index.
+    """
+    cursor_query_param = 'cursor'
+    pit_query_param = 'pit'
+    pit_keep_alive = '1m'
+    tiebreaker = ('-date_creation', '-id')
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, self.pit_id = self.decode_cursor(request)
+
+        search = queryset.sort(*self.get_sort(queryset)).extra(size=page_size + 1)
+        if position:
+            search = search.extra(search_after=position)
+
+        routage = search._params.get('routing')
+        if self.pit_id is None and str(request.query_params.get(self.pit_query_param, '')).lower() in ('1', 'true'):
+            self.pit_id = view.client.open_point_in_time(
+                index=view.index, keep_alive=self.pit_keep_alive, routing=routage
+            )['id']
+        if self.pit_id is not None:
+            # Avec un point-in-time, ni l'index ni le routage (fixé à l'ouverture) ne sont dans la recherche
+            search = search.index().params(routing=None).extra(pit={'id': self.pit_id, 'keep_alive': self.pit_keep_alive})
+
+        response = search.execute()
+        self.facets = getattr(response, 'aggregations', None)
+        self.pit_id = response.to_dict().get('pit_id', self.pit_id)
+
+        hits = list(response)
+        self.has_next = len(hits) > page_size
+        hits = hits[:page_size]
+        self.next_position = list(hits[-1].meta.sort) if self.has_next else None
+
+        if not self.has_next and self.pit_id is not None:
+            view.client.options(ignore_status=404).close_point_in_time(id=self.pit_id)
+        return hits
+
+    def get_sort(self, queryset):
+        """Tri demandé (pertinence par défaut) suivi du départage (date_creation, id)"""
+        sort = list(queryset.to_dict().get('sort', [])) or ['_score']
+
+        def nom(critere):
+            if isinstance(critere, dict):
+                return next(iter(critere))
+            return critere.lstrip('-')
+
+        presents = {nom(critere) for critere in sort}
+        return sort + [critere for critere in self.tiebreaker if nom(critere) not in presents]
+
+    # ==================== CURSEUR ====================
+
+    def encode_cursor(self, position, pit_id=None):
+        contenu = {'a': position}
+        if pit_id:
+            contenu['p'] = pit_id
+        # Sans remplissage '=' : le curseur reste sûr dans une URL
+        return base64.urlsafe_b64encode(json.dumps(contenu).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        """
+        Returns:
+            tuple: (valeurs search_after ou None, pit_id ou None)
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, None
+        try:
+            contenu = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            position = contenu['a']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        return position, contenu.get('p')
+
+    def get_next_link(self):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position, self.pit_id))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+
+        contenu = [('next', self.get_next_link())]
+        if hasattr(self.facets, '_d_'):
+            contenu.append(('facets', self.facets._d_))
+        contenu.append(('results', data))
+        return Response(OrderedDict(contenu))
+
+
+class FallbackPageNumberPagination(PageNumberPagination):
+    """Pages numérotées de la recherche de secours en base, mêmes paramètres que la recherche Elasticsearch"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,239 @@
+# apps/production/search_backends.py
+"""
+Backends de recherche des productions et disjoncteur (circuit breaker).
+
+Elasticsearch sert les recherches tant qu'il répond vite. Après
+SEARCH_CIRCUIT_BREAKER['ERROR_THRESHOLD'] incidents consécutifs (erreur de
+transport, erreur 5xx ou réponse plus lente que LATENCY_THRESHOLD_MS), le
+disjoncteur s'ouvre et les recherches passent par PostgreSQL pendant
+RESET_TIMEOUT secondes ; un seul appel d'essai décide ensuite de la
+refermeture. L'état est local au processus.
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import Q
+from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
+from elasticsearch import ApiError, TransportError
+from rest_framework.exceptions import ValidationError
+
+from .geo import bounding_box
+from .models import Production
+from .pagination import FallbackPageNumberPagination
+from .serializers import ProductionListSerializer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, 'SEARCH_CIRCUIT_BREAKER', {})
+
+
+def search_client():
+    """Client Elasticsearch des recherches, avec le délai maximal du disjoncteur"""
+    from .documents import ProductionDocument
+
+    return ProductionDocument._get_connection().options(
+        request_timeout=_config().get('REQUEST_TIMEOUT', 2)
+    )
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert autour d'un service distant"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    @staticmethod
+    def is_incident(exc):
+        """Panne du service (et non requête invalide du client)"""
+        if isinstance(exc, ApiError):
+            return exc.meta.status >= 500
+        return isinstance(exc, TransportError)
+
+    def call(self, fn, fallback):
+        """Exécute fn, ou fallback si le disjoncteur est ouvert ou si fn tombe en panne"""
+        if not self._allow():
+            return fallback()
+
+        debut = time.monotonic()
+        try:
+            result = fn()
+        except (ApiError, TransportError) as exc:
+            if not self.is_incident(exc):
+                self._record(success=True)
+                raise
+            logger.warning(f"{self.name} : incident ({exc.__class__.__name__}), bascule sur le secours")
+            self._record(success=False)
+            return fallback()
+        except Exception:
+            with self._lock:
+                self._trial_running = False
+            raise
+
+        duree_ms = (time.monotonic() - debut) * 1000
+        self._record(success=duree_ms <= _config().get('LATENCY_THRESHOLD_MS', 800))
+        return result
+
+    def _allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= _config().get('RESET_TIMEOUT', 30):
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def _record(self, success):
+        with self._lock:
+            self._trial_running = False
+            if success:
+                if self.state != self.CLOSED:
+                    logger.info(f"{self.name} : disjoncteur refermé")
+                self.state, self.failures = self.CLOSED, 0
+                return
+
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= _config().get('ERROR_THRESHOLD', 5):
+                if self.state != self.OPEN:
+                    logger.error(f"{self.name} : disjoncteur ouvert après {self.failures} incidents")
+                self.state, self._opened_at = self.OPEN, time.monotonic()
+
+
+elasticsearch_breaker = CircuitBreaker('Elasticsearch')
+
+
+# ==================== BACKENDS ====================
+
+class ElasticsearchSearchBackend:
+    """Chaîne complète django_elasticsearch_dsl_drf (filtres, facettes, curseur)"""
+    name = 'elasticsearch'
+
+    def search(self, view, request):
+        return DocumentViewSet.list(view, request)
+
+
+class PostgresSearchBackend:
+    """
+    Secours en base : plein texte (SearchVector + trigrammes sur produit),
+    filtres exacts, bbox pour localisation__geo_distance, pages numérotées.
+    Ni facettes ni curseur. Hors PostgreSQL, le texte passe par icontains.
+    """
+    name = 'postgresql'
+    filter_fields = ('type_production', 'certification', 'unite_mesure')
+    ordering_fields = ('prix_unitaire', 'date_creation', 'note_moyenne')
+    range_lookups = ('gt', 'gte', 'lt', 'lte')
+
+    def search(self, view, request):
+        queryset = self.filter_queryset(request.query_params)
+        paginator = FallbackPageNumberPagination()
+        page = paginator.paginate_queryset(queryset, request, view)
+        serializer = ProductionListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    def filter_queryset(self, params):
+        queryset = Production.objects.select_related('producteur__user').prefetch_related('photos')
+        ordering = ['-date_creation', '-id']
+
+        terme = params.get('search', '').strip()
+        if terme:
+            if connection.vendor == 'postgresql':
+                # Même expression que l'index GIN production_recherche_fts
+                vecteur = SearchVector('produit', 'description', config='french')
+                requete = SearchQuery(terme, config='french', search_type='websearch')
+                queryset = queryset.annotate(
+                    recherche=vecteur,
+                    rang=SearchRank(vecteur, requete),
+                    similarite=TrigramSimilarity('produit', terme),
+                ).filter(Q(recherche=requete) | Q(produit__trigram_similar=terme))
+                ordering = ['-rang', '-similarite', '-id']
+            else:
+                queryset = queryset.filter(Q(produit__icontains=terme) | Q(description__icontains=terme))
+
+        for champ in self.filter_fields:
+            if params.get(champ):
+                queryset = queryset.filter(**{champ: params[champ]})
+        if params.get('disponible'):
+            queryset = queryset.filter(disponible=params['disponible'].lower() in ('1', 'true'))
+
+        for lookup in ('', *(f'__{nom}' for nom in self.range_lookups)):
+            valeur = params.get(f'note_moyenne{lookup}')
+            if valeur:
+                queryset = queryset.filter(**{f'note_moyenne{lookup or "__exact"}': self._nombre(valeur)})
+
+        if params.get('localisation__geo_distance'):
+            queryset = self._bbox(queryset, params['localisation__geo_distance'])
+
+        demandes = [champ.strip() for champ in params.get('ordering', '').split(',') if champ.strip()]
+        demandes = [champ for champ in demandes if champ.lstrip('-') in self.ordering_fields]
+        return queryset.order_by(*demandes, '-id') if demandes else queryset.order_by(*ordering)
+
+    @staticmethod
+    def _nombre(valeur):
+        try:
+            return float(valeur)
+        except ValueError:
+            raise ValidationError({'error': f'Nombre invalide : {valeur}'})
+
+    def _bbox(self, queryset, valeur):
+        """Format django_elasticsearch_dsl_drf : <distance><unité>__<lat>__<lon>"""
+        try:
+            distance, lat, lon = valeur.split('__')[:3]
+            nombre, unite = re.fullmatch(r'([\d.]+)\s*(km|m)?', distance).groups()
+            rayon_km = float(nombre) / 1000 if unite == 'm' else float(nombre)
+            lat, lon = float(lat), float(lon)
+        except (ValueError, AttributeError):
+            raise ValidationError({'error': 'localisation__geo_distance attendu : 10km__<lat>__<lon>'})
+
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, rayon_km)
+        queryset = queryset.filter(latitude__range=(min_lat, max_lat))
+        if min_lon is not None:
+            queryset = queryset.filter(longitude__range=(min_lon, max_lon))
+        return queryset
+
+
+class FallbackSearch:
+    """
+    Route vers le backend primaire tant que le disjoncteur le permet.
+
+    Un backend expose `name` (en-tête X-Search-Backend) et
+    search(view, request), qui renvoie la Response paginée de ProductionSearchViewSet.
+    """
+
+    def __init__(self, primary, fallback, breaker):
+        self.primary = primary
+        self.fallback = fallback
+        self.breaker = breaker
+
+    def search(self, view, request):
+        return self.breaker.call(
+            lambda: self._serve(self.primary, view, request),
+            lambda: self._serve(self.fallback, view, request),
+        )
+
+    @staticmethod
+    def _serve(backend, view, request):
+        response = backend.search(view, request)
+        response['X-Search-Backend'] = backend.name
+        return response
+
+
+production_search = FallbackSearch(ElasticsearchSearchBackend(), PostgresSearchBackend(), elasticsearch_breaker)
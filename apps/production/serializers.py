@@ -1,7 +1,7 @@
 # apps/production/serializers.py
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
-from .models import PhotoEvaluation, Production, PhotoProduction, Commande, Paiement, Evaluation
+from .models import PhotoEvaluation, Production, PhotoProduction, Commande, Paiement, Evaluation, RechercheSauvegardee
 
 
 class ProductionCreateWithRoleSerializer(serializers.ModelSerializer):
@@ -111,12 +111,39 @@ class ProductionListSerializer(serializers.ModelSerializer):
         ]
     
     def get_photo_principale(self, obj):
-        if hasattr(obj, "photos"):  # Cas d'un objet Django ORM
-            photo = obj.photos.first()
-            if photo:
-                return photo.image.url
-        # Cas d'un Hit Elastic
-        return getattr(obj, "photo_principale", None)
+        # .all() réutilise le cache prefetch_related('photos'), déjà trié par ordre
+        photos = obj.photos.all()
+        return photos[0].image.url if photos else None
+
+
+class ProductionHitSerializer(serializers.Serializer):
+    """
+    Hit Elasticsearch de ProductionDocument, lu directement dans _source :
+    mêmes champs que ProductionListSerializer, aucune requête en base.
+    """
+    id = serializers.IntegerField(read_only=True)
+    produit = serializers.CharField(read_only=True)
+    type_production = serializers.CharField(read_only=True)
+    quantite = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    quantite_disponible = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    unite_mesure = serializers.CharField(read_only=True)
+    prix_unitaire = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    disponible = serializers.BooleanField(read_only=True)
+    date_recolte = serializers.ReadOnlyField()
+    certification = serializers.CharField(read_only=True)
+    producteur_nom = serializers.CharField(read_only=True)
+    photo_principale = serializers.CharField(read_only=True, allow_null=True)
+    note_moyenne = serializers.FloatField(read_only=True, allow_null=True)
+    latitude = serializers.FloatField(read_only=True)
+    longitude = serializers.FloatField(read_only=True)
+    date_creation = serializers.ReadOnlyField()
+
+
+class ProductionNearbySerializer(ProductionListSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+    
+    class Meta(ProductionListSerializer.Meta):
+        fields = ProductionListSerializer.Meta.fields + ['distance_km']
 
 
 class ProductionDetailSerializer(serializers.ModelSerializer):
@@ -128,7 +155,10 @@ class ProductionDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Production
         fields = '__all__'
-        read_only_fields = ['producteur', 'date_creation', 'date_modification']
+        read_only_fields = [
+            'producteur', 'quantite_reservee', 'nombre_evaluations', 'total_notes',
+            'date_creation', 'date_modification'
+        ]
     
     def get_producteur(self, obj):
         return {
@@ -146,9 +176,18 @@ class CommandeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Commande
         fields = '__all__'
-        read_only_fields = ['client', 'montant_total', 'date_creation', 
+        # statut : transitions par les actions confirm/cancel/..., qui tiennent le registre de stock
+        read_only_fields = ['client', 'statut', 'montant_total', 'date_creation', 
                            'date_confirmation', 'date_expedition', 'date_livraison']
     
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # Le stock réservé dépend de la production et de la quantité : figées après création
+            for name in ('production', 'quantite'):
+                fields[name].read_only = True
+        return fields
+    
     def validate(self, attrs):
         production = attrs.get('production')
         quantite = attrs.get('quantite')
@@ -178,6 +217,13 @@ class EvaluationSerializer(serializers.ModelSerializer):
         fields = ['id', 'commande', 'note', 'commentaire', 'photos', 'date_creation']
         read_only_fields = ['id', 'date_creation']
     
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # Les agrégats sont tenus par production : une évaluation ne change pas de commande
+            fields['commande'].read_only = True
+        return fields
+    
     def create(self, validated_data):
         photos_data = validated_data.pop('photos', [])
         evaluation = Evaluation.objects.create(**validated_data)
@@ -185,4 +231,30 @@ class EvaluationSerializer(serializers.ModelSerializer):
         for photo in photos_data:
             PhotoEvaluation.objects.create(evaluation=evaluation, image=photo)
         
-        return evaluation
\ No newline at end of file
+        return evaluation
+
+
+class RechercheSauvegardeeSerializer(serializers.ModelSerializer):
+    """Recherche sauvegardée : au moins un critère, centre et rayon fournis ensemble"""
+    
+    class Meta:
+        model = RechercheSauvegardee
+        fields = [
+            'id', 'nom', 'texte', 'type_production', 'prix_max',
+            'latitude', 'longitude', 'rayon_km', 'active', 'date_creation'
+        ]
+        read_only_fields = ['id', 'date_creation']
+    
+    def validate(self, attrs):
+        donnees = {
+            champ: attrs.get(champ, getattr(self.instance, champ, None))
+            for champ in ('texte', 'type_production', 'prix_max', 'latitude', 'longitude', 'rayon_km')
+        }
+        
+        zone = [donnees['latitude'], donnees['longitude'], donnees['rayon_km']]
+        if any(valeur is not None for valeur in zone) and any(valeur is None for valeur in zone):
+            raise ValidationError({'error': 'latitude, longitude et rayon_km vont ensemble'})
+        
+        if not any(valeur not in (None, '') for valeur in donnees.values()):
+            raise ValidationError({'error': 'Au moins un critère de recherche est requis'})
+        return attrs
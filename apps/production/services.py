@@ -0,0 +1,502 @@
+# apps/production/services.py
+import unicodedata
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, Count, DecimalField, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+from elasticsearch.helpers import scan
+from apps.notifications.services import NotificationService
+from apps.users.models import Producteur
+from .geo import count_tiles_in_bbox, parent_tile, tile_bounds, tiles_in_bbox
+from .indexation import IndexationService
+from .search_backends import elasticsearch_breaker, search_client
+from .models import Production, Commande, Evaluation, STATUTS_RESERVES
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StockService:
+    """Registre de stock : Production.quantite_reservee suit le statut des commandes"""
+
+    @staticmethod
+    def changer_statut(commande, statut, **dates):
+        """
+        Applique une transition de statut et ajuste le stock réservé dans la
+        même transaction.
+
+        La réservation passe par un UPDATE conditionnel
+        (quantite >= quantite_reservee + q) : deux confirmations concurrentes
+        ne peuvent pas dépasser le stock déclaré.
+
+        Args:
+            commande: Instance Commande
+            statut: Nouveau statut (voir Commande.STATUT_CHOICES)
+            **dates: Champs date à renseigner (date_confirmation, ...)
+
+        Returns:
+            tuple: (succès: bool, message_erreur: str)
+        """
+        with transaction.atomic():
+            # Verrou sur la commande : le statut de départ ne peut pas changer sous nos pieds
+            statut_actuel = Commande.objects.select_for_update().values_list(
+                'statut', flat=True
+            ).get(pk=commande.pk)
+
+            delta = (
+                (statut in STATUTS_RESERVES) - (statut_actuel in STATUTS_RESERVES)
+            ) * commande.quantite
+
+            productions = Production.objects.filter(pk=commande.production_id)
+            if delta > 0:
+                reservee = productions.filter(
+                    quantite__gte=F('quantite_reservee') + delta
+                ).update(quantite_reservee=F('quantite_reservee') + delta, date_modification=timezone.now())
+                if not reservee:
+                    production = productions.get()
+                    return False, f'Stock insuffisant. Quantité disponible: {production.quantite_disponible}'
+            elif delta < 0:
+                productions.update(quantite_reservee=F('quantite_reservee') + delta, date_modification=timezone.now())
+
+            if delta:
+                # quantite_disponible est dénormalisée dans l'index de recherche
+                IndexationService.enfiler([commande.production_id])
+
+            commande.statut = statut
+            for champ, valeur in dates.items():
+                setattr(commande, champ, valeur)
+            commande.save(update_fields=['statut', *dates])
+
+        if delta:
+            logger.info(f"Stock production #{commande.production_id} : réservé {delta:+}")
+
+        return True, ''
+
+    @staticmethod
+    def supprimer(commande):
+        """Supprime une commande et libère le stock qu'elle réservait, dans la même transaction"""
+        with transaction.atomic():
+            statut = Commande.objects.select_for_update().values_list('statut', flat=True).get(pk=commande.pk)
+            if statut in STATUTS_RESERVES:
+                Production.objects.filter(pk=commande.production_id).update(
+                    quantite_reservee=F('quantite_reservee') - commande.quantite, date_modification=timezone.now()
+                )
+                IndexationService.enfiler([commande.production_id])
+            commande.delete()
+
+    @staticmethod
+    def reconstruire(chunk_size=1000):
+        """
+        Recalcule quantite_reservee depuis les commandes (même calcul que la
+        migration 0002).
+
+        Seules les productions divergentes sont modifiées : leur
+        date_modification est avancée et elles sont mises en file
+        d'indexation, comme après une écriture ordinaire.
+
+        Returns:
+            int: productions corrigées
+        """
+        reservees = Commande.objects.filter(
+            production=OuterRef('pk'), statut__in=STATUTS_RESERVES
+        ).order_by().values('production').annotate(total=Sum('quantite')).values('total')
+        calculee = Coalesce(
+            Subquery(reservees, output_field=DecimalField(max_digits=10, decimal_places=2)), Decimal('0')
+        )
+
+        divergentes = list(
+            Production.objects.annotate(calculee=calculee)
+            .exclude(quantite_reservee=F('calculee'))
+            .values_list('pk', flat=True)
+        )
+        for start in range(0, len(divergentes), chunk_size):
+            ids = divergentes[start:start + chunk_size]
+            with transaction.atomic():
+                Production.objects.filter(pk__in=ids).update(
+                    quantite_reservee=calculee, date_modification=timezone.now()
+                )
+                IndexationService.enfiler(ids)
+
+        logger.info(f"Registre de stock reconstruit : {len(divergentes)} production(s) corrigée(s)")
+        return len(divergentes)
+
+
+class RatingService:
+    """Agrégats d'évaluation (nombre, total, moyenne) sur Production et Producteur"""
+
+    @staticmethod
+    def _moyenne(total, nombre):
+        return Cast(
+            Cast(total, FloatField()) / NullIf(nombre, 0),
+            DecimalField(max_digits=3, decimal_places=2)
+        )
+
+    @staticmethod
+    def _appliquer(evaluation, delta_nombre, delta_note):
+        """
+        Applique un delta aux agrégats de la production et du producteur.
+
+        Un seul UPDATE par table, calculé à partir des valeurs en base : pas de
+        lecture-modification-écriture concurrente.
+        """
+        production = evaluation.commande.production
+
+        with transaction.atomic():
+            # date_modification : update() ne déclenche pas auto_now, la réindexation blue/green en dépend
+            cibles = (
+                (Production, production.pk, {'date_modification': timezone.now()}),
+                (Producteur, production.producteur_id, {}),
+            )
+            for model, pk, extra in cibles:
+                model.objects.filter(pk=pk).update(
+                    nombre_evaluations=F('nombre_evaluations') + delta_nombre,
+                    total_notes=F('total_notes') + delta_note,
+                    note_moyenne=RatingService._moyenne(
+                        F('total_notes') + delta_note, F('nombre_evaluations') + delta_nombre
+                    ),
+                    **extra
+                )
+
+            # update() ne déclenche pas post_save : mise en file explicite
+            IndexationService.enfiler([production.pk])
+
+    @staticmethod
+    def enregistrer(evaluation):
+        """Ajoute une évaluation aux agrégats de sa production et de son producteur"""
+        RatingService._appliquer(evaluation, 1, evaluation.note)
+
+    @staticmethod
+    def modifier(evaluation, ancienne_note):
+        """Reporte un changement de note ; à appeler dans la transaction de l'écriture"""
+        if evaluation.note != ancienne_note:
+            RatingService._appliquer(evaluation, 0, evaluation.note - ancienne_note)
+
+    @staticmethod
+    def supprimer(evaluation):
+        """Supprime une évaluation et la retire des agrégats, dans la même transaction"""
+        with transaction.atomic():
+            note = Evaluation.objects.select_for_update().values_list('note', flat=True).get(pk=evaluation.pk)
+            RatingService._appliquer(evaluation, -1, -note)
+            evaluation.delete()
+
+    @staticmethod
+    def _divergents(queryset, calcul):
+        """Clés des lignes dont un agrégat (nombre, total ou moyenne) diffère du calcul"""
+        a_jour = Case(
+            When(
+                Q(nombre_evaluations=F('nombre_calcule'), total_notes=F('total_calcule'))
+                & (Q(note_moyenne=F('moyenne_calculee')) | Q(note_moyenne__isnull=True, nombre_calcule=0)),
+                then=Value(True)
+            ),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+        return list(
+            queryset.annotate(
+                nombre_calcule=calcul['nombre_evaluations'],
+                total_calcule=calcul['total_notes'],
+                moyenne_calculee=calcul['note_moyenne'],
+            ).annotate(a_jour=a_jour).filter(a_jour=False).values_list('pk', flat=True)
+        )
+
+    @staticmethod
+    def reconstruire(chunk_size=1000):
+        """
+        Recalcule tous les agrégats depuis les évaluations.
+
+        Seules les lignes divergentes sont réécrites. Les productions
+        corrigées voient leur date_modification avancée et sont mises en file
+        d'indexation : les notes rejoignent Elasticsearch par le flux ordinaire.
+
+        Returns:
+            tuple: (productions corrigées, producteurs corrigés)
+        """
+        def agregats(**lien):
+            evaluations = Evaluation.objects.filter(**lien).order_by().values(*lien)
+            nombre = evaluations.annotate(n=Count('id')).values('n')
+            total = evaluations.annotate(t=Sum('note')).values('t')
+            return {
+                'nombre_evaluations': Coalesce(Subquery(nombre), 0),
+                'total_notes': Coalesce(Subquery(total), 0),
+                'note_moyenne': RatingService._moyenne(Subquery(total), Subquery(nombre)),
+            }
+
+        calcul = agregats(commande__production=OuterRef('pk'))
+        productions = RatingService._divergents(Production.objects.all(), calcul)
+        for start in range(0, len(productions), chunk_size):
+            ids = productions[start:start + chunk_size]
+            with transaction.atomic():
+                Production.objects.filter(pk__in=ids).update(**calcul, date_modification=timezone.now())
+                IndexationService.enfiler(ids)
+
+        calcul = agregats(commande__production__producteur=OuterRef('pk'))
+        producteurs = RatingService._divergents(Producteur.objects.all(), calcul)
+        for start in range(0, len(producteurs), chunk_size):
+            Producteur.objects.filter(pk__in=producteurs[start:start + chunk_size]).update(**calcul)
+
+        logger.info(
+            f"Agrégats d'évaluation reconstruits : {len(productions)} production(s), "
+            f"{len(producteurs)} producteur(s) corrigé(s)"
+        )
+        return len(productions), len(producteurs)
+
+
+class SuggestionService:
+    """Suggestions de recherche (autocomplétion) sur les noms de produit et les catégories"""
+
+    @staticmethod
+    def _normaliser(texte):
+        sans_accents = unicodedata.normalize('NFKD', texte).encode('ascii', 'ignore').decode()
+        return ' '.join(sans_accents.lower().split())
+
+    @staticmethod
+    def _produits(prefixe, taille):
+        """
+        Noms de produit distincts via le completion suggester (aucun hit, aucun score).
+
+        Une option porte l'entrée qui a correspondu (un mot du nom) : le nom
+        complet est lu dans son _source, et les doublons retirés ici.
+        """
+        from .documents import ProductionDocument
+
+        search = ProductionDocument.search(using=search_client()).extra(size=0).source(
+            includes=['produit']
+        ).suggest(
+            'produits', prefixe,
+            completion={
+                'field': 'produit_suggest',
+                # Marge pour les productions homonymes, dédoublonnées ci-dessous
+                'size': taille * 3,
+                'contexts': {'disponible': ['true']},
+            }
+        )
+        options = search.execute().suggest.produits[0].options
+        produits = dict.fromkeys(option._source.produit for option in options)
+        return list(produits)[:taille]
+
+    @staticmethod
+    def _produits_base(prefixe, taille):
+        """Secours pendant une panne Elasticsearch : préfixe SQL, sans repli des accents"""
+        return list(
+            Production.objects.filter(disponible=True, produit__istartswith=prefixe)
+            .order_by('produit').values_list('produit', flat=True).distinct()[:taille]
+        )
+
+    @staticmethod
+    def suggerer(prefixe):
+        """
+        Produits et catégories commençant par `prefixe`.
+
+        Les préfixes fréquents sont servis depuis le cache pendant
+        PRODUCTION_SUGGEST['CACHE_TTL'] secondes.
+
+        Returns:
+            dict: {'produits': [str], 'categories': [{'value', 'label'}]}
+        """
+        config = getattr(settings, 'PRODUCTION_SUGGEST', {})
+        prefixe = SuggestionService._normaliser(prefixe)[:50]
+        if not prefixe:
+            return {'produits': [], 'categories': []}
+
+        cle = f"production_suggest:{prefixe}"
+        suggestions = cache.get(cle)
+        if suggestions is None:
+            suggestions = {
+                'produits': elasticsearch_breaker.call(
+                    lambda: SuggestionService._produits(prefixe, config.get('SIZE', 8)),
+                    lambda: SuggestionService._produits_base(prefixe, config.get('SIZE', 8)),
+                ),
+                'categories': [
+                    {'value': value, 'label': label}
+                    for value, label in Production.TYPE_CHOICES
+                    if SuggestionService._normaliser(label).startswith(prefixe)
+                ],
+            }
+            cache.set(cle, suggestions, config.get('CACHE_TTL', 60))
+        return suggestions
+
+
+class ClusterService:
+    """
+    Regroupement cartographique des productions disponibles.
+
+    Le viewport est découpé en tuiles z/x/y ; chaque tuile est mise en cache
+    avec ses clusters, et les tuiles manquantes sont calculées ensemble par une
+    seule agrégation geotile_grid (précision niveau de tuile + PRECISION_OFFSET)
+    avec le barycentre (geo_centroid) de chaque cellule.
+    """
+    # Cellules au plus par agrégation : au-delà, la réponse est tronquée
+    MAX_CELLULES = 10000
+
+    @staticmethod
+    def _cle(niveau, x, y, precision, type_production):
+        return f"production_clusters:{type_production or '*'}:{precision}:{niveau}/{x}/{y}"
+
+    @staticmethod
+    def _interroger(tuiles, niveau, precision, type_production):
+        """
+        Returns:
+            tuple: ({(x, y): [{'lat', 'lon', 'count'}, ...]} pour chaque tuile
+            demandée, tronqué: bool)
+        """
+        from .documents import ProductionDocument
+
+        bornes = [tile_bounds(x, y, niveau) for x, y in tuiles]
+        search = ProductionDocument.search(using=search_client()).extra(size=0).filter(
+            'term', disponible=True
+        ).filter('geo_bounding_box', localisation={
+            'top_left': {'lat': max(b[1] for b in bornes), 'lon': min(b[2] for b in bornes)},
+            'bottom_right': {'lat': min(b[0] for b in bornes), 'lon': max(b[3] for b in bornes)},
+        })
+        if type_production:
+            search = search.filter('term', **{'type_production.raw': type_production})
+            if ProductionDocument.routing_field() == 'type_production':
+                search = search.params(routing=ProductionDocument.cle_routage(type_production))
+        search.aggs.bucket(
+            'cellules', 'geotile_grid', field='localisation', precision=precision,
+            size=ClusterService.MAX_CELLULES
+        ).metric('centre', 'geo_centroid', field='localisation')
+
+        cellules = search.execute().aggregations.cellules
+        tronque = len(cellules.buckets) >= ClusterService.MAX_CELLULES \
+            or bool(getattr(cellules, 'sum_other_doc_count', 0))
+        if tronque:
+            logger.warning(f"Clusters tronqués : plus de {ClusterService.MAX_CELLULES} cellules au niveau {niveau}")
+
+        clusters = {tuile: [] for tuile in tuiles}
+        for cellule in cellules.buckets:
+            _, x, y = map(int, cellule.key.split('/'))
+            tuile = parent_tile(x, y, precision, niveau)
+            # Le rectangle englobant peut déborder sur des tuiles déjà en cache
+            if tuile in clusters:
+                clusters[tuile].append({
+                    'lat': round(cellule.centre.location.lat, 6),
+                    'lon': round(cellule.centre.location.lon, 6),
+                    'count': cellule.doc_count,
+                })
+        return clusters, tronque
+
+    @staticmethod
+    def clusters(min_lat, max_lat, min_lon, max_lon, zoom, type_production=None):
+        """
+        Clusters du viewport au niveau de zoom de la carte.
+
+        Returns:
+            dict: {'zoom', 'precision', 'total', 'tronque', 'clusters'}, ou
+            None si Elasticsearch est indisponible
+        """
+        config = getattr(settings, 'PRODUCTION_CLUSTERS', {})
+
+        # Tuiles de cache plus grossières si le viewport en couvre trop : le
+        # niveau est choisi sur le nombre de tuiles avant de construire la liste
+        niveau = zoom
+        while count_tiles_in_bbox(min_lat, max_lat, min_lon, max_lon, niveau) > config.get('MAX_TILES', 64) \
+                and niveau > 0:
+            niveau -= 1
+        tuiles = tiles_in_bbox(min_lat, max_lat, min_lon, max_lon, niveau)
+        # Précision suivant le niveau effectif : le nombre de cellules reste borné par MAX_TILES
+        precision = min(niveau + config.get('PRECISION_OFFSET', 3), 29)
+
+        cles = {tuile: ClusterService._cle(niveau, *tuile, precision, type_production) for tuile in tuiles}
+        en_cache = cache.get_many(cles.values())
+        manquantes = [tuile for tuile in tuiles if cles[tuile] not in en_cache]
+        tronque = False
+
+        if manquantes:
+            resultat = elasticsearch_breaker.call(
+                lambda: ClusterService._interroger(manquantes, niveau, precision, type_production),
+                lambda: None,
+            )
+            if resultat is None:
+                return None
+            calculees, tronque = resultat
+            nouvelles = {cles[tuile]: calculees[tuile] for tuile in manquantes}
+            # Des tuiles incomplètes ne sont pas servies depuis le cache
+            if not tronque:
+                cache.set_many(nouvelles, config.get('CACHE_TTL', 60))
+            en_cache.update(nouvelles)
+
+        clusters = [cluster for tuile in tuiles for cluster in en_cache[cles[tuile]]]
+        return {
+            'zoom': zoom,
+            'precision': precision,
+            'total': sum(cluster['count'] for cluster in clusters),
+            'tronque': tronque,
+            'clusters': clusters,
+        }
+
+
+class AlerteService:
+    """Confrontation des productions aux recherches sauvegardées (percolator)"""
+
+    @staticmethod
+    def document(production):
+        """Document percolé, au mapping de RechercheSauvegardeeDocument"""
+        return {
+            'produit': production.produit,
+            'description': production.description,
+            'type_production': production.type_production,
+            'prix_unitaire': float(production.prix_unitaire),
+            'localisation': {'lat': float(production.latitude), 'lon': float(production.longitude)},
+        }
+
+    @staticmethod
+    def correspondances(productions):
+        """
+        Recherches actives correspondant à chaque production, en une seule
+        requête percolate pour tout le lot.
+
+        Returns:
+            dict: {(production_id, user_id): [ids des recherches]}, sans les
+            recherches du producteur sur ses propres productions
+        """
+        from .documents import RechercheSauvegardeeDocument
+
+        requete = {
+            '_source': ['user_id'],
+            'query': {'bool': {
+                'must': [{'percolate': {
+                    'field': 'query',
+                    'documents': [AlerteService.document(production) for production in productions],
+                }}],
+                'filter': [{'term': {'active': True}}],
+            }},
+        }
+        resultats = {}
+        for hit in scan(
+            RechercheSauvegardeeDocument._get_connection(),
+            index=RechercheSauvegardeeDocument._index._name,
+            query=requete,
+        ):
+            user_id = hit['_source']['user_id']
+            for slot in hit.get('fields', {}).get('_percolator_document_slot', []):
+                production = productions[slot]
+                if production.producteur.user_id == user_id:
+                    continue
+                resultats.setdefault((production.pk, user_id), []).append(int(hit['_id']))
+        return resultats
+
+    @staticmethod
+    def percoler(productions):
+        """
+        Notifie les propriétaires des recherches correspondant aux productions,
+        une notification par (utilisateur, production), créées en un seul lot.
+
+        Returns:
+            int: Nombre de notifications créées
+        """
+        productions = list(productions)
+        if not productions:
+            return 0
+        par_id = {production.pk: production for production in productions}
+        correspondances = [
+            (par_id[production_id], user_id, recherche_ids)
+            for (production_id, user_id), recherche_ids in AlerteService.correspondances(productions).items()
+        ]
+        return len(NotificationService.notify_consommateurs_productions(correspondances))
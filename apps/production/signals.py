@@ -0,0 +1,110 @@
+# apps/production/signals.py
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django_elasticsearch_dsl.apps import DEDConfig
+from django_elasticsearch_dsl.signals import RealTimeSignalProcessor
+from .models import Production
+from .spatial_index import production_index
+
+
+@receiver(post_save, sender=Production)
+def update_spatial_index(sender, instance, **kwargs):
+    """Répercute création/modification dans l'index spatial après commit"""
+    transaction.on_commit(lambda: production_index.upsert(instance))
+
+
+@receiver(post_delete, sender=Production)
+def remove_from_spatial_index(sender, instance, **kwargs):
+    production_id = instance.pk
+    transaction.on_commit(lambda: production_index.remove(production_id))
+
+
+class OutboxSignalProcessor(RealTimeSignalProcessor):
+    """
+    Synchronisation Elasticsearch différée (ELASTICSEARCH_DSL_SIGNAL_PROCESSOR).
+
+    Les écritures sur Production et ses modèles liés sont consignées dans
+    IndexationEnAttente, dans la transaction de la requête, au lieu d'appeler
+    Elasticsearch : le worker process_search_outbox les regroupe et les
+    applique par requêtes bulk. Les autres documents éventuels gardent la
+    synchronisation immédiate.
+    """
+
+    @staticmethod
+    def _concerne(instance):
+        from .documents import ProductionDocument
+
+        return isinstance(instance, Production) or instance.__class__ in ProductionDocument.django.related_models
+
+    @classmethod
+    def _productions(cls, instance):
+        """Ids des productions à réindexer, None si l'instance ne concerne pas ProductionDocument"""
+        from .documents import ProductionDocument
+
+        if not cls._concerne(instance):
+            return None
+        if isinstance(instance, Production):
+            return [instance.pk]
+
+        try:
+            related = ProductionDocument().get_instances_from_related(instance)
+        except ObjectDoesNotExist:
+            related = None
+        if related is None:
+            return []
+        if isinstance(related, models.Model):
+            return [related.pk]
+        return [production.pk for production in related]
+
+    @staticmethod
+    def _enfiler(production_ids, action='index', percoler=False, routage=None):
+        from .indexation import IndexationService
+
+        if production_ids and DEDConfig.autosync_enabled():
+            IndexationService.enfiler(production_ids, action, percoler=percoler, routage=routage)
+
+    @staticmethod
+    def _routage_precedent(instance):
+        """Routage du document indexé si la clé de routage de la production a changé"""
+        from .documents import ProductionDocument
+
+        champ = ProductionDocument.routing_field()
+        if not champ:
+            return None
+        precedent = ProductionDocument.cle_routage(instance.valeur_initiale(champ))
+        return precedent if precedent != ProductionDocument.routage(instance) else None
+
+    def handle_save(self, sender, instance, **kwargs):
+        production_ids = self._productions(instance)
+        if production_ids is None:
+            return super().handle_save(sender, instance, **kwargs)
+
+        percoler, routage = False, None
+        if isinstance(instance, Production):
+            from .documents import ProductionDocument
+
+            # Nouvelle production ou baisse de prix : alertes des recherches sauvegardées
+            percoler = instance.disponible and (kwargs.get('created') or instance.prix_en_baisse)
+            routage = self._routage_precedent(instance)
+            champ_routage = ProductionDocument.routing_field()
+            instance.memoriser_valeurs('prix_unitaire', *([champ_routage] if champ_routage else []))
+        self._enfiler(production_ids, percoler=percoler, routage=routage)
+
+    def handle_pre_delete(self, sender, instance, **kwargs):
+        if isinstance(instance, Production):
+            return
+        # Avant la suppression : la relation existe encore
+        production_ids = self._productions(instance)
+        if production_ids is None:
+            return super().handle_pre_delete(sender, instance, **kwargs)
+        self._enfiler(production_ids)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if isinstance(instance, Production):
+            from .documents import ProductionDocument
+
+            return self._enfiler([instance.pk], 'delete', routage=ProductionDocument.routage(instance))
+        if not self._concerne(instance):
+            return super().handle_delete(sender, instance, **kwargs)
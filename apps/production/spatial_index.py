@@ -0,0 +1,219 @@
+# apps/production/spatial_index.py
+"""
+Index spatial en mémoire des productions disponibles.
+
+Grille uniforme de cellules lat/lon : une requête par rayon ou des k plus
+proches ne parcourt que les cellules voisines de l'origine. L'index est local
+au processus, chargé paresseusement depuis la base, tenu à jour par les
+signaux de Production et rechargé entièrement après PRODUCTION_SPATIAL_INDEX
+['TTL'] secondes pour rattraper les écritures faites par les autres workers.
+"""
+import threading
+import time
+from collections import namedtuple
+from math import cos, floor, radians
+
+import numpy as np
+from django.conf import settings
+
+from .geo import RAYON_TERRE_KM, bounding_box, haversine_distances, within_radius
+
+KM_PAR_DEGRE = np.pi * RAYON_TERRE_KM / 180
+
+IndexedProduction = namedtuple(
+    'IndexedProduction',
+    ['id', 'latitude', 'longitude', 'type_production', 'prix_unitaire']
+)
+
+
+class GridSpatialIndex:
+    """Grille de cellules carrées de `cell_size` degrés"""
+
+    def __init__(self, cell_size=None, ttl=None):
+        config = getattr(settings, 'PRODUCTION_SPATIAL_INDEX', {})
+        self.cell_size = cell_size or config.get('CELL_SIZE', 0.1)
+        self.ttl = ttl if ttl is not None else config.get('TTL', 300)
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._cells = {}
+            self._entries = {}
+            self._loaded_at = None
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._entries)
+
+    # ==================== CHARGEMENT ====================
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.rebuild()
+
+    def rebuild(self):
+        """Recharge toutes les productions disponibles depuis la base"""
+        from .models import Production
+
+        rows = Production.objects.filter(disponible=True).values_list(
+            'id', 'latitude', 'longitude', 'type_production', 'prix_unitaire'
+        ).iterator(chunk_size=2000)
+
+        cells, entries = {}, {}
+        for production_id, lat, lon, type_production, prix in rows:
+            entry = IndexedProduction(production_id, float(lat), float(lon), type_production, float(prix))
+            cell = self._cell(entry.latitude, entry.longitude)
+            cells.setdefault(cell, {})[production_id] = entry
+            entries[production_id] = (cell, entry)
+
+        with self._lock:
+            self._cells, self._entries = cells, entries
+            self._loaded_at = time.monotonic()
+
+    # ==================== MISE À JOUR ====================
+
+    def upsert(self, production):
+        """Ajoute ou déplace une production ; la retire si elle n'est plus disponible"""
+        if not production.disponible:
+            return self.remove(production.pk)
+
+        entry = IndexedProduction(
+            production.pk, float(production.latitude), float(production.longitude),
+            production.type_production, float(production.prix_unitaire)
+        )
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._discard(production.pk)
+            cell = self._cell(entry.latitude, entry.longitude)
+            self._cells.setdefault(cell, {})[entry.id] = entry
+            self._entries[entry.id] = (cell, entry)
+
+    def remove(self, production_id):
+        with self._lock:
+            self._discard(production_id)
+
+    def _discard(self, production_id):
+        cell_entry = self._entries.pop(production_id, None)
+        if cell_entry is None:
+            return
+        cell = self._cells.get(cell_entry[0])
+        if cell is not None:
+            cell.pop(production_id, None)
+            if not cell:
+                del self._cells[cell_entry[0]]
+
+    # ==================== REQUÊTES ====================
+
+    def within_radius(self, lat, lon, radius_km, type_production=None, prix_max=None):
+        """
+        Productions à moins de radius_km, triées par distance.
+
+        Returns:
+            list: [(distance_km, production_id), ...]
+        """
+        self._ensure_loaded()
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+
+        with self._lock:
+            if min_lon is None:
+                candidats = [entry for cell in self._cells.values() for entry in cell.values()]
+            else:
+                candidats = self._collect(
+                    self._cell(min_lat, min_lon), self._cell(max_lat, max_lon)
+                )
+
+        candidats = self._filter(candidats, type_production, prix_max)
+        return self._rank(lat, lon, candidats, radius_km)
+
+    def nearest(self, lat, lon, k, max_radius_km=None, type_production=None, prix_max=None):
+        """
+        k productions les plus proches, en élargissant la recherche anneau par
+        anneau autour de la cellule d'origine.
+
+        Returns:
+            list: [(distance_km, production_id), ...]
+        """
+        self._ensure_loaded()
+        ci, cj = self._cell(lat, lon)
+        candidats = []
+        ring = 0
+
+        with self._lock:
+            if not self._cells:
+                return []
+            rows = [i for i, _ in self._cells]
+            cols = [j for _, j in self._cells]
+            max_ring = max(abs(ci - min(rows)), abs(ci - max(rows)), abs(cj - min(cols)), abs(cj - max(cols)))
+
+            while ring <= max_ring:
+                candidats.extend(self._filter(self._ring(ci, cj, ring), type_production, prix_max))
+                # Distance minimale de tout point hors des anneaux déjà visités
+                borne_km = ring * self.cell_size * KM_PAR_DEGRE * max(
+                    cos(radians(min(abs(lat) + (ring + 1) * self.cell_size, 90))), 0.0
+                )
+                if max_radius_km is not None and borne_km > max_radius_km:
+                    break
+                if len(candidats) >= k:
+                    distances = haversine_distances(
+                        lat, lon, [e.latitude for e in candidats], [e.longitude for e in candidats]
+                    )
+                    if np.partition(distances, k - 1)[k - 1] <= borne_km:
+                        break
+                ring += 1
+
+        rayon = max_radius_km if max_radius_km is not None else float('inf')
+        return self._rank(lat, lon, candidats, rayon)[:k]
+
+    # ==================== CELLULES ====================
+
+    def _cell(self, lat, lon):
+        return floor(lat / self.cell_size), floor(lon / self.cell_size)
+
+    def _collect(self, cell_min, cell_max):
+        (i_min, j_min), (i_max, j_max) = cell_min, cell_max
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(self._cells):
+            # Rectangle plus grand que la grille occupée : on parcourt les cellules existantes
+            return [
+                entry for (i, j), cell in self._cells.items()
+                if i_min <= i <= i_max and j_min <= j <= j_max
+                for entry in cell.values()
+            ]
+        return [
+            entry
+            for i in range(i_min, i_max + 1)
+            for j in range(j_min, j_max + 1)
+            for entry in self._cells.get((i, j), {}).values()
+        ]
+
+    def _ring(self, ci, cj, ring):
+        if ring == 0:
+            return list(self._cells.get((ci, cj), {}).values())
+        cells = [(ci - ring, j) for j in range(cj - ring, cj + ring + 1)]
+        cells += [(ci + ring, j) for j in range(cj - ring, cj + ring + 1)]
+        cells += [(i, cj - ring) for i in range(ci - ring + 1, ci + ring)]
+        cells += [(i, cj + ring) for i in range(ci - ring + 1, ci + ring)]
+        return [entry for cell in cells for entry in self._cells.get(cell, {}).values()]
+
+    @staticmethod
+    def _filter(entries, type_production, prix_max):
+        if type_production:
+            entries = [e for e in entries if e.type_production == type_production]
+        if prix_max is not None:
+            entries = [e for e in entries if e.prix_unitaire <= prix_max]
+        return entries
+
+    @staticmethod
+    def _rank(lat, lon, entries, radius_km):
+        return within_radius(
+            lat, lon,
+            [e.id for e in entries],
+            [e.latitude for e in entries],
+            [e.longitude for e in entries],
+            radius_km
+        )
+
+
+production_index = GridSpatialIndex()
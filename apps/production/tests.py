@@ -1,8 +1,911 @@
-from django.test import TestCase
-from apps.users.models import CustomUser
-from apps.production.models import Production
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from elasticsearch import ConnectionError as ESConnectionError
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.response import Response as SearchResponse
+from elasticsearch_dsl.utils import AttrDict
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from apps.users.models import CustomUser, Producteur
+from apps.notifications.models import Notification
+from apps.production.models import (
+    Production, Commande, Evaluation, PhotoProduction, IndexationEnAttente, RechercheSauvegardee
+)
+from apps.production.documents import ProductionDocument, RechercheSauvegardeeDocument
+from apps.production.filter_backends import FacetsFilterBackend, RankingFilterBackend, RoutingFilterBackend
+from apps.production.indexation import IndexationService
+from apps.production.pagination import SearchAfterPagination
+from apps.production.serializers import ProductionHitSerializer, ProductionListSerializer, RechercheSauvegardeeSerializer
+from apps.production.services import (
+    StockService, RatingService, SuggestionService, ClusterService, AlerteService
+)
+from apps.production.search_backends import CircuitBreaker, PostgresSearchBackend, elasticsearch_breaker
+from apps.production.views import ProductionSearchViewSet
+from apps.production.spatial_index import GridSpatialIndex, production_index
+from apps.production.geo import (
+    bounding_box, haversine_distance, haversine_distances, haversine_matrix, within_radius,
+    count_tiles_in_bbox, parent_tile, tile_bounds, tile_xy, tiles_in_bbox
+)
+
+
+ROUTAGE_TYPE_PRODUCTION = {'SHARDS': 4, 'REPLICAS': 0, 'REFRESH_INTERVAL': '1s', 'ROUTING_FIELD': 'type_production'}
+
 
 class ProductionTestCase(TestCase):
     def test_import(self):
         """Test que les imports fonctionnent"""
         self.assertTrue(True)
+
+
+class GeoTestCase(TestCase):
+    def test_haversine_yaounde_douala(self):
+        distance = haversine_distance(3.8667, 11.5167, 4.0511, 9.7679)
+        self.assertAlmostEqual(distance, 195, delta=5)
+
+    def test_bounding_box_contient_le_cercle(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(3.8667, 11.5167, 10)
+        self.assertAlmostEqual(haversine_distance(3.8667, 11.5167, max_lat, 11.5167), 10, places=3)
+        self.assertAlmostEqual(haversine_distance(3.8667, 11.5167, 3.8667, max_lon), 10, delta=0.01)
+        self.assertLess(min_lat, 3.8667)
+        self.assertLess(min_lon, 11.5167)
+
+    def test_noyau_vectorise_identique_au_scalaire(self):
+        lats, lons = [3.9, 4.0511, -1.2], [11.52, 9.7679, 36.8]
+        attendu = [haversine_distance(3.8667, 11.5167, la, lo) for la, lo in zip(lats, lons)]
+
+        for calcule, reference in zip(haversine_distances(3.8667, 11.5167, lats, lons), attendu):
+            self.assertAlmostEqual(calcule, reference, places=6)
+
+        matrice = haversine_matrix([3.8667, 4.0511], [11.5167, 9.7679], lats, lons)
+        self.assertEqual(matrice.shape, (2, 3))
+        self.assertAlmostEqual(matrice[0, 1], attendu[1], places=6)
+
+    def test_within_radius_filtre_et_trie(self):
+        resultat = within_radius(3.8667, 11.5167, [1, 2, 3], [3.90, 3.867, 4.0511], [11.52, 11.517, 9.7679], 10)
+        self.assertEqual([production_id for _, production_id in resultat], [2, 1])
+
+    def test_bounding_box_antimeridien(self):
+        self.assertEqual(bounding_box(0, 179.99, 50)[2:], (None, None))
+
+    def test_tuiles_web_mercator(self):
+        x, y = tile_xy(3.8667, 11.5167, 10)
+        min_lat, max_lat, min_lon, max_lon = tile_bounds(x, y, 10)
+        self.assertTrue(min_lat <= 3.8667 < max_lat and min_lon <= 11.5167 < max_lon)
+
+        self.assertEqual(parent_tile(x * 8 + 5, y * 8 + 7, 13, 10), (x, y))
+        self.assertEqual(len(tiles_in_bbox(min_lat + 1e-6, max_lat - 1e-6, min_lon, max_lon - 1e-6, 11)), 4)
+        self.assertEqual(count_tiles_in_bbox(min_lat + 1e-6, max_lat - 1e-6, min_lon, max_lon - 1e-6, 11), 4)
+        self.assertEqual(count_tiles_in_bbox(-90, 90, -180, 180, 26), 2 ** 52)
+
+
+class GridSpatialIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = GridSpatialIndex(cell_size=0.1, ttl=3600)
+        self.index.rebuild()
+        points = [(1, 3.867, 11.517), (2, 3.90, 11.52), (3, 4.0511, 9.7679), (4, 3.95, 11.60)]
+        for production_id, lat, lon in points:
+            self.index.upsert(self._production(production_id, lat, lon))
+
+    def _production(self, production_id, lat, lon, disponible=True, type_production='legumes'):
+        return SimpleNamespace(
+            pk=production_id, latitude=lat, longitude=lon, disponible=disponible,
+            type_production=type_production, prix_unitaire=500
+        )
+
+    def test_within_radius(self):
+        resultat = self.index.within_radius(3.8667, 11.5167, 10)
+        self.assertEqual([production_id for _, production_id in resultat], [1, 2])
+
+    def test_nearest(self):
+        resultat = self.index.nearest(3.8667, 11.5167, 3)
+        self.assertEqual([production_id for _, production_id in resultat], [1, 2, 4])
+        self.assertEqual(self.index.nearest(3.8667, 11.5167, 10, max_radius_km=10)[-1][1], 2)
+
+    def test_upsert_deplace_et_retire(self):
+        self.index.upsert(self._production(3, 3.8668, 11.5168))
+        self.assertEqual(self.index.nearest(3.8667, 11.5167, 1)[0][1], 3)
+
+        self.index.upsert(self._production(3, 3.8668, 11.5168, disponible=False))
+        self.assertEqual(self.index.nearest(3.8667, 11.5167, 1)[0][1], 1)
+        self.assertEqual(len(self.index), 3)
+
+    def test_filtre_type_production(self):
+        self.index.upsert(self._production(5, 3.8667, 11.5167, type_production='fruits'))
+        resultat = self.index.within_radius(3.8667, 11.5167, 10, type_production='fruits')
+        self.assertEqual([production_id for _, production_id in resultat], [5])
+
+
+class ProductionFixturesMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email='producteur@example.com', password='x', is_producteur=True
+        )
+        cls.producteur = Producteur.objects.create(user=cls.user, type_production='legumes')
+
+    def _production(self, produit, lat, lon, **kwargs):
+        defaults = {
+            'producteur': self.producteur,
+            'produit': produit,
+            'type_production': 'legumes',
+            'quantite': Decimal('100'),
+            'unite_mesure': 'kg',
+            'prix_unitaire': Decimal('500'),
+            'latitude': Decimal(str(lat)),
+            'longitude': Decimal(str(lon)),
+            'adresse_complete': 'Yaoundé',
+            'date_recolte': date(2025, 1, 15),
+            'description': produit,
+        }
+        defaults.update(kwargs)
+        return Production.objects.create(**defaults)
+
+
+@override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False)
+class NearbyTestCase(ProductionFixturesMixin, TestCase):
+    def setUp(self):
+        production_index.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_nearby_trie_par_distance(self):
+        loin = self._production('Manioc', 3.90, 11.52)
+        proche = self._production('Tomates', 3.867, 11.517)
+        self._production('Hors rayon', 4.0511, 9.7679)
+        self._production('Indisponible', 3.867, 11.517, disponible=False)
+
+        response = self.client.get('/api/productions/nearby/', {'lat': 3.8667, 'lon': 11.5167, 'radius': 10})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['radius_km'], 10)
+        self.assertEqual([p['id'] for p in response.data['results']], [proche.id, loin.id])
+        self.assertLess(response.data['results'][0]['distance_km'], response.data['results'][1]['distance_km'])
+
+    def test_nearby_k_plus_proches(self):
+        self._production('Manioc', 3.90, 11.52)
+        proche = self._production('Tomates', 3.867, 11.517)
+
+        response = self.client.get('/api/productions/nearby/', {'lat': 3.8667, 'lon': 11.5167, 'k': 1})
+
+        self.assertEqual([p['id'] for p in response.data['results']], [proche.id])
+
+    def test_nearby_parametres_invalides(self):
+        response = self.client.get('/api/productions/nearby/', {'lat': 'abc', 'lon': 11.5})
+        self.assertEqual(response.status_code, 400)
+        for k in (0, -1):
+            response = self.client.get('/api/productions/nearby/', {'lat': 3.8667, 'lon': 11.5167, 'k': k})
+            self.assertEqual(response.status_code, 400)
+
+    def test_nearby_refiltre_les_entrees_perimees_de_l_index(self):
+        chere = self._production('Tomates', 3.867, 11.517)
+        fruits = self._production('Mangues', 3.868, 11.518)
+        abordable = self._production('Manioc', 3.90, 11.52)
+        # Écritures d'un autre worker : l'index local n'est pas prévenu
+        Production.objects.filter(pk=chere.pk).update(prix_unitaire=Decimal('900'))
+        Production.objects.filter(pk=fruits.pk).update(type_production='fruits')
+
+        response = self.client.get(
+            '/api/productions/nearby/',
+            {'lat': 3.8667, 'lon': 11.5167, 'radius': 10, 'prix_max': 600, 'type_production': 'legumes'}
+        )
+
+        self.assertEqual([p['id'] for p in response.data['results']], [abordable.id])
+
+
+@override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False)
+class ProductionStatsTestCase(ProductionFixturesMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _production_commandee(self, produit):
+        production = self._production(produit, 3.867, 11.517)
+        client = CustomUser.objects.create_user(email=f'{produit}@example.com', password='x')
+        livree = Commande.objects.create(
+            production=production, client=client, quantite=Decimal('10'),
+            adresse_livraison='Yaoundé'
+        )
+        StockService.changer_statut(livree, 'livree')
+        RatingService.enregistrer(Evaluation.objects.create(commande=livree, note=4, commentaire='Bien'))
+        Commande.objects.create(
+            production=production, client=client, quantite=Decimal('5'),
+            adresse_livraison='Yaoundé', statut='annulee'
+        )
+        return production
+
+    def _list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/productions/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data['results']
+
+    def test_agregats_evaluation(self):
+        production = self._production_commandee('Tomates')
+        commande = Commande.objects.create(
+            production=production, client=self.user, quantite=Decimal('1'), adresse_livraison='Yaoundé'
+        )
+        RatingService.enregistrer(Evaluation.objects.create(commande=commande, note=5, commentaire='Parfait'))
+
+        production.refresh_from_db()
+        self.producteur.refresh_from_db()
+        self.assertEqual((production.nombre_evaluations, production.total_notes), (2, 9))
+        self.assertEqual(production.note_moyenne, Decimal('4.50'))
+        self.assertEqual(self.producteur.note_moyenne, Decimal('4.50'))
+        self.assertEqual(production.quantite_disponible, Decimal('90'))
+
+        Production.objects.filter(pk=production.pk).update(nombre_evaluations=0, total_notes=0, note_moyenne=None)
+        sans_note = self._production('Mil', 3.8, 11.5)
+        IndexationEnAttente.objects.all().delete()
+        self.assertEqual(RatingService.reconstruire(), (1, 0))
+        self.assertEqual(list(IndexationEnAttente.objects.values_list('production_id', flat=True)), [production.pk])
+        self.assertEqual(RatingService.reconstruire(), (0, 0))
+
+        # Moyenne seule périmée ou absente, compteurs justes
+        Production.objects.filter(pk=production.pk).update(note_moyenne=None)
+        Producteur.objects.filter(pk=self.producteur.pk).update(note_moyenne=Decimal('1.00'))
+        self.assertEqual(RatingService.reconstruire(), (1, 1))
+        self.producteur.refresh_from_db()
+        self.assertEqual(self.producteur.note_moyenne, Decimal('4.50'))
+
+        production.refresh_from_db()
+        sans_note.refresh_from_db()
+        self.assertEqual((production.nombre_evaluations, production.note_moyenne), (2, Decimal('4.50')))
+        self.assertEqual((sans_note.nombre_evaluations, sans_note.note_moyenne), (0, None))
+
+    def test_modification_et_suppression_d_evaluation(self):
+        production = self._production_commandee('Tomates')
+        commande = Commande.objects.create(
+            production=production, client=self.user, quantite=Decimal('1'), adresse_livraison='Yaoundé'
+        )
+        response = self.client.post(
+            '/api/productions/evaluations/', {'commande': commande.pk, 'note': 5, 'commentaire': 'Parfait'}
+        )
+        url = f"/api/productions/evaluations/{response.data['id']}/"
+
+        self.assertEqual(self.client.patch(url, {'note': 2}, format='json').status_code, 200)
+        production.refresh_from_db()
+        self.assertEqual((production.nombre_evaluations, production.total_notes), (2, 6))
+        self.assertEqual(production.note_moyenne, Decimal('3.00'))
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        production.refresh_from_db()
+        self.producteur.refresh_from_db()
+        self.assertEqual((production.nombre_evaluations, production.total_notes), (1, 4))
+        self.assertEqual(self.producteur.note_moyenne, Decimal('4.00'))
+
+    def test_liste_nombre_de_requetes_constant(self):
+        self._production_commandee('Tomates')
+        queries_une, _ = self._list_queries()
+
+        for produit in ('Manioc', 'Plantain', 'Mais'):
+            production = self._production_commandee(produit)
+            PhotoProduction.objects.create(production=production, image=f'productions/{produit}-2.jpg', ordre=1)
+            PhotoProduction.objects.create(production=production, image=f'productions/{produit}.jpg', ordre=0)
+        queries_quatre, results = self._list_queries()
+
+        self.assertEqual(queries_une, queries_quatre)
+        self.assertEqual(results[0]['quantite_disponible'], '90.00')
+        self.assertEqual(results[0]['note_moyenne'], 4.0)
+        self.assertTrue(results[0]['photo_principale'].endswith('productions/Mais.jpg'))
+
+
+@override_settings(
+    ELASTICSEARCH_DSL_AUTOSYNC=False,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+)
+class StockServiceTestCase(ProductionFixturesMixin, TestCase):
+    def setUp(self):
+        self.production = self._production('Tomates', 3.867, 11.517, quantite=Decimal('20'))
+        self.client_user = CustomUser.objects.create_user(email='client@example.com', password='x')
+
+    def _commande(self, quantite):
+        return Commande.objects.create(
+            production=self.production, client=self.client_user,
+            quantite=Decimal(quantite), adresse_livraison='Yaoundé'
+        )
+
+    def _disponible(self):
+        self.production.refresh_from_db()
+        return self.production.quantite_disponible
+
+    def test_cycle_de_vie_commande(self):
+        commande = self._commande('15')
+        self.assertEqual(self._disponible(), Decimal('20'))
+
+        self.assertEqual(StockService.changer_statut(commande, 'confirmee'), (True, ''))
+        self.assertEqual(self._disponible(), Decimal('5'))
+
+        StockService.changer_statut(commande, 'expediee')
+        StockService.changer_statut(commande, 'livree')
+        self.assertEqual(self._disponible(), Decimal('5'))
+
+        StockService.changer_statut(commande, 'annulee')
+        self.assertEqual(self._disponible(), Decimal('20'))
+
+    def test_confirmation_refusee_si_stock_insuffisant(self):
+        StockService.changer_statut(self._commande('15'), 'confirmee')
+        commande = self._commande('10')
+
+        ok, error_msg = StockService.changer_statut(commande, 'confirmee')
+
+        self.assertFalse(ok)
+        self.assertIn('5', error_msg)
+        commande.refresh_from_db()
+        self.assertEqual(commande.statut, 'en_attente')
+        self.assertEqual(self._disponible(), Decimal('5'))
+
+    def test_endpoint_confirm_stock_insuffisant(self):
+        StockService.changer_statut(self._commande('15'), 'confirmee')
+        commande = self._commande('10')
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post(f'/api/productions/commandes/{commande.id}/confirm/')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._disponible(), Decimal('5'))
+
+    def test_statut_et_quantite_non_modifiables_par_patch(self):
+        commande = self._commande('15')
+        StockService.changer_statut(commande, 'confirmee')
+        client = APIClient()
+        client.force_authenticate(self.client_user)
+        url = f'/api/productions/commandes/{commande.id}/'
+
+        response = client.patch(url, {'statut': 'annulee', 'quantite': '1'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        commande.refresh_from_db()
+        self.assertEqual((commande.statut, commande.quantite), ('confirmee', Decimal('15')))
+        self.assertEqual(self._disponible(), Decimal('5'))
+
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertEqual(self._disponible(), Decimal('20'))
+
+    def test_reconstruction_du_registre(self):
+        StockService.changer_statut(self._commande('15'), 'confirmee')
+        autre = self._production('Manioc', 3.8, 11.5)
+        Production.objects.filter(pk=self.production.pk).update(quantite_reservee=Decimal('2'))
+        IndexationEnAttente.objects.all().delete()
+
+        self.assertEqual(StockService.reconstruire(), 1)
+
+        self.assertEqual(self._disponible(), Decimal('5'))
+        self.assertEqual(
+            list(IndexationEnAttente.objects.values_list('production_id', flat=True)), [self.production.pk]
+        )
+        self.assertEqual(StockService.reconstruire(), 0)
+        autre.refresh_from_db()
+        self.assertEqual(autre.quantite_reservee, Decimal('0'))
+
+
+@override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False)
+class IndexationServiceTestCase(ProductionFixturesMixin, TestCase):
+    def test_lots_et_actions_sans_requete_par_document(self):
+        ids = [self._production(f'Produit {i}', 3.8, 11.5).pk for i in range(5)]
+        queryset = ProductionDocument().get_queryset()
+
+        lots = list(IndexationService.iter_chunks(queryset, chunk_size=2))
+        self.assertEqual([len(lot) for lot in lots], [2, 2, 1])
+        self.assertEqual([p.pk for lot in lots for p in lot], sorted(ids))
+
+        with self.assertNumQueries(0):
+            actions = list(IndexationService.actions(lots[0], index='productions-test'))
+        self.assertEqual(actions[0]['_index'], 'productions-test')
+        self.assertEqual(actions[0]['_id'], lots[0][0].pk)
+        self.assertEqual(actions[0]['_source']['producteur']['id'], self.user.id)
+
+    def test_hit_serialise_depuis_source_sans_requete(self):
+        production = self._production('Maïs', 3.8, 11.5, quantite=Decimal('20'), quantite_reservee=Decimal('5'))
+        PhotoProduction.objects.create(production=production, image='productions/mais.jpg')
+        production = ProductionDocument().get_queryset().get(pk=production.pk)
+        source = ProductionDocument().prepare(production)
+
+        with self.assertNumQueries(0):
+            data = ProductionHitSerializer([AttrDict(source)], many=True).data[0]
+
+        self.assertEqual(set(data), set(ProductionListSerializer.Meta.fields))
+        self.assertEqual(data['producteur_nom'], production.producteur.user.get_full_name())
+        self.assertEqual(data['quantite_disponible'], '15.00')
+        self.assertEqual(data['photo_principale'], '/media/productions/mais.jpg')
+
+    def test_bascule_alias_atomique_depuis_index_concret(self):
+        with patch.object(ProductionDocument, '_get_connection') as connexion, \
+                patch.object(IndexationService, 'index_physiques', return_value=['productions']):
+            precedents = IndexationService.basculer_alias('productions-20250101000000')
+
+        connexion.return_value.indices.update_aliases.assert_called_once_with(actions=[
+            {'remove_index': {'index': 'productions'}},
+            {'add': {'index': 'productions-20250101000000', 'alias': 'productions'}},
+        ])
+        self.assertEqual(precedents, [])
+
+    def test_divergences_par_fusion_des_flux_tries(self):
+        base = iter([(1, 10), (2, 20), (4, 40), (5, 50)])
+        index = iter([(1, 10), (2, 15), (3, 30), (5, 50), (6, None)])
+        self.assertEqual(list(IndexationService.divergences(base, index)), [
+            (2, 'perime', 20), (3, 'orphelin', None), (4, 'manquant', 40), (6, 'orphelin', None),
+        ])
+
+    def test_verifier_repare_les_seuls_documents_divergents(self):
+        a_jour, perime, manquant, en_file = [self._production(f'P{i}', 3.8, 11.5) for i in range(4)]
+        IndexationEnAttente.objects.create(production_id=en_file.pk)
+        millis = {p.pk: IndexationService.millis(p.date_modification) for p in (a_jour, perime, en_file)}
+        index = [
+            (a_jour.pk, millis[a_jour.pk]), (perime.pk, millis[perime.pk] - 1000),
+            (en_file.pk, None), (999, 0),
+        ]
+
+        with patch.object(IndexationService, 'flux_index', return_value=iter(index)), \
+                patch.object(IndexationService, 'indexer', return_value={'indexes': 2, 'erreurs': 0}) as indexer, \
+                patch.object(ProductionDocument, '_get_connection') as connexion:
+            connexion.return_value.delete_by_query.return_value = {'deleted': 1, 'failures': []}
+            stats = IndexationService.verifier(grace=0)
+
+        self.assertEqual(connexion.return_value.delete_by_query.call_args.kwargs['query'], {'ids': {'values': [999]}})
+
+        self.assertEqual(
+            sorted(indexer.call_args.args[0].values_list('pk', flat=True)), sorted([perime.pk, manquant.pk])
+        )
+        self.assertEqual(
+            {cle: stats[cle] for cle in ('base', 'index', 'manquants', 'perimes', 'orphelins', 'en_transit', 'repares')},
+            {'base': 4, 'index': 4, 'manquants': 1, 'perimes': 1, 'orphelins': 1, 'en_transit': 1, 'repares': 3}
+        )
+        self.assertAlmostEqual(stats['derive'], 0.75)
+
+    @override_settings(SEARCH_SYNC={'MAX_ATTEMPTS': 3})
+    def test_verifier_repare_les_entrees_a_tentatives_epuisees(self):
+        production = self._production('Maïs', 3.8, 11.5)
+        IndexationEnAttente.objects.update_or_create(production_id=production.pk, defaults={'tentatives': 3})
+        index = [(production.pk, IndexationService.millis(production.date_modification) - 1000)]
+
+        with patch.object(IndexationService, 'flux_index', return_value=iter(index)), \
+                patch.object(IndexationService, 'indexer', return_value={'indexes': 1, 'erreurs': 0}) as indexer:
+            stats = IndexationService.verifier(grace=0)
+
+        self.assertEqual(list(indexer.call_args.args[0].values_list('pk', flat=True)), [production.pk])
+        self.assertEqual((stats['perimes'], stats['en_transit'], stats['repares']), (1, 0, 1))
+
+
+class OutboxTestCase(ProductionFixturesMixin, TestCase):
+    def test_ecritures_regroupees_puis_envoyees_en_bulk(self):
+        production = self._production('Maïs', 3.8, 11.5)
+        production.prix_unitaire = 600
+        production.save()
+        autre = self._production('Manioc', 3.8, 11.5)
+        autre_id = autre.pk
+        autre.delete()
+
+        file = IndexationEnAttente.objects.order_by('production_id')
+        self.assertEqual(
+            list(file.values_list('production_id', 'action')),
+            [(production.pk, 'index'), (autre_id, 'delete')]
+        )
+
+        def bulk(client, actions, **kwargs):
+            for action in actions:
+                yield True, {action.get('_op_type', 'index'): {'_id': str(action['_id']), 'status': 200}}
+
+        with patch('apps.production.indexation.streaming_bulk', side_effect=bulk) as streaming_bulk, \
+                patch.object(ProductionDocument, '_get_connection'), \
+                patch.object(AlerteService, 'percoler') as percoler:
+            stats = IndexationService.traiter_file(debounce=0)
+
+        self.assertEqual(stats, {'indexes': 1, 'supprimes': 1, 'erreurs': 0})
+        self.assertEqual(streaming_bulk.call_count, 1)
+        self.assertEqual([p.pk for p in percoler.call_args.args[0]], [production.pk])
+        self.assertFalse(IndexationEnAttente.objects.exists())
+
+    @override_settings(PRODUCTION_SEARCH_INDEX=ROUTAGE_TYPE_PRODUCTION)
+    def test_changement_de_cle_de_routage_retire_l_ancienne_copie(self):
+        production = self._production('Maïs', 3.8, 11.5)
+        IndexationEnAttente.objects.all().delete()
+        production = Production.objects.get(pk=production.pk)
+        production.type_production = 'cereales'
+        production.save()
+        production.type_production = 'tubercules'
+        production.save()
+        # Le document indexé est toujours sur le shard de « legumes »
+        self.assertEqual(IndexationEnAttente.objects.get(production_id=production.pk).routage, 'legumes')
+
+        envoyees = []
+
+        def bulk(client, actions, **kwargs):
+            for action in actions:
+                envoyees.append(action)
+                yield True, {action['_op_type']: {'_id': str(action['_id']), 'status': 200}}
+
+        with patch('apps.production.indexation.streaming_bulk', side_effect=bulk), \
+                patch.object(ProductionDocument, '_get_connection'):
+            stats = IndexationService.traiter_file(debounce=0)
+
+        self.assertEqual(stats, {'indexes': 1, 'supprimes': 0, 'erreurs': 0})
+        self.assertEqual(
+            [(action['_op_type'], action['_routing']) for action in envoyees],
+            [('delete', 'legumes'), ('index', 'tubercules')]
+        )
+
+    def test_percolation_a_la_creation_et_aux_baisses_de_prix(self):
+        production = self._production('Maïs', 3.8, 11.5)
+        self.assertTrue(IndexationEnAttente.objects.get(production_id=production.pk).percoler)
+        IndexationEnAttente.objects.all().delete()
+
+        production = Production.objects.get(pk=production.pk)
+        production.prix_unitaire = Decimal('600')
+        production.save()
+        self.assertFalse(IndexationEnAttente.objects.get(production_id=production.pk).percoler)
+
+        production.prix_unitaire = Decimal('450')
+        production.save()
+        self.assertTrue(IndexationEnAttente.objects.get(production_id=production.pk).percoler)
+
+        # Une écriture ordinaire ne retire pas le marquage en attente
+        production.description = 'Maïs jaune'
+        production.save()
+        self.assertTrue(IndexationEnAttente.objects.get(production_id=production.pk).percoler)
+
+    def test_echec_percolation_garde_l_entree_en_file(self):
+        production = self._production('Maïs', 3.8, 11.5)
+
+        def bulk(client, actions, **kwargs):
+            for action in actions:
+                yield True, {'index': {'_id': str(action['_id']), 'status': 200}}
+
+        with patch('apps.production.indexation.streaming_bulk', side_effect=bulk), \
+                patch.object(ProductionDocument, '_get_connection'), \
+                patch.object(AlerteService, 'percoler', side_effect=ESConnectionError('down')):
+            stats = IndexationService.traiter_file(debounce=0)
+
+        self.assertEqual(stats, {'indexes': 0, 'supprimes': 0, 'erreurs': 1})
+        entree = IndexationEnAttente.objects.get(production_id=production.pk)
+        self.assertTrue(entree.percoler)
+        self.assertEqual(entree.tentatives, 1)
+
+
+class FacetsFilterBackendTestCase(TestCase):
+    def _aggs(self, **params):
+        request = Request(APIRequestFactory().get('/api/productions/search/', params))
+        search = FacetsFilterBackend().filter_queryset(request, Search(), ProductionSearchViewSet)
+        return search.to_dict().get('aggs', {})
+
+    def test_facettes_dans_la_meme_requete(self):
+        self.assertEqual(self._aggs(), {})
+
+        aggs = self._aggs(facets='true', lat='3.8667', lon='11.5167')
+
+        self.assertEqual(set(aggs), {'type_production', 'certification', 'unite_mesure', 'prix_unitaire', 'distance'})
+        self.assertEqual(aggs['type_production']['terms']['field'], 'type_production.raw')
+        self.assertEqual(aggs['distance']['geo_distance']['ranges'][0], {'to': 5})
+        self.assertEqual(aggs['distance']['geo_distance']['ranges'][-1], {'from': 100})
+
+
+class RoutingFilterBackendTestCase(TestCase):
+    def _params(self, **params):
+        request = Request(APIRequestFactory().get('/api/productions/search/', params))
+        return RoutingFilterBackend().filter_queryset(request, Search(), ProductionSearchViewSet)._params
+
+    def test_sans_cle_de_routage_tous_les_shards(self):
+        self.assertEqual(self._params(type_production='legumes'), {})
+
+    @override_settings(PRODUCTION_SEARCH_INDEX=ROUTAGE_TYPE_PRODUCTION)
+    def test_filtre_sur_la_cle_de_routage(self):
+        self.assertEqual(self._params(), {})
+        self.assertEqual(self._params(type_production='legumes'), {'routing': 'legumes'})
+        self.assertEqual(self._params(type_production__in='legumes__fruits'), {'routing': 'fruits,legumes'})
+
+
+class RankingFilterBackendTestCase(TestCase):
+    def test_function_score_autour_de_la_requete_texte(self):
+        request = Request(APIRequestFactory().get(
+            '/api/productions/search/', {'ranking': 'true', 'lat': '3.8667', 'lon': '11.5167'}
+        ))
+        search = Search().query('match', produit='tomates').sort('prix_unitaire')
+
+        requete = RankingFilterBackend().filter_queryset(request, search, ProductionSearchViewSet).to_dict()
+
+        self.assertNotIn('sort', requete)
+        function_score = requete['query']['function_score']
+        self.assertEqual(function_score['query'], {'match': {'produit': 'tomates'}})
+        self.assertEqual(
+            [next(iter(f.keys() - {'weight'})) for f in function_score['functions']],
+            ['gauss', 'gauss', 'field_value_factor', 'filter']
+        )
+        self.assertEqual(function_score['functions'][0]['gauss']['localisation']['origin'], {'lat': 3.8667, 'lon': 11.5167})
+
+    def test_sans_parametre_requete_inchangee(self):
+        request = Request(APIRequestFactory().get('/api/productions/search/'))
+        search = Search().query('match', produit='tomates')
+        self.assertIs(RankingFilterBackend().filter_queryset(request, search, ProductionSearchViewSet), search)
+
+
+class SearchAfterPaginationTestCase(TestCase):
+    def _page(self, params, hits):
+        request = Request(APIRequestFactory().get('/api/productions/search/', params))
+        executees = []
+
+        def execute(search):
+            executees.append(search.to_dict())
+            return SearchResponse(search, {'hits': {'total': {'value': 99}, 'hits': hits}})
+
+        pagination = SearchAfterPagination()
+        with patch.object(Search, 'execute', autospec=True, side_effect=execute):
+            page = pagination.paginate_queryset(Search().sort('prix_unitaire'), request, view=None)
+        return pagination, page, executees[0]
+
+    def test_curseur_search_after(self):
+        hits = [
+            {'_id': str(i), '_source': {'id': i}, 'sort': [500, 1700000000000 - i, i]}
+            for i in range(1, 4)
+        ]
+        pagination, page, requete = self._page({'cursor': '', 'page_size': 2}, hits)
+
+        self.assertEqual(requete['size'], 3)
+        self.assertEqual(
+            requete['sort'],
+            ['prix_unitaire', {'date_creation': {'order': 'desc'}}, {'id': {'order': 'desc'}}]
+        )
+        self.assertNotIn('search_after', requete)
+        self.assertEqual([hit.id for hit in page], [1, 2])
+
+        suivant = pagination.get_next_link()
+        curseur = suivant.split('cursor=')[1].split('&')[0]
+        _, _, requete = self._page({'cursor': curseur, 'page_size': 2}, hits[2:])
+        self.assertEqual(requete['search_after'], [500, 1700000000000 - 2, 2])
+
+    def test_curseur_invalide(self):
+        with self.assertRaises(NotFound):
+            self._page({'cursor': 'pas-un-curseur'}, [])
+
+
+class SuggestionServiceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_prefixe_normalise_et_mis_en_cache(self):
+        with patch.object(SuggestionService, '_produits', return_value=['Légumes feuilles']) as produits:
+            premiere = SuggestionService.suggerer('  LÉGU ')
+            seconde = SuggestionService.suggerer('legu')
+
+        self.assertEqual(produits.call_count, 1)
+        produits.assert_called_once_with('legu', 8)
+        self.assertEqual(premiere, seconde)
+        self.assertEqual(premiere['categories'], [{'value': 'legumes', 'label': 'Légumes'}])
+
+    def test_nom_complet_pour_un_mot_non_initial(self):
+        options = [
+            {'text': 'tomates', '_source': {'produit': 'Grosses tomates'}},
+            {'text': 'Tomates cerises', '_source': {'produit': 'Tomates cerises'}},
+            {'text': 'tomates', '_source': {'produit': 'Grosses tomates'}},
+            {'text': 'tomates', '_source': {'produit': 'Petites tomates'}},
+        ]
+        requetes = []
+
+        def execute(search):
+            requetes.append(search.to_dict())
+            return SearchResponse(search, {
+                'hits': {'total': {'value': 0}, 'hits': []},
+                'suggest': {'produits': [{'text': 'tom', 'offset': 0, 'length': 3, 'options': options}]},
+            })
+
+        with patch.object(Search, 'execute', autospec=True, side_effect=execute):
+            produits = SuggestionService._produits('tom', 2)
+
+        self.assertEqual(produits, ['Grosses tomates', 'Tomates cerises'])
+        self.assertEqual(requetes[0]['_source'], {'includes': ['produit']})
+
+    def test_endpoint_suggest(self):
+        with patch.object(SuggestionService, '_produits', return_value=['Tomates']):
+            response = APIClient().get('/api/productions/search/suggest/', {'q': 'tom'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'produits': ['Tomates'], 'categories': []})
+
+
+@override_settings(SEARCH_CIRCUIT_BREAKER={'ERROR_THRESHOLD': 2, 'LATENCY_THRESHOLD_MS': 800, 'RESET_TIMEOUT': 0})
+class CircuitBreakerTestCase(TestCase):
+    def test_ouverture_puis_essai_et_refermeture(self):
+        breaker = CircuitBreaker('test')
+
+        def panne():
+            raise ESConnectionError('injoignable')
+
+        self.assertEqual(breaker.call(panne, lambda: 'secours'), 'secours')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.call(panne, lambda: 'secours'), 'secours')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # RESET_TIMEOUT écoulé : un appel d'essai réussi referme le disjoncteur
+        self.assertEqual(breaker.call(lambda: 'es', lambda: 'secours'), 'es')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    @override_settings(SEARCH_CIRCUIT_BREAKER={'ERROR_THRESHOLD': 1, 'RESET_TIMEOUT': 60})
+    def test_disjoncteur_ouvert_ne_contacte_plus_le_service(self):
+        breaker = CircuitBreaker('test')
+        breaker.call(lambda: (_ for _ in ()).throw(ESConnectionError('injoignable')), lambda: None)
+
+        appel = []
+        self.assertEqual(breaker.call(lambda: appel.append(1), lambda: 'secours'), 'secours')
+        self.assertEqual(appel, [])
+
+
+@override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False)
+class PostgresSearchBackendTestCase(ProductionFixturesMixin, TestCase):
+    def tearDown(self):
+        elasticsearch_breaker.reset()
+
+    def test_filtres_bbox_et_tri(self):
+        proche = self._production('Tomates', 3.87, 11.52, prix_unitaire=Decimal('300'))
+        self._production('Tomates cerises', 3.87, 11.52, certification='bio', prix_unitaire=Decimal('800'))
+        self._production('Tomates', 4.05, 9.70)  # Douala
+        self._production('Manioc', 3.87, 11.52)
+
+        queryset = PostgresSearchBackend().filter_queryset(QueryDict(
+            'search=tomate&localisation__geo_distance=10km__3.8667__11.5167&ordering=-prix_unitaire'
+        ))
+        self.assertEqual([p.produit for p in queryset], ['Tomates cerises', 'Tomates'])
+
+        queryset = PostgresSearchBackend().filter_queryset(QueryDict('search=tomate&certification=standard'))
+        self.assertIn(proche, queryset)
+        self.assertEqual(queryset.count(), 2)
+
+    def test_bascule_sur_la_base_quand_elasticsearch_est_injoignable(self):
+        self._production('Tomates', 3.87, 11.52)
+
+        with patch(
+            'apps.production.search_backends.ElasticsearchSearchBackend.search',
+            side_effect=ESConnectionError('injoignable')
+        ):
+            response = APIClient().get('/api/productions/search/', {'search': 'tomate'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Search-Backend'], 'postgresql')
+        self.assertEqual(response.json()['count'], 1)
+
+
+class ClusterServiceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_tuiles_mises_en_cache(self):
+        def interroger(tuiles, niveau, precision, type_production):
+            return {tuile: [{'lat': 3.87, 'lon': 11.52, 'count': 2}] for tuile in tuiles}, False
+
+        viewport = (3.80, 3.95, 11.45, 11.60, 12)
+        with patch.object(ClusterService, '_interroger', side_effect=interroger) as es:
+            premier = ClusterService.clusters(*viewport)
+            second = ClusterService.clusters(*viewport)
+
+        self.assertEqual(es.call_count, 1)
+        self.assertEqual(premier, second)
+        self.assertEqual(premier['precision'], 15)
+        self.assertEqual(premier['total'], 2 * len(es.call_args.args[0]))
+
+    @override_settings(PRODUCTION_CLUSTERS={'MAX_TILES': 64})
+    def test_viewport_monde_a_fort_zoom_borne(self):
+        def interroger(tuiles, niveau, precision, type_production):
+            return {tuile: [] for tuile in tuiles}, False
+
+        with patch.object(ClusterService, '_interroger', side_effect=interroger) as es, \
+                patch('apps.production.services.tiles_in_bbox', wraps=tiles_in_bbox) as tuiles:
+            resultat = ClusterService.clusters(-85, 85, -180, 180, 20)
+
+        # Liste construite une seule fois, au niveau déjà réduit
+        tuiles.assert_called_once()
+        niveau = es.call_args.args[1]
+        self.assertEqual(niveau, 3)
+        self.assertLessEqual(len(es.call_args.args[0]), 64)
+        # Précision tirée du niveau effectif, pas du zoom demandé
+        self.assertEqual((resultat['zoom'], resultat['precision']), (20, 6))
+
+    def test_tuiles_tronquees_non_mises_en_cache(self):
+        def interroger(tuiles, niveau, precision, type_production):
+            return {tuile: [{'lat': 3.87, 'lon': 11.52, 'count': 1}] for tuile in tuiles}, True
+
+        viewport = (3.80, 3.95, 11.45, 11.60, 12)
+        with patch.object(ClusterService, '_interroger', side_effect=interroger) as es:
+            resultat = ClusterService.clusters(*viewport)
+            ClusterService.clusters(*viewport)
+
+        self.assertEqual(es.call_count, 2)
+        self.assertTrue(resultat['tronque'])
+
+    def test_interroger_detecte_la_troncature(self):
+        x, y = tile_xy(3.8667, 11.5167, 12)
+        cellule = {
+            'key': f'15/{x * 8}/{y * 8}', 'doc_count': 3,
+            'centre': {'location': {'lat': 3.87, 'lon': 11.52}, 'count': 3},
+        }
+
+        def execute(search):
+            return SearchResponse(search, {
+                'hits': {'total': {'value': 3}, 'hits': []},
+                'aggregations': {'cellules': {'buckets': [cellule]}},
+            })
+
+        with patch.object(Search, 'execute', autospec=True, side_effect=execute), \
+                patch.object(ClusterService, 'MAX_CELLULES', 1):
+            clusters, tronque = ClusterService._interroger([(x, y)], 12, 15, None)
+
+        self.assertTrue(tronque)
+        self.assertEqual(clusters[(x, y)][0]['count'], 3)
+
+    def test_endpoint_parametres_invalides(self):
+        user = CustomUser.objects.create_user(email='carte@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get('/api/productions/clusters/', {
+            'min_lat': 4, 'max_lat': 3, 'min_lon': 11, 'max_lon': 12, 'zoom': 10
+        })
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    ELASTICSEARCH_DSL_AUTOSYNC=False,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class RechercheSauvegardeeTestCase(ProductionFixturesMixin, TestCase):
+    def setUp(self):
+        self.consommateur = CustomUser.objects.create_user(email='client@example.com', password='x')
+
+    def _recherche(self, user=None, **kwargs):
+        return RechercheSauvegardee.objects.create(user=user or self.consommateur, nom='Alerte', **kwargs)
+
+    def test_validation_criteres(self):
+        self.assertFalse(RechercheSauvegardeeSerializer(data={'nom': 'Vide'}).is_valid())
+        self.assertFalse(RechercheSauvegardeeSerializer(data={'nom': 'Zone', 'rayon_km': 10}).is_valid())
+        self.assertTrue(RechercheSauvegardeeSerializer(data={
+            'nom': 'Zone', 'latitude': 3.8, 'longitude': 11.5, 'rayon_km': 10
+        }).is_valid())
+
+    def test_requete_percolator(self):
+        recherche = self._recherche(
+            texte='tomate', type_production='legumes', prix_max=Decimal('500'),
+            latitude=Decimal('3.8'), longitude=Decimal('11.5'), rayon_km=Decimal('20'),
+        )
+        requete = RechercheSauvegardeeDocument().prepare(recherche)['query']
+
+        self.assertEqual(requete['bool']['must'][0]['multi_match']['query'], 'tomate')
+        self.assertEqual(requete['bool']['filter'], [
+            {'term': {'type_production': 'legumes'}},
+            {'range': {'prix_unitaire': {'lte': 500.0}}},
+            {'geo_distance': {'distance': '20.0km', 'localisation': {'lat': 3.8, 'lon': 11.5}}},
+        ])
+
+    def test_notifications_groupees_par_utilisateur_et_production(self):
+        mais = self._production('Maïs', 3.8, 11.5)
+        manioc = self._production('Manioc', 3.8, 11.5)
+        recherches = [self._recherche(texte='mais'), self._recherche(prix_max=Decimal('800'))]
+        propre = self._recherche(user=self.user, texte='mais')
+        hits = [
+            {'_id': str(recherches[0].pk), '_source': {'user_id': self.consommateur.pk},
+             'fields': {'_percolator_document_slot': [0]}},
+            {'_id': str(recherches[1].pk), '_source': {'user_id': self.consommateur.pk},
+             'fields': {'_percolator_document_slot': [0, 1]}},
+            {'_id': str(propre.pk), '_source': {'user_id': self.user.pk},
+             'fields': {'_percolator_document_slot': [0]}},
+        ]
+
+        with patch('apps.production.services.scan', return_value=hits) as scan, \
+                patch.object(RechercheSauvegardeeDocument, '_get_connection'):
+            with self.assertNumQueries(4):
+                creees = AlerteService.percoler([mais, manioc])
+
+        documents = scan.call_args.kwargs['query']['query']['bool']['must'][0]['percolate']['documents']
+        self.assertEqual([document['produit'] for document in documents], ['Maïs', 'Manioc'])
+        self.assertEqual(creees, 2)
+        notifications = Notification.objects.filter(type='production_alert').order_by('object_id')
+        self.assertEqual([n.recipient_id for n in notifications], [self.consommateur.pk] * 2)
+        self.assertEqual(notifications[0].data['recherches'], [recherches[0].pk, recherches[1].pk])
@@ -3,7 +3,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ProductionViewSet, ProductionSearchViewSet, CommandeViewSet,
-    PaiementViewSet, EvaluationViewSet
+    PaiementViewSet, EvaluationViewSet, RechercheSauvegardeeViewSet
 )
 
 router = DefaultRouter()
@@ -13,6 +13,7 @@ router.register(r'commandes', CommandeViewSet, basename='commande')
 router.register(r'paiements', PaiementViewSet, basename='paiement')
 router.register(r'evaluations', EvaluationViewSet, basename='evaluation')
 router.register(r'search', ProductionSearchViewSet, basename='production-search')
+router.register(r'recherches', RechercheSauvegardeeViewSet, basename='recherche-sauvegardee')
 
 # Route générique EN DERNIER
 router.register(r'', ProductionViewSet, basename='production')
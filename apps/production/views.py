@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Prefetch
 from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
 from django_elasticsearch_dsl_drf.filter_backends import (
     CompoundSearchFilterBackend, FilteringFilterBackend, OrderingFilterBackend,
@@ -13,13 +14,18 @@ from django_elasticsearch_dsl_drf.filter_backends import (
 
 from apps.users.serializers import UserProfileSerializer
 from apps.users.services import BadgeService
-from .models import Production, Commande, Paiement, Evaluation, PhotoProduction
+from .models import Production, Commande, Paiement, Evaluation, PhotoProduction, RechercheSauvegardee
 from .serializers import (
-    ProductionListSerializer, ProductionDetailSerializer, 
+    ProductionListSerializer, ProductionDetailSerializer, ProductionNearbySerializer, ProductionHitSerializer,
     ProductionCreateWithRoleSerializer, CommandeSerializer,
-    PaiementSerializer, EvaluationSerializer, PhotoProductionSerializer
+    PaiementSerializer, EvaluationSerializer, PhotoProductionSerializer, RechercheSauvegardeeSerializer
 )
 from .documents import ProductionDocument
+from .filter_backends import FacetsFilterBackend, RankingFilterBackend, RoutingFilterBackend
+from .pagination import SearchAfterPagination
+from .search_backends import production_search, search_client
+from .services import StockService, RatingService, SuggestionService, ClusterService
+from .spatial_index import production_index
 from .permissions import IsProducteurOrReadOnly, IsCommandeOwner, CanBecomeProducteur, IsProducteurOwner
 from apps.users.models import Producteur
 from .docs.production_swagger import (
@@ -27,7 +33,8 @@ from .docs.production_swagger import (
     NEARBY_PRODUCTIONS_SCHEMA, UPLOAD_PHOTO_SCHEMA, SEARCH_PRODUCTIONS_SCHEMA,
     LIST_PRODUCTIONS_SCHEMA, CONFIRM_COMMANDE_SCHEMA, CANCEL_COMMANDE_SCHEMA,
     SHIP_COMMANDE_SCHEMA, DELIVER_COMMANDE_SCHEMA, INITIATE_PAIEMENT_SCHEMA,
-    CALLBACK_PAIEMENT_SCHEMA, CREATE_EVALUATION_SCHEMA,
+    CALLBACK_PAIEMENT_SCHEMA, CREATE_EVALUATION_SCHEMA, SUGGEST_PRODUCTIONS_SCHEMA,
+    CLUSTERS_PRODUCTIONS_SCHEMA, CREATE_RECHERCHE_SCHEMA, LIST_RECHERCHES_SCHEMA,
 )
 from drf_spectacular.utils import extend_schema
 
@@ -35,11 +42,13 @@ from drf_spectacular.utils import extend_schema
 class ProductionViewSet(viewsets.ModelViewSet):
     """ViewSet pour gérer les productions avec activation automatique du rôle producteur"""
     permission_classes = [IsAuthenticated, CanBecomeProducteur]
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['note_moyenne', 'prix_unitaire', 'date_creation']
     
     def get_queryset(self):
         return Production.objects.select_related(
             'producteur__user'
-        ).prefetch_related('photos').all()
+        ).prefetch_related('photos')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -47,6 +56,9 @@ class ProductionViewSet(viewsets.ModelViewSet):
                 return ProductionCreateWithRoleSerializer
             return ProductionDetailSerializer
         
+        if self.action == 'nearby':
+            return ProductionNearbySerializer
+        
         return ProductionDetailSerializer if self.action == 'retrieve' else ProductionListSerializer
         
     def get_permissions(self):
@@ -74,9 +86,7 @@ class ProductionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        my_productions = Production.objects.filter(
-            producteur=request.user.producteur
-        ).select_related('producteur__user').prefetch_related('photos')
+        my_productions = self.filter_queryset(self.get_queryset()).filter(producteur=request.user.producteur)
         
         page = self.paginate_queryset(my_productions)
         if page is not None:
@@ -178,7 +188,6 @@ class ProductionViewSet(viewsets.ModelViewSet):
         """Recherche productions par proximité GPS"""
         lat = request.query_params.get('lat')
         lon = request.query_params.get('lon')
-        radius = float(request.query_params.get('radius', 10))
         
         if not (lat and lon):
             return Response(
@@ -186,34 +195,106 @@ class ProductionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        lat, lon = float(lat), float(lon)
+        try:
+            lat, lon = float(lat), float(lon)
+            radius = float(request.query_params.get('radius', 10))
+            k = request.query_params.get('k')
+            k = int(k) if k else None
+            prix_max = request.query_params.get('prix_max')
+            prix_max = float(prix_max) if prix_max else None
+        except ValueError:
+            return Response(
+                {'error': 'Paramètres lat, lon, radius, k et prix_max doivent être numériques'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        productions = [
-            p for p in self.get_queryset().filter(disponible=True)
-            if self._haversine_distance(lat, lon, float(p.latitude), float(p.longitude)) <= radius
-        ]
+        if k is not None and k < 1:
+            return Response(
+                {'error': 'Le paramètre k doit être supérieur ou égal à 1'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        serializer = self.get_serializer(productions, many=True)
-        return Response(
-            {
-                'count': len(productions),
-                'radius_km': radius,
-                'results': serializer.data
-            },
-            status=status.HTTP_200_OK
+        type_production = request.query_params.get('type_production')
+        
+        # Index spatial en mémoire : seules les cellules voisines sont parcourues
+        if k is not None:
+            distances = production_index.nearest(
+                lat, lon, k, max_radius_km=radius,
+                type_production=type_production, prix_max=prix_max
+            )
+        else:
+            distances = production_index.within_radius(
+                lat, lon, radius,
+                type_production=type_production, prix_max=prix_max
+            )
+        
+        page = self.paginate_queryset(distances)
+        response = self.get_paginated_response(
+            self._hydrate_nearby(page, type_production=type_production, prix_max=prix_max)
         )
+        response.data['radius_km'] = radius
+        return response
     
-    @staticmethod
-    def _haversine_distance(lat1, lon1, lat2, lon2):
-        from math import radians, cos, sin, asin, sqrt
+    @CLUSTERS_PRODUCTIONS_SCHEMA
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """Clusters de productions disponibles pour un viewport de carte"""
+        params = request.query_params
+        if not all(params.get(nom) for nom in ('min_lat', 'max_lat', 'min_lon', 'max_lon', 'zoom')):
+            return Response(
+                {'error': 'Paramètres min_lat, max_lat, min_lon, max_lon et zoom requis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            min_lat, max_lat = float(params['min_lat']), float(params['max_lat'])
+            min_lon, max_lon = float(params['min_lon']), float(params['max_lon'])
+            zoom = int(params['zoom'])
+        except ValueError:
+            return Response(
+                {'error': 'Paramètres min_lat, max_lat, min_lon, max_lon et zoom doivent être numériques'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        km = 6371 * c
-        return km
+        if not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lon < max_lon <= 180 and 0 <= zoom <= 26):
+            return Response(
+                {'error': 'Viewport invalide (min < max, zoom entre 0 et 26)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resultat = ClusterService.clusters(
+            min_lat, max_lat, min_lon, max_lon, zoom,
+            type_production=params.get('type_production')
+        )
+        if resultat is None:
+            return Response(
+                {'error': 'Service de recherche temporairement indisponible'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response(resultat)
+    
+    def _hydrate_nearby(self, distances, type_production=None, prix_max=None):
+        """
+        Charge la page de productions en une requête, triée par distance.
+        
+        Les filtres sont réappliqués en base : l'index d'un autre worker peut
+        garder jusqu'à son TTL un prix ou un type périmé.
+        """
+        queryset = self.get_queryset().filter(disponible=True)
+        if type_production:
+            queryset = queryset.filter(type_production=type_production)
+        if prix_max is not None:
+            queryset = queryset.filter(prix_unitaire__lte=prix_max)
+        productions = queryset.in_bulk([production_id for _, production_id in distances])
+        
+        page = []
+        for distance, production_id in distances:
+            production = productions.get(production_id)
+            if production is not None:
+                production.distance_km = round(distance, 3)
+                page.append(production)
+        
+        return self.get_serializer(page, many=True).data
     
     @UPLOAD_PHOTO_SCHEMA
     @action(detail=True, methods=['post'])
@@ -249,8 +330,10 @@ class ProductionViewSet(viewsets.ModelViewSet):
 class ProductionSearchViewSet(DocumentViewSet):
     """Recherche avancée avec Elasticsearch"""
     document = ProductionDocument
-    serializer_class = ProductionListSerializer
+    serializer_class = ProductionHitSerializer
     permission_classes = [AllowAny]
+    # Pages numérotées (total lu dans la réponse, sans _count) ou curseur search_after
+    pagination_class = SearchAfterPagination
     
     filter_backends = [
         CompoundSearchFilterBackend,
@@ -258,23 +341,51 @@ class ProductionSearchViewSet(DocumentViewSet):
         OrderingFilterBackend,
         GeoSpatialFilteringFilterBackend,
         GeoSpatialOrderingFilterBackend,
+        RankingFilterBackend,
+        FacetsFilterBackend,
+        RoutingFilterBackend,
     ]
     
     search_fields = ('produit', 'description', 'type_production')
     filter_fields = {
-        'type_production': 'type_production',
-        'certification': 'certification',
+        'type_production': 'type_production.raw',
+        'certification': 'certification.raw',
+        'unite_mesure': 'unite_mesure.raw',
         'disponible': 'disponible',
+        'note_moyenne': 'note_moyenne',
     }
     ordering_fields = {
         'prix_unitaire': 'prix_unitaire',
         'date_creation': 'date_creation',
+        'note_moyenne': 'note_moyenne',
     }
     geo_spatial_filter_fields = {
         'localisation': {
             'lookups': ['geo_distance'],
         },
     }
+    facets_terms_fields = {
+        'type_production': 'type_production.raw',
+        'certification': 'certification.raw',
+        'unite_mesure': 'unite_mesure.raw',
+    }
+    facets_prix_interval = 500
+    facets_distance_ranges_km = [5, 10, 25, 50, 100]
+
+    def get_queryset(self):
+        # Délai court : une recherche lente bascule sur PostgreSQL au lieu de bloquer
+        return super().get_queryset().using(search_client())
+
+    @SEARCH_PRODUCTIONS_SCHEMA
+    def list(self, request, *args, **kwargs):
+        """Elasticsearch, ou PostgreSQL quand le disjoncteur est ouvert (en-tête X-Search-Backend)"""
+        return production_search.search(self, request)
+
+    @SUGGEST_PRODUCTIONS_SCHEMA
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Autocomplétion : noms de produit et catégories pour un préfixe"""
+        return Response(SuggestionService.suggerer(request.query_params.get('q', '')))
 
 
 class CommandeViewSet(viewsets.ModelViewSet):
@@ -288,11 +399,18 @@ class CommandeViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
+        # production_info : productions et photos chargées en une requête pour toute la page
+        productions = Prefetch(
+            'production',
+            queryset=Production.objects.select_related(
+                'producteur__user'
+            ).prefetch_related('photos')
+        )
         if hasattr(user, 'producteur'):
             return Commande.objects.filter(
                 production__producteur=user.producteur
-            ).select_related('production__producteur__user', 'client')
-        return user.commandes_production.select_related('production__producteur__user')
+            ).select_related('client').prefetch_related(productions)
+        return user.commandes_production.select_related('client').prefetch_related(productions)
     
     @LIST_COMMANDES_SCHEMA
     def list(self, request, *args, **kwargs):
@@ -315,6 +433,9 @@ class CommandeViewSet(viewsets.ModelViewSet):
             data={'order_id': commande.id, 'amount': float(commande.montant_total)}
         )
     
+    def perform_destroy(self, instance):
+        StockService.supprimer(instance)
+    
     @CONFIRM_COMMANDE_SCHEMA
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
@@ -326,9 +447,11 @@ class CommandeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        commande.statut = 'confirmee'
-        commande.date_confirmation = timezone.now()
-        commande.save()
+        ok, error_msg = StockService.changer_statut(
+            commande, 'confirmee', date_confirmation=timezone.now()
+        )
+        if not ok:
+            return Response({'error': error_msg}, status=status.HTTP_400_BAD_REQUEST)
         
         from apps.notifications.services import NotificationService
         NotificationService.create(
@@ -352,8 +475,7 @@ class CommandeViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         commande = self.get_object()
-        commande.statut = 'annulee'
-        commande.save()
+        StockService.changer_statut(commande, 'annulee')
         
         from apps.notifications.services import NotificationService
         other_user = commande.production.producteur.user if request.user == commande.client else commande.client
@@ -384,9 +506,11 @@ class CommandeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        commande.statut = 'expediee'
-        commande.date_expedition = timezone.now()
-        commande.save()
+        ok, error_msg = StockService.changer_statut(
+            commande, 'expediee', date_expedition=timezone.now()
+        )
+        if not ok:
+            return Response({'error': error_msg}, status=status.HTTP_400_BAD_REQUEST)
         
         from apps.notifications.services import NotificationService
         NotificationService.create(
@@ -410,9 +534,11 @@ class CommandeViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def deliver(self, request, pk=None):
         commande = self.get_object()
-        commande.statut = 'livree'
-        commande.date_livraison = timezone.now()
-        commande.save()
+        ok, error_msg = StockService.changer_statut(
+            commande, 'livree', date_livraison=timezone.now()
+        )
+        if not ok:
+            return Response({'error': error_msg}, status=status.HTTP_400_BAD_REQUEST)
         
         from apps.notifications.services import NotificationService
         
@@ -486,6 +612,7 @@ class EvaluationViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         evaluation = serializer.save()
+        RatingService.enregistrer(evaluation)
         
         from apps.notifications.services import NotificationService
         NotificationService.create(
@@ -495,4 +622,36 @@ class EvaluationViewSet(viewsets.ModelViewSet):
             message=f'{evaluation.note}/5 étoiles - {evaluation.commentaire[:50]}',
             content_object=evaluation,
             data={'rating': evaluation.note}
-        )
\ No newline at end of file
+        )
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Verrou : deux modifications concurrentes ne peuvent pas partir de la même ancienne note
+            ancienne_note = Evaluation.objects.select_for_update().values_list(
+                'note', flat=True
+            ).get(pk=serializer.instance.pk)
+            evaluation = serializer.save()
+            RatingService.modifier(evaluation, ancienne_note)
+    
+    def perform_destroy(self, instance):
+        RatingService.supprimer(instance)
+
+
+class RechercheSauvegardeeViewSet(viewsets.ModelViewSet):
+    """Recherches sauvegardées de l'utilisateur (alertes production)"""
+    serializer_class = RechercheSauvegardeeSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return RechercheSauvegardee.objects.filter(user=self.request.user)
+    
+    @LIST_RECHERCHES_SCHEMA
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @CREATE_RECHERCHE_SCHEMA
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_phoneverification_userbadge_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producteur',
+            name='nombre_evaluations',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='producteur',
+            name='note_moyenne',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='producteur',
+            name='total_notes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
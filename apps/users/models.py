@@ -323,6 +323,11 @@ class Producteur(models.Model):
     total_productions = models.IntegerField(default=0)
     last_production_date = models.DateTimeField(null=True, blank=True)
     
+    # Agrégats d'évaluation (toutes productions confondues) : maintenus par RatingService
+    nombre_evaluations = models.PositiveIntegerField(default=0)
+    total_notes = models.PositiveIntegerField(default=0)
+    note_moyenne = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, db_index=True)
+    
     class Meta:
         verbose_name = 'Profil Producteur'
         verbose_name_plural = 'Profils Producteurs'
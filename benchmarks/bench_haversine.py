@@ -0,0 +1,61 @@
+"""
+Micro-benchmark : distance haversine scalaire (math) vs vectorisée (NumPy).
+
+Usage :
+    python benchmarks/bench_haversine.py [--points 100000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.production.geo import haversine_distance, haversine_distances  # noqa: E402
+
+# Emprise approximative du Cameroun
+LAT_MIN, LAT_MAX = 1.6, 13.1
+LON_MIN, LON_MAX = 8.4, 16.2
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(LAT_MIN, LAT_MAX, args.points)
+    lons = rng.uniform(LON_MIN, LON_MAX, args.points)
+    lats_list, lons_list = lats.tolist(), lons.tolist()
+    origin = (3.8667, 11.5167)  # Yaoundé
+
+    scalar = best_of(
+        lambda: [haversine_distance(*origin, la, lo) for la, lo in zip(lats_list, lons_list)],
+        args.repeat,
+    )
+    vector = best_of(lambda: haversine_distances(*origin, lats, lons), args.repeat)
+
+    reference = np.array([haversine_distance(*origin, la, lo) for la, lo in zip(lats_list, lons_list)])
+    max_error = float(np.max(np.abs(reference - haversine_distances(*origin, lats, lons))))
+
+    print(f"Points           : {args.points}")
+    print(f"Scalaire (math)  : {scalar * 1000:9.2f} ms")
+    print(f"Vectorisé (NumPy): {vector * 1000:9.2f} ms")
+    print(f"Accélération     : x{scalar / vector:.1f}")
+    print(f"Écart max        : {max_error:.2e} km")
+
+
+if __name__ == '__main__':
+    main()
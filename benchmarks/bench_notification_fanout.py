@@ -0,0 +1,106 @@
+"""
+Benchmark : diffusion d'une notification à N destinataires.
+
+Compare le chemin unitaire (un INSERT et un group_send bloquant par
+destinataire) à NotificationService.fan_out (un bulk_create puis des
+group_send concurrents par paquets). Les envois différés après commit sont
+exécutés dans la mesure, dans le thread appelant (ASYNC = False). Tout se
+déroule dans une transaction annulée à la fin : la base configurée n'est
+pas modifiée.
+
+Usage :
+    python benchmarks/bench_notification_fanout.py [--recipients 10000]
+        [--layer redis|memory] [--batch-size 500] [--legacy-sample 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'digitagro_api.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import TestCase  # noqa: E402
+from django.test.utils import CaptureQueriesContext, override_settings  # noqa: E402
+
+from apps.notifications.models import Notification  # noqa: E402
+from apps.notifications.services import NotificationService, NotificationType  # noqa: E402
+from apps.users.models import CustomUser  # noqa: E402
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy(recipients):
+    for recipient in recipients:
+        Notification.objects.create(
+            recipient_id=recipient, type=NotificationType.PRODUCTION_ALERT,
+            title='Nouvelle production', message='Maïs disponible - 250 FCFA'
+        )
+
+
+def fan_out(recipients, batch_size):
+    NotificationService.fan_out(
+        recipients, NotificationType.PRODUCTION_ALERT, 'Nouvelle production', 'Maïs disponible - 250 FCFA',
+        batch_size=batch_size
+    )
+
+
+def measure(fn):
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        # Exécute les envois programmés par transaction.on_commit à la sortie
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            fn()
+        duration = time.perf_counter() - start
+    return duration, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipients', type=int, default=10_000)
+    parser.add_argument('--layer', choices=['redis', 'memory'], default='redis')
+    parser.add_argument('--batch-size', type=int, default=500, help='group_send concurrents par paquet')
+    parser.add_argument('--legacy-sample', type=int, default=2_000,
+                        help='Destinataires mesurés sur le chemin unitaire (extrapolé à --recipients)')
+    args = parser.parse_args()
+
+    layers = settings.CHANNEL_LAYERS
+    if args.layer == 'memory':
+        layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+    dispatch = {'BATCH_SIZE': args.batch_size, 'ASYNC': False}
+    with override_settings(CHANNEL_LAYERS=layers, NOTIFICATIONS_DISPATCH=dispatch):
+        try:
+            with transaction.atomic():
+                users = CustomUser.objects.bulk_create([
+                    CustomUser(email=f'bench-fanout-{i}@example.invalid') for i in range(args.recipients)
+                ])
+                recipients = [user.pk for user in users]
+
+                sample = recipients[:min(args.legacy_sample, len(recipients))]
+                legacy_duration, legacy_queries = measure(lambda: legacy(sample))
+                fan_out_duration, fan_out_queries = measure(lambda: fan_out(recipients, args.batch_size))
+                raise Rollback
+        except Rollback:
+            pass
+
+    legacy_total = legacy_duration * len(recipients) / len(sample)
+    print(f"Destinataires      : {len(recipients)} (channel layer {args.layer}, paquets de {args.batch_size})")
+    print(
+        f"Unitaire           : {legacy_total:9.2f} s extrapolées "
+        f"({len(sample)} mesurés en {legacy_duration:.2f} s, {legacy_queries} requêtes SQL)"
+    )
+    print(f"fan_out            : {fan_out_duration:9.2f} s ({fan_out_queries} requêtes SQL)")
+    print(f"Accélération       : x{legacy_total / fan_out_duration:.1f}")
+
+
+if __name__ == '__main__':
+    main()
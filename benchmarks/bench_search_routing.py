@@ -0,0 +1,171 @@
+"""
+Benchmark : recherche filtrée par type_production, avec et sans routage de shard.
+
+Deux index de même topologie reçoivent les mêmes documents synthétiques :
+l'un routé par type_production (PRODUCTION_SEARCH_INDEX['ROUTING_FIELD']),
+l'autre routé par _id. La même série de requêtes filtrées est ensuite
+envoyée aux deux, avec `routing` pour le premier seulement.
+
+Usage :
+    python benchmarks/bench_search_routing.py [--host http://localhost:9200]
+        [--docs 2000000] [--shards 6] [--queries 500] [--skip-seed] [--keep]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk
+
+INDEX_ROUTE = 'bench-productions-routage'
+INDEX_DEFAUT = 'bench-productions-defaut'
+
+TYPES = ['fruits', 'legumes', 'cereales', 'tubercules', 'elevage', 'produits_transformes']
+PRODUITS = {
+    'fruits': ['mangue', 'ananas', 'papaye', 'banane douce', 'avocat'],
+    'legumes': ['tomate', 'piment', 'gombo', 'oignon', 'carotte'],
+    'cereales': ['maïs', 'riz', 'sorgho', 'mil'],
+    'tubercules': ['manioc', 'igname', 'macabo', 'patate douce'],
+    'elevage': ['poulet', 'chèvre', 'porc', 'oeufs'],
+    'produits_transformes': ["huile de palme", "pâte d'arachide", 'farine de manioc', 'jus de gingembre'],
+}
+
+# Emprise approximative du Cameroun
+LAT_MIN, LAT_MAX = 1.6, 13.1
+LON_MIN, LON_MAX = 8.4, 16.2
+
+MAPPING = {
+    'properties': {
+        'id': {'type': 'long'},
+        'produit': {'type': 'text'},
+        'type_production': {'type': 'text', 'fields': {'raw': {'type': 'keyword'}}},
+        'prix_unitaire': {'type': 'float'},
+        'disponible': {'type': 'boolean'},
+        'localisation': {'type': 'geo_point'},
+        'date_creation': {'type': 'date'},
+    }
+}
+
+
+def documents(nombre, seed=42):
+    rng = random.Random(seed)
+    for pk in range(1, nombre + 1):
+        type_production = rng.choice(TYPES)
+        yield pk, type_production, {
+            'id': pk,
+            'produit': rng.choice(PRODUITS[type_production]),
+            'type_production': type_production,
+            'prix_unitaire': round(rng.uniform(100, 5000), 2),
+            'disponible': rng.random() < 0.8,
+            'localisation': {'lat': rng.uniform(LAT_MIN, LAT_MAX), 'lon': rng.uniform(LON_MIN, LON_MAX)},
+            'date_creation': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        }
+
+
+def creer(client, index, shards):
+    client.options(ignore_status=404).indices.delete(index=index)
+    client.indices.create(
+        index=index, mappings=MAPPING,
+        settings={'number_of_shards': shards, 'number_of_replicas': 0, 'refresh_interval': '-1'},
+    )
+
+
+def charger(client, nombre, workers):
+    def actions():
+        for pk, type_production, source in documents(nombre):
+            yield {'_index': INDEX_ROUTE, '_id': pk, '_routing': type_production, '_source': source}
+            yield {'_index': INDEX_DEFAUT, '_id': pk, '_source': source}
+
+    debut = time.perf_counter()
+    erreurs = 0
+    for ok, _ in parallel_bulk(client, actions(), thread_count=workers, chunk_size=2000, raise_on_error=False):
+        erreurs += not ok
+    for index in (INDEX_ROUTE, INDEX_DEFAUT):
+        client.indices.put_settings(index=index, settings={'index': {'refresh_interval': '1s'}})
+        client.indices.refresh(index=index)
+        client.indices.forcemerge(index=index, max_num_segments=1)
+    return time.perf_counter() - debut, erreurs
+
+
+def requetes(nombre, seed=7):
+    rng = random.Random(seed)
+    for _ in range(nombre):
+        type_production = rng.choice(TYPES)
+        yield type_production, {
+            'bool': {
+                'must': [{'match': {'produit': rng.choice(PRODUITS[type_production])}}],
+                'filter': [
+                    {'term': {'type_production.raw': type_production}},
+                    {'term': {'disponible': True}},
+                    {'range': {'prix_unitaire': {'lte': rng.uniform(500, 5000)}}},
+                ],
+            }
+        }
+
+
+def mesurer(client, index, nombre, avec_routage):
+    took, mur, shards = [], [], 0
+    for type_production, query in requetes(nombre):
+        debut = time.perf_counter()
+        reponse = client.search(
+            index=index, query=query, size=20, sort=[{'date_creation': 'desc'}],
+            routing=type_production if avec_routage else None, request_cache=False,
+        )
+        mur.append((time.perf_counter() - debut) * 1000)
+        took.append(reponse['took'])
+        shards = reponse['_shards']['total']
+    return took, mur, shards
+
+
+def percentile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default=os.environ.get('ELASTICSEARCH_DSL_HOSTS', 'http://localhost:9200'))
+    parser.add_argument('--docs', type=int, default=2_000_000)
+    parser.add_argument('--shards', type=int, default=6)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--skip-seed', action='store_true', help='Réutiliser les index déjà chargés')
+    parser.add_argument('--keep', action='store_true', help='Conserver les index après la mesure')
+    args = parser.parse_args()
+
+    client = Elasticsearch(args.host, request_timeout=120)
+
+    if not args.skip_seed:
+        for index in (INDEX_ROUTE, INDEX_DEFAUT):
+            creer(client, index, args.shards)
+        duree, erreurs = charger(client, args.docs, args.workers)
+        print(f"Chargement       : {args.docs} documents x 2 index en {duree:.0f}s ({erreurs} erreurs)")
+
+    # Échauffement des caches de fichiers des deux index
+    mesurer(client, INDEX_ROUTE, min(50, args.queries), True)
+    mesurer(client, INDEX_DEFAUT, min(50, args.queries), False)
+
+    resultats = {
+        'Sans routage': mesurer(client, INDEX_DEFAUT, args.queries, False),
+        'Avec routage': mesurer(client, INDEX_ROUTE, args.queries, True),
+    }
+
+    print(f"Shards           : {args.shards}, requêtes : {args.queries}")
+    for nom, (took, mur, shards) in resultats.items():
+        print(
+            f"{nom:<17}: {shards} shard(s) interrogé(s), took p50 {statistics.median(took):.1f} ms, "
+            f"p95 {percentile(took, 0.95):.1f} ms, client p50 {statistics.median(mur):.1f} ms, "
+            f"p95 {percentile(mur, 0.95):.1f} ms"
+        )
+
+    sans, avec = statistics.median(resultats['Sans routage'][1]), statistics.median(resultats['Avec routage'][1])
+    print(f"Accélération p50 : x{sans / avec:.2f}")
+
+    if not args.keep:
+        client.options(ignore_status=404).indices.delete(index=f'{INDEX_ROUTE},{INDEX_DEFAUT}')
+
+
+if __name__ == '__main__':
+    main()
@@ -53,6 +53,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_elasticsearch_dsl',
 
 ]
@@ -86,6 +87,17 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Envoi WebSocket des notifications (apps/notifications/dispatch.py)
+NOTIFICATIONS_DISPATCH = {
+    'BATCH_SIZE': env.int('NOTIFICATIONS_DISPATCH_BATCH_SIZE', default=500),  # group_send concurrents par paquet
+    'ASYNC': env.bool('NOTIFICATIONS_DISPATCH_ASYNC', default=True),  # False : envoi dans le thread appelant
+}
+
+# Reconnexion WebSocket : au-delà de MAX_DELTA notifications manquées, résumé au lieu de la liste
+NOTIFICATIONS_RESYNC = {
+    'MAX_DELTA': env.int('NOTIFICATIONS_RESYNC_MAX_DELTA', default=50),
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -96,6 +108,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.notifications.middleware.NotificationDispatchMiddleware',
 ]
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -175,6 +188,73 @@ ELASTICSEARCH_DSL = {
                      default='http://localhost:9200' if DEBUG else 'http://185.217.125.37:9200')
     }
 }
+
+# Topologie de l'index des productions (appliquée à la création : reindex_productions pour la changer)
+PRODUCTION_SEARCH_INDEX = {
+    'SHARDS': env.int('SEARCH_INDEX_SHARDS', default=1),
+    'REPLICAS': env.int('SEARCH_INDEX_REPLICAS', default=0),
+    'REFRESH_INTERVAL': env('SEARCH_INDEX_REFRESH_INTERVAL', default='1s'),
+    # Champ de Production servant de clé de routage (ex. 'type_production') : un filtre
+    # sur ce champ n'interroge qu'un shard. None : routage par _id, sur tous les shards.
+    'ROUTING_FIELD': env('SEARCH_INDEX_ROUTING_FIELD', default=None),
+}
+
+# Synchronisation Elasticsearch via la file IndexationEnAttente (worker process_search_outbox)
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'apps.production.signals.OutboxSignalProcessor'
+SEARCH_SYNC = {
+    'DEBOUNCE': env.int('SEARCH_SYNC_DEBOUNCE', default=2),  # secondes sans écriture avant envoi
+    'MAX_DELAY': env.int('SEARCH_SYNC_MAX_DELAY', default=30),  # attente maximale d'une entrée
+    'BATCH_SIZE': env.int('SEARCH_SYNC_BATCH_SIZE', default=500),
+    'MAX_ATTEMPTS': env.int('SEARCH_SYNC_MAX_ATTEMPTS', default=10),
+    'POLL_INTERVAL': env.float('SEARCH_SYNC_POLL_INTERVAL', default=1.0),
+}
+
+# Disjoncteur Elasticsearch : bascule de /api/productions/search/ sur PostgreSQL
+SEARCH_CIRCUIT_BREAKER = {
+    'REQUEST_TIMEOUT': env.float('SEARCH_REQUEST_TIMEOUT', default=2.0),  # secondes par requête de recherche
+    'LATENCY_THRESHOLD_MS': env.int('SEARCH_LATENCY_THRESHOLD_MS', default=800),  # au-delà : incident
+    'ERROR_THRESHOLD': env.int('SEARCH_ERROR_THRESHOLD', default=5),  # incidents consécutifs avant ouverture
+    'RESET_TIMEOUT': env.int('SEARCH_RESET_TIMEOUT', default=30),  # secondes avant l'appel d'essai
+}
+
+# Classement ?ranking=true de /api/productions/search/ (function_score)
+PRODUCTION_SEARCH_RANKING = {
+    'DISTANCE': {
+        'WEIGHT': env.float('SEARCH_RANKING_DISTANCE_WEIGHT', default=3.0),
+        'SCALE': '10km', 'OFFSET': '1km', 'DECAY': 0.5,
+    },
+    'FRAICHEUR': {
+        'WEIGHT': env.float('SEARCH_RANKING_FRAICHEUR_WEIGHT', default=2.0),
+        'SCALE': '14d', 'OFFSET': '2d', 'DECAY': 0.5,
+    },
+    'NOTE': {'WEIGHT': env.float('SEARCH_RANKING_NOTE_WEIGHT', default=1.5)},
+    'CERTIFICATION': {
+        'WEIGHT': env.float('SEARCH_RANKING_CERTIFICATION_WEIGHT', default=1.0),
+        'VALEURS': ['bio', 'agroecologique'],
+    },
+    'SCORE_MODE': 'sum',  # combinaison des fonctions
+    'BOOST_MODE': 'multiply',  # combinaison avec le score texte
+}
+
+# Autocomplétion de /api/productions/search/suggest/
+PRODUCTION_SUGGEST = {
+    'SIZE': env.int('PRODUCTION_SUGGEST_SIZE', default=8),
+    'CACHE_TTL': env.int('PRODUCTION_SUGGEST_CACHE_TTL', default=60),  # secondes
+}
+
+# Clusters cartographiques de /api/productions/clusters/
+PRODUCTION_CLUSTERS = {
+    'PRECISION_OFFSET': 3,  # précision geotile_grid = niveau de tuile + 3 (~64 cellules par tuile)
+    'MAX_TILES': 64,  # au-delà, tuiles de cache du niveau inférieur
+    'CACHE_TTL': env.int('PRODUCTION_CLUSTERS_CACHE_TTL', default=60),  # secondes
+}
+
+# Index spatial en mémoire des productions disponibles (endpoint nearby)
+PRODUCTION_SPATIAL_INDEX = {
+    'CELL_SIZE': env.float('SPATIAL_INDEX_CELL_SIZE', default=0.1),  # degrés (~11 km)
+    'TTL': env.int('SPATIAL_INDEX_TTL', default=300),  # secondes avant rechargement complet
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.CustomUser'
 